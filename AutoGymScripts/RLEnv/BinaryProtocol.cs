@@ -0,0 +1,93 @@
+using System;
+using System.IO;
+using System.Text;
+using System.Collections.Generic;
+using Newtonsoft.Json;
+using Newtonsoft.Json.Linq;
+
+namespace UnityRLEnv
+{
+    /* Encodes state messages for the binary protocol (see unity_protocol.py for the layout) */
+    public static class BinaryProtocol
+    {
+        public const string Name = "binary";
+        public const int InfoKeyLength = 32;
+        private const byte FlagDone = 0x1;
+        private static readonly byte[] Magic = Encoding.ASCII.GetBytes("AGB1");
+
+        public static byte[] EncodeState(IList<float> obs, string imageObs, JObject info, float reward, bool done, ISet<int> invalidActions, int numActions)
+        {
+            List<KeyValuePair<byte[], long>> numericInfo = new List<KeyValuePair<byte[], long>>();
+            JObject extraInfo = new JObject();
+            if (info != null)
+            {
+                foreach (JProperty prop in info.Properties())
+                {
+                    byte[] key = Encoding.UTF8.GetBytes(prop.Name);
+                    if (prop.Value.Type == JTokenType.Integer && key.Length <= InfoKeyLength)
+                    {
+                        numericInfo.Add(new KeyValuePair<byte[], long>(key, prop.Value.ToObject<long>()));
+                    }
+                    else
+                    {
+                        extraInfo[prop.Name] = prop.Value;
+                    }
+                }
+            }
+
+            JObject extra = new JObject();
+            if (imageObs != null)
+            {
+                extra["observation"] = new JObject { ["img"] = imageObs };
+            }
+            if (extraInfo.Count > 0)
+            {
+                extra["info"] = extraInfo;
+            }
+            byte[] extraBytes = extra.Count > 0 ? Encoding.UTF8.GetBytes(extra.ToString(Formatting.None)) : new byte[0];
+
+            int obsCount = done || obs == null ? 0 : obs.Count;
+            int maskCount = done ? 0 : numActions;
+            if (done)
+            {
+                numericInfo.Clear();
+                extraBytes = new byte[0];
+            }
+
+            using (MemoryStream ms = new MemoryStream())
+            using (BinaryWriter w = new BinaryWriter(ms))
+            {
+                w.Write(Magic);
+                w.Write(done ? FlagDone : (byte)0);
+                w.Write((byte)0);
+                w.Write((byte)0);
+                w.Write((byte)0);
+                w.Write(reward);
+                w.Write(obsCount);
+                w.Write(maskCount);
+                w.Write(numericInfo.Count);
+                w.Write(extraBytes.Length);
+                for (int i = 0; i < obsCount; ++i)
+                {
+                    w.Write(obs[i]);
+                }
+                for (int action = 0; action < maskCount; ++action)
+                {
+                    w.Write(invalidActions.Contains(action) ? (byte)0 : (byte)1);
+                }
+                foreach (KeyValuePair<byte[], long> field in numericInfo)
+                {
+                    w.Write(field.Key);
+                    for (int i = field.Key.Length; i < InfoKeyLength; ++i)
+                    {
+                        w.Write((byte)0);
+                    }
+                    w.Write(field.Value);
+                }
+                w.Write(extraBytes);
+                w.Flush();
+                return ms.ToArray();
+            }
+        }
+    }
+}
@@ -406,8 +406,10 @@ namespace UnityRLEnv
                 { "observation_includes_image", true },
                 { "observation_stack", 4 },
                 { "image_resize_to", new List<int> { 84, 84 } },
+                { "image_transport", "mmap" },
                 { "include_state_info", true },
                 { "pre_init", false },
+                { "protocol", "binary" },
                 { "symex_actions", true },
                 { "symex_database_path", dbPath },
                 { "input_manager_settings_path", inputManagerAssetPath },
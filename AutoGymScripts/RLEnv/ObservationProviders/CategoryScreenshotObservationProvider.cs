@@ -15,6 +15,7 @@ namespace UnityRLEnv
         private RenderTexture targetTexture;
         private Texture2D screenshotTexture;
         private string categoryShaderName;
+        private FrameBufferWriter frameBuffer;
 
         public CategoryScreenshotObservationProvider(string categoryShaderName)
         {
@@ -66,8 +67,17 @@ namespace UnityRLEnv
                 Directory.CreateDirectory(screenshotDir);
             }
 
-            targetTexture = new RenderTexture(Screen.width, Screen.height, 16, RenderTextureFormat.ARGB32);
-            screenshotTexture = new Texture2D(Screen.width, Screen.height, TextureFormat.ARGB32, false);
+            // Initialize runs again on every soft reset; the textures and the writer are kept, so that its sequence
+            // numbers keep increasing
+            if (targetTexture == null)
+            {
+                targetTexture = new RenderTexture(Screen.width, Screen.height, 16, RenderTextureFormat.ARGB32);
+                screenshotTexture = new Texture2D(Screen.width, Screen.height, TextureFormat.ARGB32, false);
+            }
+            if (FrameBufferWriter.IsEnabled(config) && frameBuffer == null)
+            {
+                frameBuffer = new FrameBufferWriter(Path.Combine(screenshotDir, "frames.mmap"));
+            }
          
             AssignCategoryTags();
             SetReplacementShader();
@@ -91,6 +101,12 @@ namespace UnityRLEnv
 
             camera.targetTexture = cameraRT;
 
+            if (frameBuffer != null)
+            {
+                frameBuffer.Write(screenshotTexture);
+                return frameBuffer.Path;
+            }
+
             using (FileStream fs = File.Open(screenshotPath, FileMode.Create))
             {
                 byte[] data = screenshotTexture.EncodeToPNG();
@@ -0,0 +1,89 @@
+using System;
+using System.IO;
+using System.IO.MemoryMappedFiles;
+using System.Text;
+using Newtonsoft.Json.Linq;
+using UnityEngine;
+
+namespace UnityRLEnv
+{
+    /* Writes raw RGBA frames into a memory-mapped file read by unity_framebuffer.py.
+       Header layout (little-endian, 64 bytes): magic "AGFB", version (u4), sequence number (u8),
+       width (u4), height (u4), channels (u4), flags (u4, bit 0 = rows stored bottom-up), data offset (u4) */
+    public class FrameBufferWriter : IDisposable
+    {
+        public const string TransportName = "mmap";
+        public const int HeaderSize = 64;
+        private const int Version = 1;
+        private const int Channels = 4;
+        private const int FlagBottomUp = 0x1;
+        private static readonly byte[] Magic = Encoding.ASCII.GetBytes("AGFB");
+
+        private string path;
+        private MemoryMappedFile mappedFile;
+        private MemoryMappedViewAccessor accessor;
+        private long capacity;
+        private long sequenceNumber;
+
+        public FrameBufferWriter(string path)
+        {
+            this.path = path;
+            sequenceNumber = 0;
+        }
+
+        public string Path
+        {
+            get { return path; }
+        }
+
+        public static bool IsEnabled(JObject config)
+        {
+            return config.ContainsKey("image_transport") && config["image_transport"].ToObject<string>() == TransportName;
+        }
+
+        private void EnsureCapacity(long size)
+        {
+            if (accessor != null && capacity >= size)
+            {
+                return;
+            }
+            Dispose();
+            FileStream fs = new FileStream(path, FileMode.Create, FileAccess.ReadWrite, FileShare.ReadWrite);
+            mappedFile = MemoryMappedFile.CreateFromFile(fs, null, size, MemoryMappedFileAccess.ReadWrite,
+                                                         HandleInheritability.None, false);
+            accessor = mappedFile.CreateViewAccessor(0, size, MemoryMappedFileAccess.ReadWrite);
+            capacity = size;
+        }
+
+        public long Write(Texture2D texture)
+        {
+            Color32[] pixels = texture.GetPixels32();
+            EnsureCapacity(HeaderSize + (long)pixels.Length * Channels);
+            accessor.WriteArray(HeaderSize, pixels, 0, pixels.Length);
+            ++sequenceNumber;
+            accessor.WriteArray(0, Magic, 0, Magic.Length);
+            accessor.Write(4, Version);
+            accessor.Write(16, texture.width);
+            accessor.Write(20, texture.height);
+            accessor.Write(24, Channels);
+            accessor.Write(28, FlagBottomUp);
+            accessor.Write(32, HeaderSize);
+            accessor.Write(8, sequenceNumber);
+            return sequenceNumber;
+        }
+
+        public void Dispose()
+        {
+            if (accessor != null)
+            {
+                accessor.Dispose();
+                accessor = null;
+            }
+            if (mappedFile != null)
+            {
+                mappedFile.Dispose();
+                mappedFile = null;
+            }
+        }
+    }
+}
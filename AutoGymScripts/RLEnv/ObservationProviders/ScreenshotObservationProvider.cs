@@ -12,6 +12,7 @@ namespace UnityRLEnv
     public class ScreenshotObservationProvider : IObservationProvider
     {
         private string screenshotDir;
+        private FrameBufferWriter frameBuffer;
 
         public IEnumerator Initialize(string envId, string workDir, JObject config, MonoBehaviour context)
         {
@@ -20,11 +21,23 @@ namespace UnityRLEnv
             {
                 Directory.CreateDirectory(screenshotDir);
             }
+            // Initialize runs again on every soft reset; the writer is kept, so that its sequence numbers keep increasing
+            if (FrameBufferWriter.IsEnabled(config) && frameBuffer == null)
+            {
+                frameBuffer = new FrameBufferWriter(Path.Combine(screenshotDir, "frames.mmap"));
+            }
             yield break;
         }
 
         public string CollectImageObservation()
         {
+            if (frameBuffer != null)
+            {
+                Texture2D frame = ScreenCapture.CaptureScreenshotAsTexture();
+                frameBuffer.Write(frame);
+                UnityEngine.Object.Destroy(frame);
+                return frameBuffer.Path;
+            }
             string screenshotPath = Path.Combine(screenshotDir, Time.time + ".png");
             Texture2D screenshot = ScreenCapture.CaptureScreenshotAsTexture();
             using (FileStream fs = File.Open(screenshotPath, FileMode.Create))
@@ -7,6 +7,7 @@ using System.Net;
 using System.Net.Sockets;
 using System.Collections;
 using System.Collections.Generic;
+using UnityEngine.SceneManagement;
 using Newtonsoft.Json;
 using Newtonsoft.Json.Linq;
 using UnityActionAnalysis;
@@ -40,6 +41,8 @@ namespace UnityRLEnv
         private Socket listenerSocket;
         private Socket clientSocket;
         private bool isReady;
+        private bool binaryProtocol;
+        private int initialSceneIndex;
 
         public RLEnv()
         {
@@ -59,6 +62,7 @@ namespace UnityRLEnv
             }
 
             DontDestroyOnLoad(this);
+            initialSceneIndex = SceneManager.GetActiveScene().buildIndex;
 
             if (!DebugMode)
             {
@@ -68,6 +72,8 @@ namespace UnityRLEnv
                 string rlEnvConfig = Environment.GetEnvironmentVariable("RLENV_CONFIG");
                 string rlEnvWorkDir = Environment.GetEnvironmentVariable("RLENV_WORKDIR");
                 string rlEnvTrainingMode = Environment.GetEnvironmentVariable("RLENV_TRAINING_MODE");
+                string rlEnvProtocol = Environment.GetEnvironmentVariable("RLENV_PROTOCOL");
+                string rlEnvSocket = Environment.GetEnvironmentVariable("RLENV_SOCKET");
                 if (rlEnvId == null)
                 {
                     throw new Exception("Missing RLENV_ID");
@@ -76,7 +82,7 @@ namespace UnityRLEnv
                 {
                     throw new Exception("Missing RLENV_ADDR");
                 }
-                if (rlEnvPort == null)
+                if (rlEnvPort == null && rlEnvSocket == null)
                 {
                     throw new Exception("Missing RLENV_PORT");
                 }
@@ -93,7 +99,7 @@ namespace UnityRLEnv
                     throw new Exception("Missing RLENV_TRAINING_MODE");
                 }
 
-                if (!int.TryParse(rlEnvPort, out listenPort))
+                if (rlEnvSocket == null && !int.TryParse(rlEnvPort, out listenPort))
                 {
                     throw new Exception("Invalid RLENV_PORT");
                 }
@@ -101,6 +107,7 @@ namespace UnityRLEnv
                 envId = rlEnvId;
                 workDir = rlEnvWorkDir;
                 trainingMode = bool.Parse(rlEnvTrainingMode);
+                binaryProtocol = rlEnvProtocol == BinaryProtocol.Name;
 
                 using (StreamReader sr = File.OpenText(rlEnvConfig))
                 {
@@ -111,11 +118,25 @@ namespace UnityRLEnv
                     inputSim = new InputSimulator(inputManagerSettings, this);
                 }
 
-                IPAddress ipAddress = IPAddress.Parse(rlEnvAddr);
-                IPEndPoint localEndPoint = new IPEndPoint(ipAddress, listenPort);
-                listenerSocket = new Socket(ipAddress.AddressFamily, SocketType.Stream, ProtocolType.Tcp);
-                listenerSocket.Blocking = true;
-                listenerSocket.Bind(localEndPoint);
+                if (rlEnvSocket != null)
+                {
+                    // Unix domain socket transport: the trainer picked a socket path in this instance's work directory
+                    if (File.Exists(rlEnvSocket))
+                    {
+                        File.Delete(rlEnvSocket);
+                    }
+                    listenerSocket = new Socket(AddressFamily.Unix, SocketType.Stream, ProtocolType.Unspecified);
+                    listenerSocket.Blocking = true;
+                    listenerSocket.Bind(new UnixDomainSocketEndPoint(rlEnvSocket));
+                }
+                else
+                {
+                    IPAddress ipAddress = IPAddress.Parse(rlEnvAddr);
+                    IPEndPoint localEndPoint = new IPEndPoint(ipAddress, listenPort);
+                    listenerSocket = new Socket(ipAddress.AddressFamily, SocketType.Stream, ProtocolType.Tcp);
+                    listenerSocket.Blocking = true;
+                    listenerSocket.Bind(localEndPoint);
+                }
                 listenerSocket.Listen(10);
                 clientSocket = listenerSocket.Accept();
 
@@ -194,9 +215,7 @@ namespace UnityRLEnv
             if (observationProvider == null) { throw new Exception("Observation provider not set during initialization"); }
             if (actionProvider == null) { throw new Exception("Action provider not set during initialization"); }
             if (rewardProvider == null) { throw new Exception("Reward provider not set during initialization"); }
-            yield return StartCoroutine(observationProvider.Initialize(envId, workDir, envConfig, this));
-            yield return StartCoroutine(actionProvider.Initialize(envId, workDir, envConfig, this));
-            yield return StartCoroutine(rewardProvider.Initialize(envId, workDir, envConfig, this));
+            yield return StartCoroutine(InitializeEpisodeProviders());
             foreach (IInfoProvider infoProvider in infoProviders)
             {
                 yield return StartCoroutine(infoProvider.Initialize(envId, workDir, envConfig, this));
@@ -207,6 +226,36 @@ namespace UnityRLEnv
             isReady = true;
         }
 
+        private IEnumerator InitializeEpisodeProviders()
+        {
+            yield return StartCoroutine(observationProvider.Initialize(envId, workDir, envConfig, this));
+            yield return StartCoroutine(actionProvider.Initialize(envId, workDir, envConfig, this));
+            yield return StartCoroutine(rewardProvider.Initialize(envId, workDir, envConfig, this));
+        }
+
+        // Soft reset requested by the trainer: reloads the initial scene in the running process and re-initializes
+        // the per-episode providers. Info providers and failure detectors keep their state across episodes, as
+        // they would in a process that is never restarted.
+        private IEnumerator DoResetEnv()
+        {
+            isReady = false;
+            DeterminizeEnvironment();
+            yield return StartCoroutine(ReloadInitialScene());
+            yield return StartCoroutine(InitializeEpisodeProviders());
+            yield return StartCoroutine(EnterInitialState());
+            isReady = true;
+        }
+
+        protected virtual IEnumerator ReloadInitialScene()
+        {
+            AsyncOperation load = SceneManager.LoadSceneAsync(initialSceneIndex, LoadSceneMode.Single);
+            while (!load.isDone)
+            {
+                yield return null;
+            }
+            yield return null;
+        }
+
         private IEnumerator DebugEnvLoop()
         {
             yield return StartCoroutine(DoInitEnv());
@@ -299,22 +348,14 @@ namespace UnityRLEnv
 
             yield return new WaitForEndOfFrame();
 
-            object obs = CollectObservations();
-            JObject info = CollectInfo();
-            DateTime timerStart = DateTime.Now;
-            ISet<int> invalidActions = GetInvalidActions();
-            DateTime timerEnd = DateTime.Now;
-            TimeSpan timeValidActions = timerEnd - timerStart;
-            info["time_valid_actions"] = (int)Math.Round(timeValidActions.TotalMilliseconds);
+            SendInitMessage();
 
-            SendMessage(new
-            {
-                ready = true,
-                observation = obs,
-                info = info,
-                numActions = actionProvider.GetActionCount(),
-                invalidActions = invalidActions
-            });
+            object obs;
+            JObject info;
+            DateTime timerStart;
+            DateTime timerEnd;
+            ISet<int> invalidActions;
+            TimeSpan timeValidActions;
 
             byte[] msgLenBuf = new byte[4];
             byte[] msgBuf = new byte[1024];
@@ -341,7 +382,13 @@ namespace UnityRLEnv
 
                 string strMsg = Encoding.UTF8.GetString(msgBuf, 0, msgLen);
                 JObject msg = JObject.Parse(strMsg);
-                if (!msg.ContainsKey("wait"))
+                if (msg.ContainsKey("reset"))
+                {
+                    yield return StartCoroutine(DoResetEnv());
+                    yield return new WaitForEndOfFrame();
+                    SendInitMessage();
+                }
+                else if (!msg.ContainsKey("wait"))
                 {
                     int actionId = msg["action"].ToObject<int>();
                     timerStart = DateTime.Now;
@@ -362,12 +409,19 @@ namespace UnityRLEnv
 
                     if (done)
                     {
-                        SendMessage(new
+                        if (binaryProtocol)
                         {
-                            reward = reward,
-                            done = true
-                        });
-                        break;
+                            SendFrame(BinaryProtocol.EncodeState(null, null, null, reward, true, null, 0));
+                        }
+                        else
+                        {
+                            SendMessage(new
+                            {
+                                reward = reward,
+                                done = true
+                            });
+                        }
+                        // keep serving the connection: the trainer either closes the game or requests a soft reset
                     }
                     else
                     {
@@ -375,21 +429,39 @@ namespace UnityRLEnv
                         invalidActions = GetInvalidActions();
                         timerEnd = DateTime.Now;
                         timeValidActions = timerEnd - timerStart;
-                        obs = CollectObservations();
+                        IList<float> vecObs = null;
+                        string imageObs = null;
+                        if (binaryProtocol)
+                        {
+                            vecObs = observationProvider.CollectObservations();
+                            imageObs = observationProvider.CollectImageObservation();
+                        }
+                        else
+                        {
+                            obs = CollectObservations();
+                        }
                         info = CollectInfo();
                         info["time_valid_actions"] = (int)Math.Round(timeValidActions.TotalMilliseconds);
                         if (didPerform)
                         {
                             info["time_perform_action"] = (int)Math.Round(timePerformAction.TotalMilliseconds);
                         }
-                        SendMessage(new
+                        if (binaryProtocol)
                         {
-                            observation = obs,
-                            info = info,
-                            reward = reward,
-                            done = false,
-                            invalidActions = invalidActions
-                        });
+                            SendFrame(BinaryProtocol.EncodeState(vecObs, imageObs, info, reward, false,
+                                                                 invalidActions, actionProvider.GetActionCount()));
+                        }
+                        else
+                        {
+                            SendMessage(new
+                            {
+                                observation = obs,
+                                info = info,
+                                reward = reward,
+                                done = false,
+                                invalidActions = invalidActions
+                            });
+                        }
                     }
                 }
             }
@@ -397,10 +469,36 @@ namespace UnityRLEnv
             yield break;
         }
 
+        private void SendInitMessage()
+        {
+            object obs = CollectObservations();
+            JObject info = CollectInfo();
+            DateTime timerStart = DateTime.Now;
+            ISet<int> invalidActions = GetInvalidActions();
+            DateTime timerEnd = DateTime.Now;
+            TimeSpan timeValidActions = timerEnd - timerStart;
+            info["time_valid_actions"] = (int)Math.Round(timeValidActions.TotalMilliseconds);
+
+            SendMessage(new
+            {
+                ready = true,
+                observation = obs,
+                info = info,
+                numActions = actionProvider.GetActionCount(),
+                invalidActions = invalidActions,
+                protocol = binaryProtocol ? BinaryProtocol.Name : "json",
+                softReset = true
+            });
+        }
+
         private void SendMessage(object msg)
         {
             string s = JsonConvert.SerializeObject(msg);
-            byte[] b = Encoding.UTF8.GetBytes(s);
+            SendFrame(Encoding.UTF8.GetBytes(s));
+        }
+
+        private void SendFrame(byte[] b)
+        {
             byte[] l = BitConverter.GetBytes(b.Length);
             int count = clientSocket.Send(l);
             if (count != l.Length)
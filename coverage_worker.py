@@ -0,0 +1,176 @@
+import glob
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import uuid
+import numpy as np
+
+
+class CoverageWorkerException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+def iter_seqpts(cov):
+    for modname, files in cov.items():
+        for filename, classes in files.items():
+            for classname, methods in classes.items():
+                for mname, minfo in methods.items():
+                    for seqpt in minfo['SeqPnts']:
+                        yield seqpt
+
+
+class CoverageIndex:
+    # Flat view of the sequence points in the SeqPnts arrays of coverage.json: their ids in document order, and a
+    # bitset of the ones covered so far. The visit counts of an updated coverage.json are read into an array in the
+    # same order, so that newly covered sequence points are found with array operations instead of per-point lookups.
+
+    def __init__(self, coverage_json_path):
+        seqpts = self._read_seqpts(coverage_json_path)
+        self.seqpt_ids = np.fromiter((seqpt['Id'] for seqpt in seqpts), dtype=np.int64, count=len(seqpts))
+        self.covered = np.zeros(len(seqpts), dtype=np.bool_)
+        self._lock = threading.Lock()
+
+    def _read_seqpts(self, coverage_json_path):
+        with open(coverage_json_path, 'r') as f:
+            return list(iter_seqpts(json.load(f)))
+
+    def read_visit_counts(self, coverage_json_path):
+        seqpts = self._read_seqpts(coverage_json_path)
+        if len(seqpts) != len(self.seqpt_ids) or \
+                not np.array_equal(np.fromiter((seqpt['Id'] for seqpt in seqpts), dtype=np.int64, count=len(seqpts)),
+                                   self.seqpt_ids):
+            raise CoverageWorkerException('sequence points in {} do not match the coverage index'
+                                          .format(coverage_json_path))
+        return np.fromiter((seqpt['VC'] for seqpt in seqpts), dtype=np.int64, count=len(seqpts))
+
+    def update(self, visit_counts):
+        # marks the sequence points with visits as covered and returns the ids of the ones that were not before
+        with self._lock:
+            new = (visit_counts > 0) & ~self.covered
+            self.covered |= new
+            return self.seqpt_ids[new]
+
+    def get_num_covered(self):
+        with self._lock:
+            return int(np.count_nonzero(self.covered))
+
+
+class CoverageWorkerPool:
+    # Collects code coverage from the ACV files produced by the game instances on background threads.
+    # submit() only moves the ACV files into a staging directory and queues them; every worker takes all the
+    # batches queued at that point (up to max_batch_files files) and merges them into its own persistent copy of
+    # coverage.json with a single 'altcover runner --collect' run. Sequence points that became covered are passed
+    # to on_covered(seqpt_ids, step_num), attributed to the latest step in the batch. At most max_backlog batches
+    # are queued; submit() blocks beyond that, and close() waits until the backlog has been processed.
+
+    def __init__(self, coverage_json_path, managed_dir, altcover_cmd, workdir, on_covered,
+                 num_workers=1, max_backlog=64, max_batch_files=256):
+        self._coverage_json_path = coverage_json_path
+        self._managed_dir = managed_dir
+        self._altcover_cmd = altcover_cmd
+        self._workdir = workdir
+        self._on_covered = on_covered
+        self._max_batch_files = max_batch_files
+        self._staging_dir = os.path.join(workdir, 'staging')
+        os.makedirs(self._staging_dir)
+        self._queue = queue.Queue(maxsize=max_backlog)
+        self._index = CoverageIndex(coverage_json_path)
+        self._error = None
+        self._closed = False
+        self._workers = []
+        for i in range(num_workers):
+            worker_dir = os.path.join(workdir, 'worker_{}'.format(i))
+            os.makedirs(worker_dir)
+            worker = threading.Thread(target=self._run, args=(worker_dir,), name='CoverageWorker', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _check_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            if isinstance(error, CoverageWorkerException):
+                raise error
+            raise CoverageWorkerException('failed to process code coverage data: {}'.format(error))
+
+    def _take_batch(self):
+        # blocks for the first item, then takes whatever else is queued; None means the pool is closing
+        item = self._queue.get()
+        if item is None:
+            return None, False
+        batch = [item]
+        num_files = len(item[0])
+        while num_files < self._max_batch_files:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            num_files += len(item[0])
+        return batch, False
+
+    def _collect(self, worker_dir, batch):
+        if not os.path.exists(os.path.join(worker_dir, 'coverage.json')):
+            shutil.copy(self._coverage_json_path, os.path.join(worker_dir, 'coverage.json'))
+        shutil.copy(self._coverage_json_path + '.acv', os.path.join(worker_dir, 'coverage.json.acv'))
+        num_acvs = 0
+        for acvs, _ in batch:
+            for acv in acvs:
+                os.rename(acv, os.path.join(worker_dir, 'coverage.json.{}.acv'.format(num_acvs)))
+                num_acvs += 1
+        try:
+            subprocess.run([self._altcover_cmd, 'runner', '--collect', '-r', self._managed_dir], cwd=worker_dir,
+                           check=True, stdout=subprocess.DEVNULL)
+        except (FileNotFoundError, subprocess.CalledProcessError) as e:
+            raise CoverageWorkerException('failed to process code coverage data: make sure altcover is in your PATH')
+        for acv in glob.glob(os.path.join(worker_dir, '*.acv')):
+            os.remove(acv)
+        new_ids = self._index.update(self._index.read_visit_counts(os.path.join(worker_dir, 'coverage.json')))
+        if len(new_ids) > 0:
+            self._on_covered(new_ids.tolist(), max(step_num for _, step_num in batch))
+
+    def _run(self, worker_dir):
+        while True:
+            batch, closing = self._take_batch()
+            if batch is not None:
+                try:
+                    self._collect(worker_dir, batch)
+                except Exception as e:
+                    self._error = e
+                    for acvs, _ in batch:
+                        for acv in acvs:
+                            if os.path.exists(acv):
+                                os.remove(acv)
+            if batch is None or closing:
+                break
+
+    def submit(self, acvs, step_num):
+        self._check_error()
+        if self._closed:
+            raise CoverageWorkerException('coverage worker pool is closed')
+        staged = []
+        for acv in acvs:
+            staged_path = os.path.join(self._staging_dir, '{}.acv'.format(uuid.uuid4()))
+            os.rename(acv, staged_path)
+            staged.append(staged_path)
+        self._queue.put((staged, step_num))
+
+    def get_backlog(self):
+        return self._queue.qsize()
+
+    def close(self):
+        # processes the remaining backlog before returning
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._check_error()
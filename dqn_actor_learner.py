@@ -0,0 +1,336 @@
+import multiprocessing
+import os.path
+import queue
+import traceback
+import numpy as np
+import torch
+from torch import nn
+import torch.optim as optim
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+from torch.utils.tensorboard import SummaryWriter
+from dqn_trainer import DQNNet, make_replay_buffer, save_checkpoint, get_epsilon, select_actions, add_count_reward, dqn_update
+from trainer_common import RollingMean, InfoProcessor, load_episode_rewards, make_env, make_vector_env, get_env_port_count
+from unity_env import make_spaces
+from profiling import make_profiler
+from replay import PrefetchSampler
+from state_counts import StateCountTable
+from info_db import get_shard_path, new_shard_id
+from merge_info_db import merge_info_db
+from trainer_log import configure_logging, get_logger, StepStats
+
+logger = get_logger('dqn_learner')
+
+# actors are spawned rather than forked, since the learner process already holds torch and SQLite state
+ACTOR_START_METHOD = 'spawn'
+
+# Actor/learner variant of the DQN trainer, used when trainer_config 'num_actors' is set. Every actor process drives
+# its own num_envs environments with the epsilon-greedy policy and streams the transitions to the learner (the
+# calling process) through a queue. The learner adds them to the replay buffer and trains continuously, publishing
+# the network weights to the actors through shared memory every 'actor_sync_freq' updates. With 'updates_per_step',
+# the learner instead waits for new transitions once it is that many updates per vector env step ahead.
+# Every actor writes its info to its own shard of the info database, which the learner merges into info_db_path
+# once the actors have exited (unless 'info_db_sharded' is set, in which case merge_info_db.py merges them later).
+# Only the shards of the run's own actors are merged, as other runs may be writing to shards of the same database.
+
+
+class SharedWeights:
+    # Flat float32 copy of the network parameters in shared memory, with a version counter so that actors only copy
+    # the weights when the learner has published new ones
+
+    def __init__(self, ctx, num_params):
+        self._buf = ctx.RawArray('f', num_params)
+        self._version = ctx.RawValue('q', 0)
+        self._lock = ctx.Lock()
+
+    def publish(self, net):
+        params = parameters_to_vector(net.parameters()).detach().cpu().numpy()
+        with self._lock:
+            np.frombuffer(self._buf, dtype=np.float32)[:] = params
+            self._version.value += 1
+
+    def pull(self, net, version):
+        # loads the published weights into net if they are newer than version; returns the version net now holds
+        if self._version.value == version:
+            return version
+        with self._lock:
+            params = torch.from_numpy(np.frombuffer(self._buf, dtype=np.float32).copy())
+            version = self._version.value
+        vector_to_parameters(params, net.parameters())
+        return version
+
+
+def _put(transitions, item, stop_event):
+    # blocks while the queue is full, unless the learner is shutting down
+    while not stop_event.is_set():
+        try:
+            transitions.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def run_actor(actor_id, game_config, game_config_path, start_port, workdir, observation_space, num_actions,
+              weights, transitions, global_step, stop_event, port_allocator, shard_id):
+    # spawned processes do not inherit the logging configuration
+    configure_logging(game_config, False)
+    try:
+        _run_actor(actor_id, game_config, game_config_path, start_port, workdir, observation_space, num_actions,
+                   weights, transitions, global_step, stop_event, port_allocator, shard_id)
+    except Exception:
+        _put(transitions, ('error', actor_id, traceback.format_exc()), stop_event)
+
+
+def _run_actor(actor_id, game_config, game_config_path, start_port, workdir, observation_space, num_actions,
+               weights, transitions, global_step, stop_event, port_allocator, shard_id):
+    trainer_config = game_config['trainer_config']
+    num_envs = game_config['num_envs']
+    pre_init = game_config['env_config']['pre_init']
+    ports_per_env = get_env_port_count(game_config)
+    if port_allocator is not None:
+        # the allocator brings the reservations of the ports of all actors along
+        port_allocator.release_all_except(range(start_port, start_port + num_envs*ports_per_env))
+    env_fns = [make_env(game_config, game_config_path, workdir,
+                        start_port + i*ports_per_env, start_port + i*ports_per_env + 1 if pre_init else None, True,
+                        port_allocator)
+               for i in range(num_envs)]
+    env = make_vector_env(env_fns, game_config, game_config_path, workdir, start_port, True, port_allocator)
+    info_proc = InfoProcessor(game_config, workdir, shard_id=shard_id)
+    try:
+        device = torch.device('cpu')
+        use_count_reward = 'count_reward' in trainer_config and trainer_config['count_reward']
+        use_env_reward = 'env_reward' in trainer_config and trainer_config['env_reward']
+        if use_count_reward:
+            # shared counts are kept per actor (and are not stored in checkpoints)
+            count_reward_shared = 'count_reward_shared' in trainer_config and trainer_config['count_reward_shared']
+            state_counts = StateCountTable(1 if count_reward_shared else num_envs)
+        predictor = DQNNet(observation_space['obs'], num_actions).to(device)
+        version = weights.pull(predictor, 0)
+        step_stats = StepStats(get_logger('dqn_actor.{}'.format(actor_id)), num_actions)
+        max_step_num = game_config['num_steps']
+        eps_initial = trainer_config['eps_initial']
+        eps_final = trainer_config['eps_final']
+        eps_anneal_steps = max_step_num*trainer_config['eps_annealing_duration']
+
+        ep_rews = np.zeros((num_envs,))
+        observation, info = env.reset()
+        while not stop_event.is_set() and global_step.value <= max_step_num:
+            eps = get_epsilon(global_step.value, eps_initial, eps_final, eps_anneal_steps)
+            version = weights.pull(predictor, version)
+            # the vector env may return views of its shared observation buffers, which the next step overwrites
+            obs = np.array(observation['obs'])
+            valid_action_counts = observation['action_mask'].sum(axis=1)
+            actions = select_actions(predictor, obs, observation['action_mask'], eps, num_actions, device)
+            observation, rew, term, trunc, info = env.step(actions.numpy())
+            if not use_env_reward:
+                rew = np.zeros(rew.shape)
+            if use_count_reward:
+                add_count_reward(rew, info['state_hash'], state_counts)
+            with global_step.get_lock():
+                global_step.value += num_envs
+                step_num = global_step.value
+            step_stats.add(valid_action_counts, actions.numpy(), rew)
+            step_stats.log_summary(step_num)
+
+            ep_rews += rew
+            dones = np.logical_or(term, trunc)
+            episode_rewards = []
+            for i in range(num_envs):
+                if dones[i]:
+                    episode_rewards.append(float(ep_rews[i]))
+                    ep_rews[i] = 0
+            if use_count_reward and not count_reward_shared and np.any(dones):
+                state_counts.clear(np.flatnonzero(dones))
+            batch = {
+                'obs': obs,
+                'act': actions.numpy(),
+                'rew': rew.astype(np.float32),
+                'next_obs': np.array(observation['obs']),
+                'next_act_mask': np.array(observation['action_mask']),
+                'done': dones,
+                # ids of the envs across all actors, for replay buffers that track the observations of every env
+                # (cpprb ignores the field)
+                'env_ids': actor_id*num_envs + np.arange(num_envs)
+            }
+            if not _put(transitions, ('transitions', batch, episode_rewards, step_num), stop_event):
+                break
+            info_proc.process_info(info, step_num)
+            info_proc.process_observation(observation, step_num)
+        step_stats.log_summary(global_step.value, force=True)
+    finally:
+        env.close()
+        info_proc.close()
+
+
+def run_dqn_actor_learner(game_config, game_config_path, start_port, workdir, port_allocator=None):
+    if not game_config['env_config']['observation_includes_image'] or \
+            game_config['env_config']['num_observation_features'] > 0:
+        raise NotImplementedError()
+    trainer_config = game_config['trainer_config']
+    num_actors = trainer_config['num_actors']
+    log_dir = os.path.join(game_config['tensorboard_log_path'],
+                           game_config['tensorboard_log_name'])
+    if not os.path.exists(log_dir):
+        logger.info('Creating directory: %s', log_dir)
+        os.makedirs(log_dir)
+    writer = SummaryWriter(log_dir=log_dir)
+    observation_space, action_space = make_spaces(game_config['env_config'])
+    num_actions = action_space.n
+    obs_space = observation_space['obs']
+    checkpoint_path = trainer_config['checkpoint_path'] + '.pth'
+    device = torch.device('cpu')
+    logger.info('Using device: %s', device)
+    logger.info('Using %d actors', num_actors)
+
+    rb = make_replay_buffer(trainer_config, observation_space, num_actions, num_actors*game_config['num_envs'])
+    predictor = DQNNet(obs_space, num_actions).to(device)
+    target = DQNNet(obs_space, num_actions).to(device)
+    init_step_num = 0
+    ep_rew_mean = RollingMean()
+    num_episodes = 0
+    if os.path.exists(checkpoint_path):
+        logger.info('Loading existing checkpoint: %s', checkpoint_path)
+        data = torch.load(checkpoint_path)
+        predictor.load_state_dict(data['state_dict'])
+        init_step_num = data['step_num']
+        if 'ep_rew_mean' in data:
+            ep_rew_mean.load_state_dict(data['ep_rew_mean'])
+        else:
+            load_episode_rewards(log_dir, ep_rew_mean)
+        num_episodes = data['num_episodes'] if 'num_episodes' in data else 0
+    checkpoint_dir = os.path.dirname(checkpoint_path)
+    if not os.path.exists(checkpoint_dir):
+        logger.info('Creating directory: %s', checkpoint_dir)
+        os.makedirs(checkpoint_dir)
+    target.load_state_dict(predictor.state_dict())
+    optimizer = optim.Adam(predictor.parameters(), lr=trainer_config['learning_rate'])
+    loss_fn = nn.MSELoss()
+    predictor.train()
+    target.eval()
+
+    max_step_num = game_config['num_steps']
+    eps_initial = trainer_config['eps_initial']
+    eps_final = trainer_config['eps_final']
+    eps_anneal_steps = max_step_num*trainer_config['eps_annealing_duration']
+    gamma = trainer_config['discount_factor']
+    target_update_freq = trainer_config['target_update_freq']
+    batch_size = trainer_config['batch_size']
+    actor_sync_freq = trainer_config['actor_sync_freq'] if 'actor_sync_freq' in trainer_config else 50
+    actor_queue_size = trainer_config['actor_queue_size'] if 'actor_queue_size' in trainer_config else 64
+    updates_per_step = trainer_config['updates_per_step'] if 'updates_per_step' in trainer_config else None
+    prefetch_batches = trainer_config['prefetch_batches'] if 'prefetch_batches' in trainer_config else 2
+    log_freq = 500
+    save_freq = 1500
+
+    ctx = multiprocessing.get_context(ACTOR_START_METHOD)
+    weights = SharedWeights(ctx, sum(param.numel() for param in predictor.parameters()))
+    weights.publish(predictor)
+    transitions = ctx.Queue(maxsize=actor_queue_size)
+    global_step = ctx.Value('q', init_step_num)
+    stop_event = ctx.Event()
+    ports_per_actor = game_config['num_envs']*get_env_port_count(game_config)
+    shard_ids = [new_shard_id() for _ in range(num_actors)]
+    actors = [ctx.Process(target=run_actor, name='DQNActor-{}'.format(actor_id), daemon=False,
+                          args=(actor_id, game_config, game_config_path, start_port + actor_id*ports_per_actor, workdir,
+                                observation_space, num_actions, weights, transitions, global_step, stop_event,
+                                port_allocator, shard_ids[actor_id]))
+              for actor_id in range(num_actors)]
+    profiler = make_profiler(game_config)
+    sampler = PrefetchSampler(rb, batch_size, device, num_prefetch=prefetch_batches)
+
+    def receive(block):
+        # adds the queued transitions to the replay buffer; returns False once all actors have exited
+        nonlocal num_episodes
+        num_received = 0
+        while num_received < actor_queue_size:
+            try:
+                msg = transitions.get(timeout=0.1) if block and num_received == 0 else transitions.get_nowait()
+            except queue.Empty:
+                if num_received > 0 or any(actor.is_alive() for actor in actors):
+                    return True
+                for actor_id, actor in enumerate(actors):
+                    if actor.exitcode != 0:
+                        raise Exception('actor {} exited with code {}'.format(actor_id, actor.exitcode))
+                return False
+            num_received += 1
+            if msg[0] == 'error':
+                raise Exception('actor {} failed:\n{}'.format(msg[1], msg[2]))
+            _, batch, episode_rewards, step_num = msg
+            sampler.add(**batch)
+            for ep_rew in episode_rewards:
+                ep_rew_mean.add_value(ep_rew)
+                writer.add_scalar('episode/reward', ep_rew, step_num)
+            num_episodes += len(episode_rewards)
+            if len(episode_rewards) > 0:
+                writer.add_scalar('episode/reward_mean', ep_rew_mean.get_mean(), step_num)
+        return True
+
+    step_num = init_step_num
+    last_log = step_num
+    last_target_update = step_num
+    last_save = step_num
+    num_updates = 0
+    try:
+        for actor in actors:
+            actor.start()
+        if port_allocator is not None:
+            # the actors have started and hold the reservations of their own ports
+            port_allocator.release_all()
+        while True:
+            step_num = global_step.value
+            can_update = sampler.get_stored_size() >= batch_size and \
+                (updates_per_step is None or
+                 num_updates < updates_per_step*(step_num - init_step_num)/game_config['num_envs'])
+            with profiler.stage('learner/receive'):
+                running = receive(block=not can_update)
+            if not running:
+                break
+            if step_num - last_log >= log_freq:
+                eps = get_epsilon(step_num, eps_initial, eps_final, eps_anneal_steps)
+                if len(ep_rew_mean.buf) > 0:
+                    logger.info('Step: %d/%d, Eps: %s, Updates: %d, Episodes: %d, Mean Reward: %s',
+                                step_num, max_step_num, eps, num_updates, num_episodes, ep_rew_mean.get_mean())
+                else:
+                    logger.info('Step: %d/%d, Eps: %s, Updates: %d, Episodes: %d',
+                                step_num, max_step_num, eps, num_updates, num_episodes)
+                writer.add_scalar('train/epsilon', eps, step_num)
+                writer.add_scalar('train/updates', num_updates, step_num)
+                writer.flush()
+                profiler.write_summary(writer, step_num)
+                last_log = step_num
+
+            # train
+            if can_update:
+                with profiler.stage('train/replay_sample'):
+                    sample = sampler.sample()
+                with profiler.stage('train/update'):
+                    dqn_update(predictor, target, optimizer, loss_fn, sample, gamma, device)
+                num_updates += 1
+                if num_updates % actor_sync_freq == 0:
+                    with profiler.stage('learner/publish_weights'):
+                        weights.publish(predictor)
+                if step_num - last_target_update >= target_update_freq:
+                    target.load_state_dict(predictor.state_dict())
+                    last_target_update = step_num
+                if step_num - last_save >= save_freq:
+                    with profiler.stage('train/checkpoint'):
+                        save_checkpoint(checkpoint_path, predictor, step_num, rb, ep_rew_mean, num_episodes)
+                        last_save = step_num
+    finally:
+        stop_event.set()
+        sampler.close()
+        # actors cannot exit while their queue buffers hold undelivered transitions, so keep draining
+        for actor in actors:
+            while actor.is_alive():
+                try:
+                    transitions.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+                actor.join(timeout=0.1)
+        profiler.close()
+        writer.close()
+    if not ('info_db_sharded' in game_config and game_config['info_db_sharded']):
+        shard_paths = [get_shard_path(game_config['info_db_path'], shard_id) for shard_id in shard_ids]
+        shard_paths = [shard_path for shard_path in shard_paths if os.path.exists(shard_path)]
+        if len(shard_paths) > 0:
+            merge_info_db(game_config, shard_paths=shard_paths)
@@ -1,16 +1,20 @@
 import gymnasium as gym
-from gymnasium.vector import SyncVectorEnv, AsyncVectorEnv
+from gymnasium.vector import SyncVectorEnv
 import numpy as np
 import torch
-from tensorboard.backend.event_processing import event_accumulator
 from torch.utils.tensorboard import SummaryWriter
 from torch import nn
 import torch.optim as optim
 from cpprb import ReplayBuffer
 import os.path
-import math
-import sys
-from trainer_common import RollingMean, InfoProcessor, make_env
+from trainer_common import RollingMean, InfoProcessor, load_episode_rewards, make_env, make_vector_env, get_env_port_count
+from unity_env import make_spaces
+from profiling import make_profiler
+from replay import PrefetchSampler, FrameStackReplayBuffer, MmapReplayBuffer
+from state_counts import StateCountTable
+from trainer_log import get_logger, StepStats
+
+logger = get_logger('dqn')
 
 class DQNNet(nn.Module):
     def __init__(self, observation_space, num_actions):
@@ -39,7 +43,91 @@ class DQNNet(nn.Module):
         logits = self.linear(self.cnn(obs_norm))
         return logits
 
-def run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic):
+def get_replay_dir(trainer_config):
+    return trainer_config['checkpoint_path'] + '_replay'
+
+def make_replay_buffer(trainer_config, observation_space, num_actions, num_envs):
+    # trainer_config 'replay_buffer': 'frame_stack' stores every frame of the stacked observations once
+    # (see FrameStackReplayBuffer) instead of storing full obs and next_obs stacks for every transition, and 'mmap'
+    # stores the transitions in memory-mapped files next to the checkpoint, which are kept across restarts
+    # (see MmapReplayBuffer)
+    buffer_size = trainer_config['buffer_size']
+    replay_buffer = trainer_config['replay_buffer'] if 'replay_buffer' in trainer_config else 'cpprb'
+    obs_space = observation_space['obs']
+    if replay_buffer == 'frame_stack':
+        return FrameStackReplayBuffer(buffer_size, obs_space.shape, num_actions, num_envs=num_envs,
+                                      obs_dtype=obs_space.dtype, act_mask_dtype=observation_space['action_mask'].dtype)
+    env_dict = {
+        'obs': {'shape': obs_space.shape, 'dtype': obs_space.dtype},
+        'act': {'dtype': np.int_},
+        'rew': {'dtype': np.float32},
+        'next_obs': {'shape': obs_space.shape, 'dtype': obs_space.dtype},
+        'next_act_mask': {'shape': (num_actions,), 'dtype': observation_space['action_mask'].dtype},
+        'done': {'dtype': np.bool_}
+    }
+    if replay_buffer == 'mmap':
+        return MmapReplayBuffer(buffer_size, env_dict, get_replay_dir(trainer_config))
+    elif replay_buffer != 'cpprb':
+        raise Exception('unknown replay_buffer: {}'.format(replay_buffer))
+    return ReplayBuffer(buffer_size, env_dict=env_dict)
+
+def save_checkpoint(checkpoint_path, predictor, step_num, rb, ep_rew_mean, num_episodes, state_counts=None):
+    # a disk-backed replay buffer is flushed first, so that it resumes with the transitions up to this checkpoint
+    if isinstance(rb, MmapReplayBuffer):
+        rb.flush()
+    save_data = {
+        'state_dict': predictor.state_dict(),
+        'step_num': step_num,
+        'ep_rew_mean': ep_rew_mean.state_dict(),
+        'num_episodes': num_episodes
+    }
+    if state_counts is not None:
+        save_data['state_counts'] = state_counts.state_dict()
+    torch.save(save_data, checkpoint_path)
+
+def get_epsilon(step_num, eps_initial, eps_final, eps_anneal_steps):
+    if step_num <= eps_anneal_steps:
+        return eps_initial + step_num/eps_anneal_steps*(eps_final - eps_initial)
+    else:
+        return eps_final
+
+def select_actions(predictor, obs, action_mask, eps, num_actions, device):
+    # epsilon-greedy over the valid actions of every env
+    with torch.no_grad():
+        if torch.rand(1)[0] < eps:
+            action_values = torch.randn((len(obs), num_actions), device=device)
+        else:
+            action_values = predictor(torch.as_tensor(obs, device=device))
+        action_mask = torch.as_tensor(action_mask, device=device)
+        min_value = action_values.min() - action_values.max() - 1.0
+        action_values = action_values + (1.0 - action_mask)*min_value
+        return action_values.argmax(1).cpu()
+
+def add_count_reward(rew, state_hashes, state_counts):
+    rew += 1.0/np.sqrt(state_counts.increment(state_hashes))
+
+def dqn_update(predictor, target, optimizer, loss_fn, sample, gamma, device):
+    batch_size = len(sample['done'])
+    done_mask = torch.where(torch.as_tensor(sample['done'], device=device).squeeze(),
+                            torch.zeros(batch_size, device=device),
+                            torch.ones(batch_size, device=device))
+    with torch.no_grad():
+        tgt_action_values = target(torch.as_tensor(sample['next_obs'], device=device))
+    min_value = tgt_action_values.min() - tgt_action_values.max() - 1.0
+    next_act_mask = torch.as_tensor(sample['next_act_mask'], device=device)
+    tgt_action_values = tgt_action_values + (1.0 - next_act_mask)*min_value
+    expected = torch.as_tensor(sample['rew'].squeeze(), device=device) + \
+               gamma * done_mask * tgt_action_values.max(1).values
+    current = torch.gather(
+        predictor(torch.as_tensor(sample['obs'], device=device)),
+        1, torch.as_tensor(sample['act'], device=device, dtype=torch.int64)).squeeze()
+    loss = loss_fn(current, expected)
+    optimizer.zero_grad()
+    loss.backward()
+    optimizer.step()
+    return loss
+
+def run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic, port_allocator=None):
     if is_predict:
         num_envs = 1
     else:
@@ -51,55 +139,66 @@ def run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_d
                             game_config['tensorboard_log_name'])
     if not is_predict:
         if not os.path.exists(log_dir):
-            print('Creating directory: {}'.format(log_dir))
+            logger.info('Creating directory: %s', log_dir)
             os.makedirs(log_dir)
         writer = SummaryWriter(log_dir=log_dir)
-    dummy_env = make_env(game_config, game_config_path, workdir, start_port, None, True)()
-    observation_space = dummy_env.observation_space
+    observation_space, action_space = make_spaces(game_config['env_config'])
+    num_actions = action_space.n
     obs_space = observation_space['obs']
-    num_actions = dummy_env.action_space.n
-    dummy_env.close()
     checkpoint_path = game_config['trainer_config']['checkpoint_path'] + '.pth'
     pre_init = game_config['env_config']['pre_init']
+    ports_per_env = get_env_port_count(game_config)
     env_fns = [make_env(game_config, game_config_path, workdir,
-                        start_port + i*2, start_port + i*2 + 1 if pre_init and not is_predict else None, not is_predict)
+                        start_port + i*ports_per_env, start_port + i*ports_per_env + 1 if pre_init and not is_predict else None, not is_predict,
+                        port_allocator)
                for i in range(num_envs)]
-    env = AsyncVectorEnv(env_fns, shared_memory=False, daemon=False)
+    env = make_vector_env(env_fns, game_config, game_config_path, workdir, start_port, not is_predict, port_allocator)
     info_proc = InfoProcessor(game_config, workdir)
+    profiler = make_profiler(game_config)
+    sampler = None
     try:
-        rb = ReplayBuffer(game_config['trainer_config']['buffer_size'], env_dict={
-            'obs': {'shape': obs_space.shape, 'dtype': obs_space.dtype},
-            'act': {'dtype': np.int_},
-            'rew': {'dtype': np.float32},
-            'next_obs': {'shape': obs_space.shape, 'dtype': obs_space.dtype},
-            'next_act_mask': {'shape': (num_actions,), 'dtype': observation_space['action_mask'].dtype},
-            'done': {'dtype': np.bool_}
-        })
+        # predict runs do not train, and must not add their transitions to the replay buffer of the training run
+        # (which is stored on disk with 'mmap')
+        rb = None if is_predict else make_replay_buffer(game_config['trainer_config'], observation_space, num_actions,
+                                                        num_envs)
         device = torch.device('cpu')
-        print('Using device: {}'.format(device))
+        logger.info('Using device: %s', device)
 
         use_count_reward = 'count_reward' in game_config['trainer_config'] and game_config['trainer_config']['count_reward']
         use_env_reward = 'env_reward' in game_config['trainer_config'] and game_config['trainer_config']['env_reward']
+        count_reward_shared = 'count_reward_shared' in game_config['trainer_config'] and game_config['trainer_config']['count_reward_shared']
 
         predictor = DQNNet(obs_space, num_actions).to(device)
         target = DQNNet(obs_space, num_actions).to(device)
 
+        state_counts = None
         if use_count_reward:
-            state_visit_counts = [dict() for _ in range(num_envs)]
-            print('Using count-based exploration reward')
+            # per-env counts cover the current episode of every env, shared counts all episodes of all envs
+            state_counts = StateCountTable(1 if count_reward_shared else num_envs)
+            logger.info('Using count-based exploration reward')
         if use_env_reward:
-            print('Using environment reward')
+            logger.info('Using environment reward')
 
         init_step_num = 0
+        ep_rew_mean = RollingMean()
+        num_episodes = 0
         if os.path.exists(checkpoint_path):
-            print('Loading existing checkpoint: {}'.format(checkpoint_path))
+            logger.info('Loading existing checkpoint: %s', checkpoint_path)
             data = torch.load(checkpoint_path)
             predictor.load_state_dict(data['state_dict'])
+            if 'ep_rew_mean' in data:
+                ep_rew_mean.load_state_dict(data['ep_rew_mean'])
+            else:
+                load_episode_rewards(log_dir, ep_rew_mean)
             if not is_predict:
                 init_step_num = data['step_num']
+                num_episodes = data['num_episodes'] if 'num_episodes' in data else 0
+                # only shared counts are kept, since every env starts a new episode
+                if use_count_reward and count_reward_shared and 'state_counts' in data:
+                    state_counts.load_state_dict(data['state_counts'])
         checkpoint_dir = os.path.dirname(checkpoint_path)
         if not os.path.exists(checkpoint_dir):
-            print('Creating directory: {}'.format(checkpoint_dir))
+            logger.info('Creating directory: %s', checkpoint_dir)
             os.makedirs(checkpoint_dir)
 
         target.load_state_dict(predictor.state_dict())
@@ -109,35 +208,37 @@ def run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_d
         predictor.train()
         target.eval()
 
-        ep_rew_mean = RollingMean()
-        ea = event_accumulator.EventAccumulator(log_dir)
-        ea.Reload()
-        if 'episode/reward' in ea.scalars.Keys():
-            for evt in ea.scalars.Items('episode/reward')[-ep_rew_mean.buf.maxlen:]:
-                ep_rew_mean.add_value(evt.value)
-
         if is_predict:
             max_step_num = game_config['env_config']['time_limit']-1
         else:
             max_step_num = game_config['num_steps']
 
         ep_rews = np.zeros((num_envs,))
+        obs_buf = np.zeros((num_envs,) + obs_space.shape, dtype=obs_space.dtype)
         eps_initial = game_config['trainer_config']['eps_initial']
         eps_final = game_config['trainer_config']['eps_final']
         eps_anneal_steps = max_step_num*game_config['trainer_config']['eps_annealing_duration']
         gamma = game_config['trainer_config']['discount_factor']
         target_update_freq = game_config['trainer_config']['target_update_freq']
         batch_size = game_config['trainer_config']['batch_size']
+        # number of updates per vector env step (may be fractional), and number of batches sampled ahead of time
+        updates_per_step = game_config['trainer_config']['updates_per_step'] if 'updates_per_step' in game_config['trainer_config'] else 1
+        prefetch_batches = game_config['trainer_config']['prefetch_batches'] if 'prefetch_batches' in game_config['trainer_config'] else 2
         log_freq = 500
         save_freq = 1500
 
-        sys.stdout.flush()
+        if not is_predict:
+            sampler = PrefetchSampler(rb, batch_size, device, num_prefetch=prefetch_batches)
+        update_credit = 0.0
+        step_stats = StepStats(logger, num_actions)
 
         step_num = init_step_num
         last_log = step_num
         last_target_update = step_num
         last_save = step_num
-        observation, info = env.reset()
+        with profiler.stage('vector_env/reset'):
+            observation, info = env.reset()
+        profiler.record_info(info)
         while step_num <= max_step_num:
             if is_predict:
                 if is_deterministic:
@@ -145,51 +246,38 @@ def run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_d
                 else:
                     eps = eps_final
             else:
-                if step_num <= eps_anneal_steps:
-                    eps = eps_initial + step_num/eps_anneal_steps*(eps_final - eps_initial)
-                else:
-                    eps = eps_final
+                eps = get_epsilon(step_num, eps_initial, eps_final, eps_anneal_steps)
 
             if step_num - last_log >= log_freq:
-                msg = 'Step: {}/{}, Eps: {}'.format(step_num, max_step_num, eps)
                 if len(ep_rew_mean.buf) > 0:
-                    msg += ", Mean Reward: {}".format(ep_rew_mean.get_mean())
-                print(msg)
-                sys.stdout.flush()
+                    logger.info('Step: %d/%d, Eps: %s, Episodes: %d, Mean Reward: %s',
+                                step_num, max_step_num, eps, num_episodes, ep_rew_mean.get_mean())
+                else:
+                    logger.info('Step: %d/%d, Eps: %s, Episodes: %d', step_num, max_step_num, eps, num_episodes)
                 if not is_predict:
                     writer.add_scalar('train/epsilon', eps, step_num)
+                    profiler.write_summary(writer, step_num)
                 last_log = step_num
 
             # gain experience
             with torch.no_grad():
-                obs = observation['obs']
-                if torch.rand(1)[0] < eps:
-                    action_values = torch.randn((num_envs, num_actions), device=device)
-                else:
-                    action_values = predictor(torch.as_tensor(obs, device=device))
-                action_mask = torch.as_tensor(observation['action_mask'], device=device)
-                print('Valid action counts: {}'.format([int(env_action_mask.sum()) for env_action_mask in action_mask]))
-                min_value = action_values.min() - action_values.max() - 1.0
-                action_values = action_values + (1.0 - action_mask)*min_value
-                actions = action_values.argmax(1).cpu()
-                print('Performing actions: {}'.format(actions))
-                observation, rew, term, trunc, info = env.step(actions.numpy())
+                with profiler.stage('train/act'):
+                    # the vector env may return views of its shared observation buffers, which the next step overwrites
+                    obs = obs_buf
+                    np.copyto(obs, observation['obs'])
+                    valid_action_counts = observation['action_mask'].sum(axis=1)
+                    actions = select_actions(predictor, obs, observation['action_mask'], eps, num_actions, device)
+                with profiler.stage('vector_env/step'):
+                    observation, rew, term, trunc, info = env.step(actions.numpy())
+                profiler.record_info(info)
                 if not use_env_reward:
                     rew = np.zeros(rew.shape)
 
             if use_count_reward:
-                for i in range(num_envs):
-                    env_state_hash = info['state_hash'][i]
-                    env_visit_counts = state_visit_counts[i]
-                    if env_state_hash in env_visit_counts:
-                        visit_count = env_visit_counts[env_state_hash]
-                    else:
-                        visit_count = 0
-                    visit_count += 1
-                    rew[i] += 1.0/math.sqrt(visit_count)
-                    env_visit_counts[env_state_hash] = visit_count
-
-            print('Rewards: {}'.format(rew))
+                add_count_reward(rew, info['state_hash'], state_counts)
+
+            step_stats.add(valid_action_counts, actions.numpy(), rew)
+            step_stats.log_summary(step_num)
 
             ep_rews += rew
             step_num += num_envs
@@ -199,49 +287,44 @@ def run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_d
             for i in range(num_envs):
                 if dones[i]:
                     ep_rew_mean.add_value(ep_rews[i])
+                    num_episodes += 1
                     if not is_predict:
                         writer.add_scalar('episode/reward', ep_rews[i], step_num)
                     ep_rews[i] = 0
-                    if use_count_reward:
-                        state_visit_counts[i].clear()
-                rb.add(obs=obs[i], act=actions[i], next_obs=next_obs[i],
-                       next_act_mask=next_act_mask[i], rew=rew[i], done=dones[i])
+            if use_count_reward and not count_reward_shared and np.any(dones):
+                state_counts.clear(np.flatnonzero(dones))
             if not is_predict:
+                with profiler.stage('train/replay_add'):
+                    sampler.add(obs=obs, act=actions.numpy(), next_obs=next_obs,
+                                next_act_mask=next_act_mask, rew=rew, done=dones)
                 if np.any(dones):
                     writer.add_scalar('episode/reward_mean', ep_rew_mean.get_mean(), step_num)
                     writer.flush()
-                info_proc.process_info(info, step_num)
-                info_proc.process_observation(observation, step_num)
+                with profiler.stage('info/process'):
+                    info_proc.process_info(info, step_num)
+                    info_proc.process_observation(observation, step_num)
 
             # train
-            if not is_predict and rb.get_stored_size() >= batch_size:
-                sample = rb.sample(batch_size)
-                done_mask = torch.where(torch.as_tensor(sample['done'], device=device).squeeze(),
-                                        torch.zeros(batch_size, device=device),
-                                        torch.ones(batch_size, device=device))
-                tgt_action_values = target(torch.as_tensor(sample['next_obs'], device=device))
-                min_value = tgt_action_values.min() - tgt_action_values.max() - 1.0
-                next_act_mask = torch.as_tensor(sample['next_act_mask'], device=device)
-                tgt_action_values = tgt_action_values + (1.0 - next_act_mask)*min_value
-                expected = torch.as_tensor(sample['rew'].squeeze(), device=device) + \
-                           gamma * done_mask * tgt_action_values.max(1).values
-                current = torch.gather(
-                    predictor(torch.as_tensor(sample['obs'], device=device)),
-                    1, torch.as_tensor(sample['act'], device=device, dtype=torch.int64)).squeeze()
-                loss = loss_fn(current, expected)
-                optimizer.zero_grad()
-                loss.backward()
-                optimizer.step()
+            if not is_predict and sampler.get_stored_size() >= batch_size:
+                update_credit += updates_per_step
+                while update_credit >= 1.0:
+                    update_credit -= 1.0
+                    with profiler.stage('train/replay_sample'):
+                        sample = sampler.sample()
+                    with profiler.stage('train/update'):
+                        dqn_update(predictor, target, optimizer, loss_fn, sample, gamma, device)
                 if step_num - last_target_update >= target_update_freq:
                     target.load_state_dict(predictor.state_dict())
                     last_target_update = step_num
                 if step_num - last_save >= save_freq:
-                    save_data = {
-                        'state_dict': predictor.state_dict(),
-                        'step_num': step_num
-                    }
-                    torch.save(save_data, checkpoint_path)
-                    last_save = step_num
+                    with profiler.stage('train/checkpoint'):
+                        save_checkpoint(checkpoint_path, predictor, step_num, rb, ep_rew_mean, num_episodes,
+                                        state_counts if count_reward_shared else None)
+                        last_save = step_num
+        step_stats.log_summary(step_num, force=True)
     finally:
+        if sampler is not None:
+            sampler.close()
         env.close()
         info_proc.close()
+        profiler.close()
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class FrameStackException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class LazyFrames:
+    # Stacked observation that is only copied out of the frame store when converted to an array. It must be
+    # consumed before the next frame is pushed to the store it came from.
+    def __init__(self, frame_stack, order, version):
+        self._frame_stack = frame_stack
+        self._order = order
+        self._version = version
+
+    @property
+    def shape(self):
+        return (len(self._order),) + self._frame_stack.frame_shape
+
+    @property
+    def dtype(self):
+        return self._frame_stack.dtype
+
+    def __len__(self):
+        return len(self._order)
+
+    def __array__(self, dtype=None, copy=None):
+        if self._version != self._frame_stack.version:
+            raise FrameStackException('stacked observation was consumed after the frame stack was modified')
+        arr = self._frame_stack.frames.take(self._order, axis=0)
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    def __getitem__(self, item):
+        return np.asarray(self)[item]
+
+    def __reduce__(self):
+        return np.asarray(self).__reduce__()
+
+
+class FrameStack:
+    # Preallocated circular frame store. Stacked observations are ordered from the oldest to the newest frame;
+    # until stack_len frames have been pushed, the stack is padded at the end with copies of the newest frame.
+    def __init__(self, stack_len, frame_shape, dtype=np.uint8):
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frames = np.zeros((stack_len,) + self.frame_shape, dtype=self.dtype)
+        self.version = 0
+        self._stack_len = stack_len
+        self._next = 0
+        self._count = 0
+        # stacked() alternates between two output buffers so that the previous observation stays valid for one step
+        self._outputs = [np.zeros_like(self.frames), np.zeros_like(self.frames)]
+        self._next_output = 0
+
+    def next_slot(self):
+        # Slot the next frame should be written into (e.g. as the out argument of a preprocessing step),
+        # followed by a call to commit()
+        return self.frames[self._next]
+
+    def commit(self):
+        self._next = (self._next + 1) % self._stack_len
+        self._count = min(self._count + 1, self._stack_len)
+        self.version += 1
+
+    def push(self, frame):
+        np.copyto(self.next_slot(), frame)
+        self.commit()
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+        self.version += 1
+
+    def _order(self):
+        if self._count == 0:
+            raise FrameStackException('no frames in frame stack')
+        newest = (self._next - 1) % self._stack_len
+        order = np.full(self._stack_len, newest, dtype=np.intp)
+        order[:self._count] = (np.arange(self._count) + self._next - self._count) % self._stack_len
+        return order
+
+    def stacked(self, out=None):
+        if out is None:
+            out = self._outputs[self._next_output]
+            self._next_output = 1 - self._next_output
+        return self.frames.take(self._order(), axis=0, out=out)
+
+    def lazy(self):
+        return LazyFrames(self, self._order(), self.version)
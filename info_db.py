@@ -0,0 +1,302 @@
+import glob
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# WAL lets readers (e.g. reporting scripts) run alongside the writer, and with synchronous=NORMAL a transaction
+# commit no longer waits for an fsync (only checkpoints do)
+DB_PRAGMAS = [
+    'pragma journal_mode=wal',
+    'pragma synchronous=normal',
+    'pragma temp_store=memory',
+    'pragma cache_size=-65536'
+]
+
+
+# Width (in steps) of the buckets of the coverage and action count curves maintained by the summary tables
+DEFAULT_BUCKET_SIZE = 1000
+SUMMARY_VERSION = 2
+
+# Tables whose rows are appended as they are when merging shards (see merge_shard), with their columns
+APPEND_TABLES = [
+    ('states', 'state_hash, step_num'),
+    ('failures', 'failure, step_num'),
+    ('actions', 'num_valid_actions, step_num'),
+    ('time_va', 'time_valid_actions, step_num'),
+    ('time_pa', 'time_perform_action, step_num'),
+    ('time_lease', 'time_pool_lease, step_num')
+]
+SUMMARY_TABLES = ['state_first_seen', 'state_buckets', 'codecov_buckets', 'action_buckets']
+SUMMARY_TRIGGERS = ['states_{}_first_seen', 'state_first_seen_{}_bucket', 'state_first_seen_{}_bucket_update',
+                    'codecov_{}_bucket', 'codecov_{}_bucket_update', 'actions_{}_bucket']
+
+
+def get_schema(config_name, bucket_size):
+    # Base tables written by InfoProcessor, their indexes, and the summary tables kept up to date by triggers:
+    #   state_first_seen: first step at which every state hash was visited (moved back if an earlier visit is inserted
+    #   later on, which happens when merging shards)
+    #   state_buckets / codecov_buckets: number of states / sequence points first covered in every step bucket
+    #   action_buckets: number of valid action count samples and their sum in every step bucket
+    c = config_name
+    b = int(bucket_size)
+    return [
+        'create table if not exists states_{} (state_hash int, step_num int)'.format(c),
+        'create table if not exists codecov_{} (seqpt_id int primary key, step_num int)'.format(c),
+        'create table if not exists failures_{} (failure text, step_num int)'.format(c),
+        'create table if not exists actions_{} (num_valid_actions int, step_num int)'.format(c),
+        'create table if not exists time_va_{} (time_valid_actions int, step_num int)'.format(c),
+        'create table if not exists time_pa_{} (time_perform_action int, step_num int)'.format(c),
+        'create table if not exists time_lease_{} (time_pool_lease int, step_num int)'.format(c),
+        'create index if not exists states_{0}_state_hash on states_{0} (state_hash)'.format(c),
+        'create index if not exists states_{0}_step_num on states_{0} (step_num)'.format(c),
+        'create index if not exists codecov_{0}_step_num on codecov_{0} (step_num)'.format(c),
+        'create index if not exists failures_{0}_step_num on failures_{0} (step_num)'.format(c),
+        'create index if not exists actions_{0}_step_num on actions_{0} (step_num)'.format(c),
+        'create table if not exists meta_{} (key text primary key, value)'.format(c),
+        'create table if not exists state_first_seen_{} (state_hash int primary key, step_num int)'.format(c),
+        'create table if not exists state_buckets_{} (bucket int primary key, new_states int)'.format(c),
+        'create table if not exists codecov_buckets_{} (bucket int primary key, new_seqpts int)'.format(c),
+        'create table if not exists action_buckets_{} (bucket int primary key, num_samples int, sum_valid_actions int)'.format(c),
+        """create trigger if not exists states_{0}_first_seen after insert on states_{0} begin
+               insert into state_first_seen_{0} (state_hash, step_num) values (new.state_hash, new.step_num)
+                   on conflict (state_hash) do update set step_num = excluded.step_num where excluded.step_num < step_num;
+           end""".format(c),
+        """create trigger if not exists state_first_seen_{0}_bucket after insert on state_first_seen_{0} begin
+               insert or ignore into state_buckets_{0} (bucket, new_states) values (new.step_num/{1}, 0);
+               update state_buckets_{0} set new_states = new_states + 1 where bucket = new.step_num/{1};
+           end""".format(c, b),
+        """create trigger if not exists state_first_seen_{0}_bucket_update after update of step_num on state_first_seen_{0} begin
+               update state_buckets_{0} set new_states = new_states - 1 where bucket = old.step_num/{1};
+               insert or ignore into state_buckets_{0} (bucket, new_states) values (new.step_num/{1}, 0);
+               update state_buckets_{0} set new_states = new_states + 1 where bucket = new.step_num/{1};
+           end""".format(c, b),
+        """create trigger if not exists codecov_{0}_bucket after insert on codecov_{0} begin
+               insert or ignore into codecov_buckets_{0} (bucket, new_seqpts) values (new.step_num/{1}, 0);
+               update codecov_buckets_{0} set new_seqpts = new_seqpts + 1 where bucket = new.step_num/{1};
+           end""".format(c, b),
+        """create trigger if not exists codecov_{0}_bucket_update after update of step_num on codecov_{0} begin
+               update codecov_buckets_{0} set new_seqpts = new_seqpts - 1 where bucket = old.step_num/{1};
+               insert or ignore into codecov_buckets_{0} (bucket, new_seqpts) values (new.step_num/{1}, 0);
+               update codecov_buckets_{0} set new_seqpts = new_seqpts + 1 where bucket = new.step_num/{1};
+           end""".format(c, b),
+        """create trigger if not exists actions_{0}_bucket after insert on actions_{0} begin
+               insert or ignore into action_buckets_{0} (bucket, num_samples, sum_valid_actions) values (new.step_num/{1}, 0, 0);
+               update action_buckets_{0} set num_samples = num_samples + 1, sum_valid_actions = sum_valid_actions + new.num_valid_actions
+                   where bucket = new.step_num/{1};
+           end""".format(c, b)
+    ]
+
+
+def get_drop_summary_statements(config_name):
+    # Summary tables and triggers of an older SUMMARY_VERSION are dropped, recreated and backfilled
+    return ['drop trigger if exists {}'.format(trigger.format(config_name)) for trigger in SUMMARY_TRIGGERS] + \
+        ['drop table if exists {}_{}'.format(table, config_name) for table in SUMMARY_TABLES]
+
+
+def get_backfill_statements(config_name, bucket_size):
+    # Fills the summary tables from rows written before they existed (the states trigger fills state_buckets)
+    c = config_name
+    b = int(bucket_size)
+    return [
+        'insert or ignore into state_first_seen_{0} (state_hash, step_num) select state_hash, min(step_num) from states_{0} group by state_hash'.format(c),
+        'insert or replace into codecov_buckets_{0} (bucket, new_seqpts) select step_num/{1}, count(*) from codecov_{0} group by step_num/{1}'.format(c, b),
+        'insert or replace into action_buckets_{0} (bucket, num_samples, sum_valid_actions) select step_num/{1}, count(*), sum(num_valid_actions) from actions_{0} group by step_num/{1}'.format(c, b)
+    ]
+
+
+def get_meta(db_conn, config_name, key, default=None):
+    try:
+        row = db_conn.execute('select value from meta_{} where key = ?'.format(config_name), (key,)).fetchone()
+    except sqlite3.OperationalError: # no meta table yet
+        return default
+    return row[0] if row is not None else default
+
+
+def init_info_db(db_path, config_name, bucket_size=DEFAULT_BUCKET_SIZE):
+    # Creates the schema, and backfills the summary tables once for databases created before they existed.
+    # The bucket size of an existing database is kept. Returns the bucket size in use.
+    db_conn = sqlite3.connect(db_path)
+    try:
+        for pragma in DB_PRAGMAS:
+            db_conn.execute(pragma)
+        bucket_size = get_meta(db_conn, config_name, 'bucket_size', bucket_size)
+        summary_version = get_meta(db_conn, config_name, 'summary_version', 0)
+        with db_conn:
+            if 0 < summary_version < SUMMARY_VERSION:
+                for statement in get_drop_summary_statements(config_name):
+                    db_conn.execute(statement)
+            for statement in get_schema(config_name, bucket_size):
+                db_conn.execute(statement)
+            db_conn.execute('insert or ignore into meta_{} (key, value) values (?, ?)'.format(config_name),
+                            ('bucket_size', bucket_size))
+            if summary_version < SUMMARY_VERSION:
+                for statement in get_backfill_statements(config_name, bucket_size):
+                    db_conn.execute(statement)
+                db_conn.execute('insert or replace into meta_{} (key, value) values (?, ?)'.format(config_name),
+                                ('summary_version', SUMMARY_VERSION))
+    finally:
+        db_conn.close()
+    return bucket_size
+
+
+def new_shard_id():
+    # <host>_<pid>_<random suffix>: the pid alone is not unique, as pids are recycled (e.g. in every new container)
+    # and the shard of a later process must not be mistaken for one that was merged before
+    return '{}_{}_{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def get_shard_path(db_path, shard_id):
+    # Shards live next to the database they are merged into: <name>.shard_<shard_id>.db for <name>.db
+    root, ext = os.path.splitext(db_path)
+    return '{}.shard_{}{}'.format(root, shard_id, ext)
+
+
+def find_shards(db_path):
+    root, ext = os.path.splitext(db_path)
+    return sorted(glob.glob(glob.escape(root) + '.shard_*' + glob.escape(ext)))
+
+
+def merge_shard(db_conn, config_name, shard_path):
+    # Merges the rows of a shard into the database of db_conn (created with init_info_db), in one transaction.
+    # Code coverage rows are deduplicated by keeping the earliest step a sequence point was covered at; the summary
+    # tables are updated by the triggers. Shards are recorded in the meta table by file name, and a shard that was
+    # merged before is skipped. Returns whether the shard was merged.
+    merged_key = 'merged_shard:{}'.format(os.path.basename(shard_path))
+    if get_meta(db_conn, config_name, merged_key) is not None:
+        return False
+    db_conn.execute('attach database ? as shard', (shard_path,))
+    try:
+        shard_tables = {row[0] for row in db_conn.execute("select name from shard.sqlite_master where type = 'table'")}
+        with db_conn:
+            for table, columns in APPEND_TABLES:
+                if '{}_{}'.format(table, config_name) in shard_tables:
+                    db_conn.execute('insert into main.{0}_{1} ({2}) select {2} from shard.{0}_{1}'
+                                    .format(table, config_name, columns))
+            if 'codecov_{}'.format(config_name) in shard_tables:
+                db_conn.execute("""insert into main.codecov_{0} (seqpt_id, step_num)
+                                     select seqpt_id, step_num from shard.codecov_{0} where true
+                                     on conflict (seqpt_id) do update set step_num = excluded.step_num
+                                         where excluded.step_num < step_num""".format(config_name))
+            db_conn.execute('insert into main.meta_{} (key, value) values (?, ?)'.format(config_name), (merged_key, 1))
+    finally:
+        db_conn.execute('detach database shard')
+    return True
+
+
+class BufferedDBWriterException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class BufferedDBWriter:
+    # Writes rows to a SQLite database from a background thread. Rows are queued by insert() and written with
+    # executemany, grouped by statement, in one transaction per flush. A flush happens every flush_interval
+    # seconds, once max_batch_rows rows are queued, or on flush()/close(). Errors raised on the writer thread are
+    # re-raised by the next call into the writer.
+
+    def __init__(self, db_path, init_statements=(), flush_interval=1.0, max_batch_rows=50000):
+        self._db_path = db_path
+        self._init_statements = list(init_statements)
+        self._flush_interval = flush_interval
+        self._max_batch_rows = max_batch_rows
+        self._queue = queue.Queue()
+        self._error = None
+        self._closed = False
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='BufferedDBWriter', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        self._check_error()
+
+    def _check_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise BufferedDBWriterException('failed to write to {}: {}'.format(self._db_path, error))
+
+    def _write(self, db_conn, pending):
+        with db_conn:
+            for sql, rows in pending.items():
+                db_conn.executemany(sql, rows)
+
+    def _run(self):
+        try:
+            db_conn = sqlite3.connect(self._db_path)
+            for pragma in DB_PRAGMAS:
+                db_conn.execute(pragma)
+            with db_conn:
+                for statement in self._init_statements:
+                    db_conn.execute(statement)
+        except Exception as e:
+            self._error = e
+            self._started.set()
+            return
+        self._started.set()
+        pending = dict()
+        num_pending = 0
+        deadline = time.monotonic() + self._flush_interval
+        stop = False
+        while not stop:
+            flush_events = []
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            while item is not None:
+                kind, payload = item
+                if kind == 'rows':
+                    sql, rows = payload
+                    pending.setdefault(sql, []).extend(rows)
+                    num_pending += len(rows)
+                elif kind == 'flush':
+                    flush_events.append(payload)
+                else: # close
+                    flush_events.append(payload)
+                    stop = True
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            if num_pending > 0 and (len(flush_events) > 0 or num_pending >= self._max_batch_rows or
+                                    time.monotonic() >= deadline):
+                try:
+                    self._write(db_conn, pending)
+                except Exception as e:
+                    self._error = e
+                pending = dict()
+                num_pending = 0
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self._flush_interval
+            for event in flush_events:
+                event.set()
+        db_conn.close()
+
+    def insert(self, sql, rows):
+        # rows is a sequence of parameter tuples for sql
+        self._check_error()
+        if self._closed:
+            raise BufferedDBWriterException('writer for {} is closed'.format(self._db_path))
+        if len(rows) > 0:
+            self._queue.put(('rows', (sql, list(rows))))
+
+    def flush(self):
+        # Blocks until all rows queued so far are committed
+        event = threading.Event()
+        self._queue.put(('flush', event))
+        event.wait()
+        self._check_error()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            event = threading.Event()
+            self._queue.put(('close', event))
+            event.wait()
+            self._thread.join()
+        self._check_error()
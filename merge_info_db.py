@@ -0,0 +1,48 @@
+import argparse
+import json
+import os
+import sqlite3
+from info_db import init_info_db, find_shards, merge_shard, DB_PRAGMAS, DEFAULT_BUCKET_SIZE
+
+def merge_info_db(game_config, keep_shards=False, vacuum=False, shard_paths=None):
+    # Merges the shards written with 'info_db_sharded' into info_db_path and deletes them (unless keep_shards;
+    # shards that were kept are skipped by later merges, and are never deleted by them).
+    # Only run this once the processes writing to the shards have exited: without shard_paths, every shard of
+    # info_db_path is merged, including those of other runs sharing it.
+    config_name = game_config['config_name']
+    db_path = game_config['info_db_path']
+    if shard_paths is None:
+        shard_paths = find_shards(db_path)
+    init_info_db(db_path, config_name,
+                 game_config['info_db_bucket_size'] if 'info_db_bucket_size' in game_config else DEFAULT_BUCKET_SIZE)
+    db_conn = sqlite3.connect(db_path)
+    try:
+        for pragma in DB_PRAGMAS:
+            db_conn.execute(pragma)
+        for shard_path in shard_paths:
+            if not merge_shard(db_conn, config_name, shard_path):
+                print('Skipped shard (already merged): {}'.format(shard_path))
+                continue
+            print('Merged shard: {}'.format(shard_path))
+            if not keep_shards:
+                for path in [shard_path, shard_path + '-wal', shard_path + '-shm']:
+                    if os.path.exists(path):
+                        os.remove(path)
+        if vacuum:
+            print('Compacting: {}'.format(db_path))
+            db_conn.execute('vacuum')
+        db_conn.execute('pragma wal_checkpoint(truncate)')
+    finally:
+        db_conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merges the per-process info database shards of a configuration')
+    parser.add_argument('--keep-shards', dest='keep_shards', default=False, action='store_true',
+                        help='keep the shard files after merging them')
+    parser.add_argument('--vacuum', default=False, action='store_true', help='compact the merged database')
+    parser.add_argument('config', metavar='CONFIG')
+    args = parser.parse_args()
+
+    with open(os.path.abspath(args.config), 'r') as f:
+        game_config = json.loads(f.read())
+    merge_info_db(game_config, args.keep_shards, args.vacuum)
@@ -0,0 +1,169 @@
+import os
+import queue
+import threading
+import numpy as np
+
+# One index record per dumped step: the step number, and the chunk and row within the chunk holding the observation
+INDEX_DTYPE = np.dtype([('step_num', '<i8'), ('chunk', '<i4'), ('row', '<i4')])
+INDEX_FILE = 'index.bin'
+OBSERVATION_KEYS = ('obs', 'action_mask')
+
+
+def _chunk_path(dump_dir, chunk, key=None):
+    if key is None:
+        return os.path.join(dump_dir, 'chunk_{:06d}.npz'.format(chunk))
+    else:
+        return os.path.join(dump_dir, 'chunk_{:06d}.{}.npy'.format(chunk, key))
+
+
+class ObservationDumpException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class ObservationDumpWriter:
+    # Append-only store of sampled observation batches. Each dumped step is one row of a chunk; full chunks are
+    # written by a background thread, either as one compressed .npz file, or (compress=False) as one .npy file per
+    # observation key, which the reader can memory-map. The index file is appended after each chunk is written, so
+    # it only ever refers to complete chunks. A step is dumped with probability sample_rate, drawn from a generator
+    # seeded with seed.
+
+    def __init__(self, dump_dir, sample_rate=0.05, seed=None, chunk_size=64, compress=True, max_queued_chunks=4):
+        self._dump_dir = dump_dir
+        if not os.path.exists(dump_dir):
+            os.makedirs(dump_dir)
+        self._sample_rate = sample_rate
+        self._rng = np.random.default_rng(seed)
+        self._chunk_size = chunk_size
+        self._compress = compress
+        # appending to an existing store continues after its last chunk
+        existing = ObservationDumpReader(dump_dir).get_index()
+        self._next_chunk = int(existing['chunk'].max()) + 1 if len(existing) > 0 else 0
+        self._rows = {key: [] for key in OBSERVATION_KEYS}
+        self._step_nums = []
+        self._queue = queue.Queue(maxsize=max_queued_chunks)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='ObservationDumpWriter', daemon=True)
+        self._thread.start()
+
+    def _check_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise ObservationDumpException('failed to write observation dump to {}: {}'.format(self._dump_dir, error))
+
+    def _write_chunk(self, chunk, step_nums, arrays):
+        if self._compress:
+            tmp_path = _chunk_path(self._dump_dir, chunk) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, step_num=step_nums, **arrays)
+            os.replace(tmp_path, _chunk_path(self._dump_dir, chunk))
+        else:
+            for key, arr in arrays.items():
+                tmp_path = _chunk_path(self._dump_dir, chunk, key) + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, arr)
+                os.replace(tmp_path, _chunk_path(self._dump_dir, chunk, key))
+        index = np.zeros(len(step_nums), dtype=INDEX_DTYPE)
+        index['step_num'] = step_nums
+        index['chunk'] = chunk
+        index['row'] = np.arange(len(step_nums))
+        with open(os.path.join(self._dump_dir, INDEX_FILE), 'ab') as f:
+            f.write(index.tobytes())
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_chunk(*item)
+            except Exception as e:
+                self._error = e
+
+    def _submit_chunk(self):
+        if len(self._step_nums) == 0:
+            return
+        arrays = {key: np.stack(rows) for key, rows in self._rows.items()}
+        self._queue.put((self._next_chunk, np.array(self._step_nums, dtype=np.int64), arrays))
+        self._next_chunk += 1
+        self._rows = {key: [] for key in OBSERVATION_KEYS}
+        self._step_nums = []
+
+    def maybe_append(self, step_num, observation):
+        # Dumps the observation batch with probability sample_rate; returns whether it was dumped
+        if self._rng.random() >= self._sample_rate:
+            return False
+        self.append(step_num, observation)
+        return True
+
+    def append(self, step_num, observation):
+        self._check_error()
+        if self._closed:
+            raise ObservationDumpException('observation dump writer is closed')
+        # the observation may be a view into buffers the vector env reuses, so rows are always copied
+        for key in OBSERVATION_KEYS:
+            self._rows[key].append(np.array(observation[key]))
+        self._step_nums.append(step_num)
+        if len(self._step_nums) >= self._chunk_size:
+            self._submit_chunk()
+
+    def close(self):
+        if self._closed:
+            return
+        self._submit_chunk()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._check_error()
+
+
+class ObservationDumpReader:
+    def __init__(self, dump_dir):
+        self._dump_dir = dump_dir
+        self._index = None
+
+    def get_index(self):
+        if self._index is None:
+            index_path = os.path.join(self._dump_dir, INDEX_FILE)
+            self._index = np.fromfile(index_path, dtype=INDEX_DTYPE) if os.path.exists(index_path) \
+                else np.zeros(0, dtype=INDEX_DTYPE)
+        return self._index
+
+    def get_step_nums(self):
+        return self.get_index()['step_num']
+
+    def get_chunks(self):
+        return np.unique(self.get_index()['chunk'])
+
+    def load_chunk(self, chunk, mmap=False):
+        # Returns a dict with the 'step_num' array and one (rows, num_envs, ...) array per observation key.
+        # mmap=True maps uncompressed chunks instead of reading them; compressed chunks are always decompressed.
+        if os.path.exists(_chunk_path(self._dump_dir, chunk)):
+            with np.load(_chunk_path(self._dump_dir, chunk)) as data:
+                return {key: data[key] for key in data.files}
+        index = self.get_index()
+        result = {'step_num': index['step_num'][index['chunk'] == chunk]}
+        for key in OBSERVATION_KEYS:
+            path = _chunk_path(self._dump_dir, chunk, key)
+            if not os.path.exists(path):
+                raise ObservationDumpException('missing chunk file {}'.format(path))
+            result[key] = np.load(path, mmap_mode='r' if mmap else None)
+        return result
+
+    def __iter__(self):
+        # yields (step_num, {'obs', 'action_mask'}) for every dumped step, in the order they were dumped
+        for chunk in self.get_chunks():
+            data = self.load_chunk(chunk)
+            for row, step_num in enumerate(data['step_num']):
+                yield int(step_num), {key: data[key][row] for key in OBSERVATION_KEYS}
+
+    def get(self, step_num, mmap=False):
+        index = self.get_index()
+        matches = np.flatnonzero(index['step_num'] == step_num)
+        if len(matches) == 0:
+            raise KeyError(step_num)
+        record = index[matches[-1]]
+        data = self.load_chunk(int(record['chunk']), mmap=mmap)
+        return {key: data[key][int(record['row'])] for key in OBSERVATION_KEYS}
@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import nullcontext
+import numpy as np
+
+# Stage timings measured inside an env are returned in its info dict under PROFILE_INFO_PREFIX + stage name, as
+# (start_ns, duration_ns) tuples taken with time.perf_counter_ns (a system-wide clock, so the timestamps of env
+# worker processes line up with the ones of the trainer)
+PROFILE_INFO_PREFIX = 'profile/'
+
+# Histogram bins are log-spaced, HISTOGRAM_BINS_PER_DECADE per power of ten, from 1ns up to 10**HISTOGRAM_DECADES ns
+HISTOGRAM_BINS_PER_DECADE = 10
+HISTOGRAM_DECADES = 11
+HISTOGRAM_BIN_EDGES = 10.0**(np.arange(1, HISTOGRAM_DECADES*HISTOGRAM_BINS_PER_DECADE + 1)/HISTOGRAM_BINS_PER_DECADE)
+
+_NULL_STAGE = nullcontext()
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = np.zeros(len(HISTOGRAM_BIN_EDGES), dtype=np.int64)
+        self.num = 0
+        self.sum = 0
+        self.sum_squares = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, duration_ns):
+        if duration_ns < 1:
+            index = 0
+        else:
+            index = min(int(math.log10(duration_ns)*HISTOGRAM_BINS_PER_DECADE), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.num += 1
+        self.sum += duration_ns
+        self.sum_squares += float(duration_ns)*duration_ns
+        self.min = duration_ns if self.min is None else min(self.min, duration_ns)
+        self.max = duration_ns if self.max is None else max(self.max, duration_ns)
+
+    def get_mean(self):
+        return self.sum/self.num if self.num > 0 else 0.0
+
+    def get_percentile(self, q):
+        # upper edge of the bin holding the q-th percentile (an overestimate by at most one bin width)
+        if self.num == 0:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), math.ceil(q/100.0*self.num)))
+        return min(float(HISTOGRAM_BIN_EDGES[index]), float(self.max))
+
+
+class TraceWriter:
+    # Writes complete ('X') events in the Chrome trace event format, which chrome://tracing and Perfetto can load.
+    # Events are buffered and appended to the file in batches.
+
+    def __init__(self, trace_path, flush_events=10000):
+        trace_dir = os.path.dirname(trace_path)
+        if trace_dir != '' and not os.path.exists(trace_dir):
+            os.makedirs(trace_dir)
+        self._file = open(trace_path, 'w')
+        self._file.write('[\n')
+        self._first = True
+        self._pending = []
+        self._flush_events = flush_events
+        self._pid = os.getpid()
+
+    def add(self, name, start_ns, duration_ns, tid):
+        self._pending.append({'name': name, 'ph': 'X', 'ts': start_ns/1000.0, 'dur': duration_ns/1000.0,
+                              'pid': self._pid, 'tid': tid})
+        if len(self._pending) >= self._flush_events:
+            self.flush()
+
+    def flush(self):
+        for event in self._pending:
+            if not self._first:
+                self._file.write(',\n')
+            self._file.write(json.dumps(event))
+            self._first = False
+        self._pending = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.write('\n]\n')
+        self._file.close()
+
+
+class StageProfiler:
+    # Times the stages of the training loop with perf_counter_ns and aggregates them into per-stage histograms,
+    # which write_summary() adds to TensorBoard and then resets. Env stage timings are taken from the info dict of
+    # the vector env by record_info(). When disabled, stage() returns a shared no-op context manager, so the
+    # instrumentation can stay in place at no measurable cost.
+
+    def __init__(self, enabled=True, trace_path=None):
+        self._enabled = enabled
+        self._histograms = dict()
+        self._trace = TraceWriter(trace_path) if enabled and trace_path is not None else None
+        self._lock = threading.Lock()
+
+    def is_enabled(self):
+        return self._enabled
+
+    def stage(self, name):
+        if not self._enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, start_ns, duration_ns, tid=0):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LatencyHistogram()
+            self._histograms[name].add(duration_ns)
+            if self._trace is not None:
+                self._trace.add(name, start_ns, duration_ns, tid)
+
+    def record_info(self, info):
+        # env i is traced on thread i + 1; thread 0 is the training loop
+        if not self._enabled:
+            return
+        for key in info:
+            if key.startswith(PROFILE_INFO_PREFIX):
+                name = key[len(PROFILE_INFO_PREFIX):]
+                timings = info[key]
+                mask = info['_' + key]
+                for i in range(len(timings)):
+                    if mask[i]:
+                        start_ns, duration_ns = timings[i]
+                        self.record(name, start_ns, duration_ns, tid=i + 1)
+
+    def get_histograms(self):
+        with self._lock:
+            return dict(self._histograms)
+
+    def write_summary(self, writer, step_num):
+        if not self._enabled:
+            return
+        with self._lock:
+            histograms = self._histograms
+            self._histograms = dict()
+        for name, hist in sorted(histograms.items()):
+            writer.add_scalar('profile/{}/mean_ms'.format(name), hist.get_mean()/1e6, step_num)
+            writer.add_scalar('profile/{}/p50_ms'.format(name), hist.get_percentile(50)/1e6, step_num)
+            writer.add_scalar('profile/{}/p99_ms'.format(name), hist.get_percentile(99)/1e6, step_num)
+            nonzero = np.flatnonzero(hist.counts)
+            bins = slice(nonzero[0], nonzero[-1] + 1)
+            writer.add_histogram_raw('profile/{}/latency_ms'.format(name), min=hist.min/1e6, max=hist.max/1e6,
+                                     num=hist.num, sum=hist.sum/1e6, sum_squares=hist.sum_squares/1e12,
+                                     bucket_limits=(HISTOGRAM_BIN_EDGES[bins]/1e6).tolist(),
+                                     bucket_counts=hist.counts[bins].tolist(), global_step=step_num)
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._profiler.record(self._name, self._start, time.perf_counter_ns() - self._start)
+        return False
+
+
+class StageTimings:
+    # Collects the stage timings of one env step/reset, to be returned in its info dict (see PROFILE_INFO_PREFIX)
+
+    def __init__(self, enabled=True):
+        self._enabled = enabled
+        self._timings = dict()
+
+    def stage(self, name):
+        if not self._enabled:
+            return _NULL_STAGE
+        return _TimedStage(self._timings, name)
+
+    def add_to_info(self, info):
+        # returns info with the timings collected since the last call added
+        if not self._enabled or len(self._timings) == 0:
+            return info
+        info = dict(info)
+        for name, timing in self._timings.items():
+            info[PROFILE_INFO_PREFIX + name] = timing
+        self._timings = dict()
+        return info
+
+
+class _TimedStage:
+    def __init__(self, timings, name):
+        self._timings = timings
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._timings[self._name] = (self._start, time.perf_counter_ns() - self._start)
+        return False
+
+
+def make_profiler(game_config):
+    # env_config 'profile' turns on the stage timings; 'profile_trace_path' additionally writes every timed stage
+    # to a trace file
+    env_config = game_config['env_config']
+    enabled = env_config['profile'] if 'profile' in env_config else False
+    trace_path = game_config['profile_trace_path'] if 'profile_trace_path' in game_config else None
+    return StageProfiler(enabled=enabled, trace_path=trace_path)
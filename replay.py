@@ -0,0 +1,327 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+import torch
+from trainer_log import get_logger
+
+logger = get_logger('replay')
+
+
+class PrefetchSamplerException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class PrefetchSampler:
+    # Samples batches from a replay buffer on a background thread, up to num_prefetch batches ahead of the
+    # trainer. Batches are dicts of tensors copied into a fixed set of preallocated buffers: the batch returned by
+    # sample() stays valid until the next call to sample(), after which its buffers are reused. All access to the
+    # replay buffer has to go through add()/get_stored_size() (or hold get_lock()), since the buffer is not
+    # thread-safe. Errors raised on the sampler thread are re-raised by the next call to sample().
+
+    def __init__(self, rb, batch_size, device, num_prefetch=2):
+        self._rb = rb
+        self._batch_size = batch_size
+        self._device = device
+        self._lock = threading.Lock()
+        self._ready = queue.Queue()
+        self._free = queue.Queue()
+        self._slots = None
+        self._num_slots = num_prefetch + 1
+        self._current = None
+        self._error = None
+        self._closed = False
+        self._stored = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._run, name='PrefetchSampler', daemon=True)
+        self._thread.start()
+
+    def _check_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise PrefetchSamplerException('failed to sample replay buffer: {}'.format(error))
+
+    def _make_slot(self, sample):
+        return {key: torch.empty(value.shape, dtype=torch.from_numpy(value[:0]).dtype, device=self._device)
+                for key, value in sample.items()}
+
+    def _run(self):
+        try:
+            while True:
+                with self._stored:
+                    while not self._closed and self._rb.get_stored_size() < self._batch_size:
+                        self._stored.wait()
+                    if self._closed:
+                        break
+                    sample = self._rb.sample(self._batch_size)
+                if self._slots is None:
+                    # buffers are allocated on the first batch, once the shapes and dtypes of the fields are known
+                    self._slots = [self._make_slot(sample) for _ in range(self._num_slots)]
+                    for slot in self._slots:
+                        self._free.put(slot)
+                slot = self._free.get()
+                if slot is None:
+                    break
+                for key, value in sample.items():
+                    slot[key].copy_(torch.from_numpy(value))
+                self._ready.put(slot)
+        except Exception as e:
+            self._error = e
+            self._ready.put(None)
+
+    def get_lock(self):
+        return self._lock
+
+    def add(self, **kwargs):
+        with self._stored:
+            self._rb.add(**kwargs)
+            self._stored.notify()
+
+    def get_stored_size(self):
+        with self._lock:
+            return self._rb.get_stored_size()
+
+    def sample(self):
+        # blocks until a batch is ready (the replay buffer has to hold at least batch_size transitions)
+        self._check_error()
+        if self._closed:
+            raise PrefetchSamplerException('sampler is closed')
+        if self._current is not None:
+            self._free.put(self._current)
+            self._current = None
+        batch = self._ready.get()
+        if batch is None:
+            self._check_error()
+        self._current = batch
+        return batch
+
+    def close(self):
+        if self._closed:
+            return
+        with self._stored:
+            self._closed = True
+            self._stored.notify()
+        self._free.put(None)
+        self._thread.join()
+
+
+class FrameStackReplayBuffer:
+    # Replay buffer for stacked image observations that stores every distinct frame once. A transition holds the
+    # frame ids of its obs and next_obs stacks, and the stacks are gathered from the frame store at sample time.
+    # When a stack is added, each of its layers is matched against the frame expected in that position (the obs
+    # shifted by one step for next_obs, the previous next_obs of the same env for obs), the layer before it, and the
+    # other frames of that stack, and only stored as a new frame if none of them matches; the frames therefore
+    # always come out exactly as added, across episode boundaries and resets.
+    # Frames are reference counted and freed when the last transition using them is overwritten. A full buffer holds
+    # one frame per transition plus the older frames of the oldest and newest stacks of every env (num_envs is the
+    # number of envs adding to the buffer); the frame store is preallocated for that and grows in small steps if it
+    # runs out. Rows of add() belong to the envs given by env_ids (by default, row i to env i). The add, sample and
+    # get_stored_size interface matches cpprb's ReplayBuffer for the fields used by the DQN trainer.
+
+    def __init__(self, size, obs_shape, num_actions, num_envs=1, obs_dtype=np.uint8, act_mask_dtype=np.float32,
+                 seed=None):
+        self._size = size
+        self._stack_len = obs_shape[0]
+        self._frame_shape = tuple(obs_shape[1:])
+        self._grow_step = max(16, size//32)
+        self._frames = np.zeros((size + num_envs*(self._stack_len + 1) + self._grow_step,) + self._frame_shape,
+                                dtype=obs_dtype)
+        self._refcounts = np.zeros(len(self._frames), dtype=np.int64)
+        self._free_frames = list(range(len(self._frames) - 1, -1, -1))
+        self._obs_ids = np.full((size, self._stack_len), -1, dtype=np.int64)
+        self._next_obs_ids = np.full((size, self._stack_len), -1, dtype=np.int64)
+        self._act = np.zeros((size, 1), dtype=np.int_)
+        self._rew = np.zeros((size, 1), dtype=np.float32)
+        self._next_act_mask = np.zeros((size, num_actions), dtype=act_mask_dtype)
+        self._done = np.zeros((size, 1), dtype=np.bool_)
+        self._next_index = 0
+        self._stored = 0
+        # frame ids of the last next_obs added for every env, which is expected to be its next obs
+        self._last_stack = dict()
+        self._rng = np.random.default_rng(seed)
+
+    def _alloc_frame(self, frame):
+        if len(self._free_frames) == 0:
+            num_frames = len(self._frames)
+            self._frames = np.concatenate([self._frames,
+                                           np.zeros((self._grow_step,) + self._frame_shape, dtype=self._frames.dtype)])
+            self._refcounts = np.concatenate([self._refcounts, np.zeros(self._grow_step, dtype=self._refcounts.dtype)])
+            self._free_frames = list(range(num_frames + self._grow_step - 1, num_frames - 1, -1))
+        frame_id = self._free_frames.pop()
+        self._frames[frame_id] = frame
+        return frame_id
+
+    def _store_stack(self, stack, expected_ids, ref_ids):
+        # returns the frame ids of stack, reusing the expected frame of every layer, the one of the layer before, or
+        # any other frame of the reference stack (stacks padded at the start of an episode do not shift by one)
+        ids = np.empty(self._stack_len, dtype=np.int64)
+        for k in range(self._stack_len):
+            expected_id = expected_ids[k] if expected_ids is not None else -1
+            if expected_id >= 0 and np.array_equal(self._frames[expected_id], stack[k]):
+                ids[k] = expected_id
+            elif k > 0 and np.array_equal(stack[k - 1], stack[k]):
+                ids[k] = ids[k - 1]
+            else:
+                ids[k] = -1
+                if ref_ids is not None:
+                    for ref_id in ref_ids:
+                        if ref_id != expected_id and np.array_equal(self._frames[ref_id], stack[k]):
+                            ids[k] = ref_id
+                            break
+                if ids[k] < 0:
+                    ids[k] = self._alloc_frame(stack[k])
+        return ids
+
+    def _incref(self, ids):
+        np.add.at(self._refcounts, ids, 1)
+
+    def _decref(self, ids):
+        np.add.at(self._refcounts, ids, -1)
+        for frame_id in np.unique(ids):
+            if self._refcounts[frame_id] == 0:
+                self._free_frames.append(int(frame_id))
+
+    def add(self, obs, act, rew, next_obs, next_act_mask, done, env_ids=None):
+        obs = np.asarray(obs)
+        if obs.ndim == len(self._frame_shape) + 1:
+            obs, act, rew, next_obs, next_act_mask, done = \
+                obs[np.newaxis], [act], [rew], np.asarray(next_obs)[np.newaxis], [next_act_mask], [done]
+        if env_ids is None:
+            env_ids = range(len(obs))
+        act = np.asarray(act).reshape(-1)
+        rew = np.asarray(rew).reshape(-1)
+        done = np.asarray(done).reshape(-1)
+        for i, env_id in enumerate(env_ids):
+            env_id = int(env_id)
+            last_stack = self._last_stack.get(env_id)
+            obs_ids = self._store_stack(obs[i], last_stack, last_stack)
+            # references are taken before the overwritten transition releases its own, which may share frames
+            self._incref(obs_ids)
+            shifted = np.full(self._stack_len, -1, dtype=np.int64)
+            shifted[:-1] = obs_ids[1:]
+            next_obs_ids = self._store_stack(next_obs[i], shifted, obs_ids)
+            self._incref(next_obs_ids)
+            index = self._next_index
+            if self._stored == self._size:
+                self._decref(self._obs_ids[index])
+                self._decref(self._next_obs_ids[index])
+            self._obs_ids[index] = obs_ids
+            self._next_obs_ids[index] = next_obs_ids
+            self._act[index] = act[i]
+            self._rew[index] = rew[i]
+            self._next_act_mask[index] = next_act_mask[i]
+            self._done[index] = done[i]
+            # the env's last stack keeps its frames alive until it is replaced
+            if env_id in self._last_stack:
+                self._decref(self._last_stack[env_id])
+            self._incref(next_obs_ids)
+            self._last_stack[env_id] = next_obs_ids
+            self._next_index = (index + 1) % self._size
+            self._stored = min(self._stored + 1, self._size)
+
+    def get_stored_size(self):
+        return self._stored
+
+    def get_num_frames(self):
+        return int(np.count_nonzero(self._refcounts))
+
+    def get_frame_capacity(self):
+        return len(self._frames)
+
+    def sample(self, batch_size):
+        idx = self._rng.integers(0, self._stored, size=batch_size)
+        return {
+            'obs': self._frames[self._obs_ids[idx]],
+            'act': self._act[idx],
+            'rew': self._rew[idx],
+            'next_obs': self._frames[self._next_obs_ids[idx]],
+            'next_act_mask': self._next_act_mask[idx],
+            'done': self._done[idx]
+        }
+
+
+class MmapReplayBufferException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class MmapReplayBuffer:
+    # Replay buffer stored in memory-mapped files in directory, one .npy file per field of env_dict (which has the
+    # same format as cpprb's), so that its size is not limited by RAM and the OS page cache keeps the hot parts in
+    # memory. flush() writes the data to disk and then records the write cursor in cursor.json; an existing buffer
+    # reopens at the last flushed cursor, so a trainer that flushes the buffer before saving a checkpoint resumes
+    # with the transitions that were added up to that checkpoint. Transitions added after the last flush are not
+    # counted after a restart, but those that replaced the oldest transitions of a full buffer stay in it until the
+    # cursor overwrites them again.
+
+    CURSOR_FILE = 'cursor.json'
+
+    def __init__(self, size, env_dict, directory, seed=None):
+        self._size = size
+        self._directory = directory
+        self._shapes = {name: self._get_shape(field) for name, field in env_dict.items()}
+        if not os.path.exists(directory):
+            logger.info('Creating directory: %s', directory)
+            os.makedirs(directory)
+        cursor_path = os.path.join(directory, MmapReplayBuffer.CURSOR_FILE)
+        if os.path.exists(cursor_path):
+            with open(cursor_path, 'r') as f:
+                cursor = json.loads(f.read())
+            if cursor['size'] != size:
+                raise MmapReplayBufferException('replay buffer in {} has size {}, expected {}'.format(
+                    directory, cursor['size'], size))
+            self._next_index = cursor['next_index']
+            self._stored = cursor['stored']
+        else:
+            self._next_index = 0
+            self._stored = 0
+        self._arrays = dict()
+        for name, field in env_dict.items():
+            dtype = np.dtype(field['dtype'] if 'dtype' in field else np.float32)
+            shape = (size,) + self._shapes[name]
+            path = os.path.join(directory, name + '.npy')
+            if os.path.exists(cursor_path):
+                array = np.lib.format.open_memmap(path, mode='r+')
+                if array.shape != shape or array.dtype != dtype:
+                    raise MmapReplayBufferException(
+                        "field '{}' of replay buffer in {} has shape {} and dtype {}, expected {} and {}".format(
+                            name, directory, array.shape, array.dtype, shape, dtype))
+            else:
+                array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+            self._arrays[name] = array
+        if not os.path.exists(cursor_path):
+            self.flush()
+        self._rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def _get_shape(field):
+        # like cpprb, scalar fields are stored (and sampled) with shape (1,)
+        shape = field['shape'] if 'shape' in field else 1
+        return tuple(shape) if isinstance(shape, (tuple, list)) else (shape,)
+
+    def add(self, **kwargs):
+        # fields missing from env_dict are ignored, as in cpprb
+        values = {name: np.asarray(kwargs[name]).reshape((-1,) + shape) for name, shape in self._shapes.items()}
+        num_added = len(next(iter(values.values())))
+        idx = (self._next_index + np.arange(num_added)) % self._size
+        for name, value in values.items():
+            self._arrays[name][idx] = value
+        self._next_index = int((self._next_index + num_added) % self._size)
+        self._stored = min(self._stored + num_added, self._size)
+
+    def get_stored_size(self):
+        return self._stored
+
+    def sample(self, batch_size):
+        idx = np.sort(self._rng.integers(0, self._stored, size=batch_size))
+        return {name: array[idx] for name, array in self._arrays.items()}
+
+    def flush(self):
+        for array in self._arrays.values():
+            array.flush()
+        cursor_path = os.path.join(self._directory, MmapReplayBuffer.CURSOR_FILE)
+        with open(cursor_path + '.tmp', 'w') as f:
+            f.write(json.dumps({'size': self._size, 'next_index': self._next_index, 'stored': self._stored}))
+        os.replace(cursor_path + '.tmp', cursor_path)
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sqlite3
+from info_db import init_info_db, get_meta, find_shards, DEFAULT_BUCKET_SIZE
+from coverage_worker import CoverageIndex
+
+def query_curve(db_conn, table, value_column):
+    # (bucket, value in bucket, cumulative value) rows of a per-bucket summary table
+    rows = db_conn.execute('select bucket, {} from {} order by bucket'.format(value_column, table)).fetchall()
+    curve = []
+    total = 0
+    for bucket, value in rows:
+        total += value
+        curve.append((bucket, value, total))
+    return curve
+
+def print_curve(title, curve, bucket_size, value_name):
+    print('{} (per {} steps):'.format(title, bucket_size))
+    print('  {:>12} {:>12} {:>12}'.format('step', value_name, 'total'))
+    for bucket, value, total in curve:
+        print('  {:>12} {:>12} {:>12}'.format((bucket + 1)*bucket_size, value, total))
+
+def report(game_config, show_curves):
+    config_name = game_config['config_name']
+    db_path = game_config['info_db_path']
+    if not os.path.exists(db_path):
+        raise Exception('info database not found: {}'.format(db_path))
+    if len(find_shards(db_path)) > 0:
+        print('Warning: {} has shards that may not be merged yet, see merge_info_db.py'.format(db_path))
+    # creates the summary tables of databases written by older versions
+    init_info_db(db_path, config_name)
+    db_conn = sqlite3.connect(db_path)
+    try:
+        bucket_size = get_meta(db_conn, config_name, 'bucket_size', DEFAULT_BUCKET_SIZE)
+        state_curve = query_curve(db_conn, 'state_buckets_{}'.format(config_name), 'new_states')
+        codecov_curve = query_curve(db_conn, 'codecov_buckets_{}'.format(config_name), 'new_seqpts')
+        action_rows = db_conn.execute('select bucket, num_samples, sum_valid_actions from action_buckets_{} order by bucket'
+                                      .format(config_name)).fetchall()
+    finally:
+        db_conn.close()
+
+    print('State coverage: {} distinct states'.format(state_curve[-1][2] if len(state_curve) > 0 else 0))
+    num_covered = codecov_curve[-1][2] if len(codecov_curve) > 0 else 0
+    coverage_json_path = os.path.join(os.path.dirname(game_config['game_exe']), 'coverage.json')
+    if os.path.exists(coverage_json_path):
+        num_seqpts = len(CoverageIndex(coverage_json_path).seqpt_ids)
+        print('Code coverage: {}/{} sequence points ({:.2f}%)'.format(num_covered, num_seqpts,
+                                                                    100.0*num_covered/max(num_seqpts, 1)))
+    else:
+        print('Code coverage: {} sequence points'.format(num_covered))
+    num_samples = sum(row[1] for row in action_rows)
+    if num_samples > 0:
+        print('Valid actions: {:.2f} on average'.format(sum(row[2] for row in action_rows)/num_samples))
+
+    if show_curves:
+        print()
+        print_curve('State coverage', state_curve, bucket_size, 'new')
+        print()
+        print_curve('Code coverage', codecov_curve, bucket_size, 'new')
+        print()
+        print('Valid actions (per {} steps):'.format(bucket_size))
+        print('  {:>12} {:>12}'.format('step', 'average'))
+        for bucket, bucket_samples, sum_valid_actions in action_rows:
+            print('  {:>12} {:>12.2f}'.format((bucket + 1)*bucket_size, sum_valid_actions/bucket_samples))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prints the exploration metrics recorded in the info database of a configuration')
+    parser.add_argument('--curves', default=False, action='store_true', help='print the metrics over the course of the run')
+    parser.add_argument('config', metavar='CONFIG')
+    args = parser.parse_args()
+
+    with open(os.path.abspath(args.config), 'r') as f:
+        game_config = json.loads(f.read())
+    report(game_config, args.curves)
@@ -1,30 +1,21 @@
 import argparse
 import os
 import json
-import psutil
 from dqn_trainer import run_dqn
+from dqn_actor_learner import run_dqn_actor_learner
+from trainer_common import get_port_count
+from unity_ports import PortAllocator
 from simple_trainer import run_simple, ACTION_SELECTION_MODE_RANDOM, ACTION_SELECTION_MODE_NULL
+from trainer_log import configure_logging, get_logger
 
-def find_start_port(num_envs):
-    used_ports = set()
-    for conn in psutil.net_connections():
-        if conn.status != 'TIME_WAIT':
-            used_ports.add(conn.laddr.port)
-    start_port = 12000
-    end_port = 60000
-    num_ports = num_envs*2
-    while True:
-        if start_port + num_ports > end_port:
-            raise Exception('failed to find sufficient open port range')
-        range_ok = True
-        for port in range(start_port, start_port + num_ports):
-            if port in used_ports:
-                start_port = port+1
-                range_ok = False
-        if range_ok:
-            break
-    print('Using ports [{}, {}]'.format(start_port, start_port + num_ports - 1))
-    return start_port
+logger = get_logger('run')
+
+def reserve_ports(num_ports):
+    # the ports stay reserved until the game instances are launched on them (see PortAllocator)
+    port_allocator = PortAllocator()
+    start_port = port_allocator.reserve_range(num_ports)
+    logger.info('Using ports [%d, %d]', start_port, start_port + num_ports - 1)
+    return start_port, port_allocator
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -41,8 +32,10 @@ if __name__ == '__main__':
     game_config_path = os.path.abspath(args.config)
     with open(game_config_path, 'r') as f:
         game_config = json.loads(f.read())
+    configure_logging(game_config, args.is_predict)
+    port_allocator = None
     if args.startport is None:
-        start_port = find_start_port(game_config['num_envs'])
+        start_port, port_allocator = reserve_ports(get_port_count(game_config))
     else:
         start_port = int(args.startport)
     workdir = os.path.abspath(args.workdir)
@@ -51,10 +44,13 @@ if __name__ == '__main__':
 
     trainer_name = game_config['trainer']
     if trainer_name == 'dqn':
-        run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic)
+        if not is_predict and 'num_actors' in game_config['trainer_config'] and game_config['trainer_config']['num_actors'] > 0:
+            run_dqn_actor_learner(game_config, game_config_path, start_port, workdir, port_allocator)
+        else:
+            run_dqn(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic, port_allocator)
     elif trainer_name == 'random':
-        run_simple(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic, ACTION_SELECTION_MODE_RANDOM)
+        run_simple(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic, ACTION_SELECTION_MODE_RANDOM, port_allocator)
     elif trainer_name == 'null':
-        run_simple(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic, ACTION_SELECTION_MODE_NULL)
+        run_simple(game_config, game_config_path, start_port, workdir, is_predict, is_deterministic, ACTION_SELECTION_MODE_NULL, port_allocator)
     else:
         raise Exception("unrecognized trainer '{}'".format(trainer_name))
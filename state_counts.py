@@ -0,0 +1,143 @@
+import numpy as np
+import torch
+
+
+class StateCountTable:
+    # Visit counts of 64-bit state hashes in num_tables independent tables (e.g. one per env), stored in a single
+    # open addressing hash table (linear probing) keyed by (table id, state hash), so that the memory used grows with
+    # the number of distinct states rather than with num_tables times the largest table. increment() looks up and
+    # increments the counts of a whole batch of states in a few vectorized probing rounds (the table is kept at most
+    # half full), so its cost does not depend on the number of states stored. Cleared entries are only marked as removed (with a table id of
+    # -1) and dropped when the table is rebuilt, which happens once it is over half full.
+
+    MAX_LOAD = 0.5
+    PROBE_WIDTH = 8
+
+    def __init__(self, num_tables=1, initial_capacity=1024):
+        self._num_tables = num_tables
+        capacity = 16
+        while capacity < initial_capacity:
+            capacity *= 2
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self._capacity = capacity
+        self._used = np.zeros(capacity, dtype=np.bool_)
+        self._table_ids = np.zeros(capacity, dtype=np.int64)
+        self._keys = np.zeros(capacity, dtype=np.uint64)
+        self._counts = np.zeros(capacity, dtype=np.int64)
+        # number of entries, and of used slots (including removed entries)
+        self._size = 0
+        self._num_used = 0
+
+    def _home_slots(self, table_ids, keys):
+        # splitmix64 finalizer of the key combined with the table id (uint64 arithmetic wraps around)
+        h = keys ^ (table_ids.astype(np.uint64) * np.uint64(0x9e3779b97f4a7c15))
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        h = h ^ (h >> np.uint64(31))
+        return (h & np.uint64(self._capacity - 1)).astype(np.int64)
+
+    def _find_slots(self, table_ids, keys):
+        # returns the slots of the given (distinct) entries, inserting the missing ones with a count of 0; every
+        # round probes PROBE_WIDTH consecutive slots of each entry at once
+        slots = np.empty(len(keys), dtype=np.int64)
+        pending = np.arange(len(keys))
+        pos = self._home_slots(table_ids, keys)
+        offsets = np.arange(StateCountTable.PROBE_WIDTH)
+        while len(pending) > 0:
+            window = (pos[pending, np.newaxis] + offsets) & (self._capacity - 1)
+            used = self._used[window]
+            match = used & (self._table_ids[window] == table_ids[pending, np.newaxis]) & \
+                (self._keys[window] == keys[pending, np.newaxis])
+            # the entry is either in the first slot of the window that matches or is free, or beyond the window
+            stop = match | ~used
+            first = stop.argmax(axis=1)
+            rows = np.arange(len(pending))
+            p = window[rows, first]
+            found = match[rows, first]
+            free = np.flatnonzero(stop[rows, first] & ~found)
+            slots[pending[found]] = p[found]
+            if len(free) > 0:
+                # of the entries that stop at the same free slot, the first one takes it and the others probe it again
+                if len(free) > 1:
+                    free = free[np.unique(p[free], return_index=True)[1]]
+                free_slots = p[free]
+                self._used[free_slots] = True
+                self._table_ids[free_slots] = table_ids[pending[free]]
+                self._keys[free_slots] = keys[pending[free]]
+                self._counts[free_slots] = 0
+                slots[pending[free]] = free_slots
+                self._size += len(free)
+                self._num_used += len(free)
+                found[free] = True
+            pos[pending] = p
+            pos[pending[~stop.any(axis=1)]] += StateCountTable.PROBE_WIDTH
+            pending = pending[~found]
+        return slots
+
+    def _get_entries(self):
+        live = self._used & (self._table_ids >= 0)
+        return self._table_ids[live], self._keys[live], self._counts[live]
+
+    def _reserve(self, num_added):
+        # rebuilds the table (dropping removed entries) if adding num_added entries could leave it over half full;
+        # the capacity is doubled until the entries take at most a quarter of it, so that rebuilds stay infrequent
+        if self._num_used + num_added <= self._capacity*StateCountTable.MAX_LOAD:
+            return
+        capacity = self._capacity
+        while 2*(self._size + num_added) > capacity*StateCountTable.MAX_LOAD:
+            capacity *= 2
+        table_ids, keys, counts = self._get_entries()
+        self._alloc(capacity)
+        self._counts[self._find_slots(table_ids, keys)] = counts
+
+    def increment(self, state_hashes, table_ids=None):
+        # increments the count of each state in its table (by default, state i in table i, or every state in table 0
+        # if there is a single table) and returns the counts after each increment; repeated states are counted in
+        # order, as if they had been incremented one by one
+        keys = np.asarray(state_hashes).astype(np.int64).view(np.uint64)
+        if table_ids is None:
+            table_ids = np.zeros(len(keys), dtype=np.int64) if self._num_tables == 1 else np.arange(len(keys))
+        table_ids = np.asarray(table_ids, dtype=np.int64)
+        # repeated states are grouped by sorting, and rank is the position of every state among its repeats
+        order = np.lexsort((keys, table_ids))
+        sorted_keys, sorted_table_ids = keys[order], table_ids[order]
+        is_first = np.ones(len(keys), dtype=np.bool_)
+        is_first[1:] = (sorted_keys[1:] != sorted_keys[:-1]) | (sorted_table_ids[1:] != sorted_table_ids[:-1])
+        first = np.flatnonzero(is_first)
+        entry = np.cumsum(is_first) - 1
+        rank = np.arange(len(keys)) - first[entry]
+        self._reserve(len(first))
+        slots = self._find_slots(sorted_table_ids[first], sorted_keys[first])
+        counts = self._counts[slots]
+        self._counts[slots] = counts + np.diff(np.append(first, len(keys)))
+        result = np.empty(len(keys), dtype=np.int64)
+        result[order] = counts[entry] + rank + 1
+        return result
+
+    def clear(self, table_ids):
+        # removes all counts of the given tables
+        removed = self._used & np.isin(self._table_ids, np.asarray(table_ids, dtype=np.int64))
+        self._table_ids[removed] = -1
+        self._size -= int(np.count_nonzero(removed))
+
+    def __len__(self):
+        return self._size
+
+    def state_dict(self):
+        table_ids, keys, counts = self._get_entries()
+        return {
+            'num_tables': self._num_tables,
+            'table_ids': torch.from_numpy(table_ids),
+            'keys': torch.from_numpy(keys.view(np.int64)),
+            'counts': torch.from_numpy(counts)
+        }
+
+    def load_state_dict(self, state_dict):
+        table_ids = state_dict['table_ids'].numpy()
+        keys = state_dict['keys'].numpy().view(np.uint64)
+        self._num_tables = state_dict['num_tables']
+        self._alloc(self._capacity)
+        self._reserve(len(keys))
+        self._counts[self._find_slots(table_ids, keys)] = state_dict['counts'].numpy()
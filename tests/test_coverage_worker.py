@@ -0,0 +1,107 @@
+import glob
+import json
+import os
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+from coverage_worker import CoverageWorkerPool, CoverageIndex, CoverageWorkerException
+
+# Stand-in for 'altcover runner --collect': every coverage.json.*.acv file holds a JSON list of visited sequence
+# point ids, which are added to the visit counts in coverage.json
+FAKE_ALTCOVER = '''#!{}
+import glob, json
+with open('coverage.json') as f:
+    cov = json.load(f)
+seqpts = {{seqpt['Id']: seqpt for seqpt in cov['mod']['file']['cls']['meth']['SeqPnts']}}
+for acv in glob.glob('coverage.json.*.acv'):
+    with open(acv) as f:
+        for seqpt_id in json.load(f):
+            seqpts[seqpt_id]['VC'] += 1
+with open('coverage.json', 'w') as f:
+    json.dump(cov, f)
+'''
+
+
+class CoverageWorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = self.tmpdir.name
+        self.altcover_cmd = os.path.join(root, 'altcover')
+        with open(self.altcover_cmd, 'w') as f:
+            f.write(FAKE_ALTCOVER.format(sys.executable))
+        os.chmod(self.altcover_cmd, os.stat(self.altcover_cmd).st_mode | stat.S_IEXEC)
+        self.coverage_json_path = os.path.join(root, 'coverage.json')
+        with open(self.coverage_json_path, 'w') as f:
+            json.dump({'mod': {'file': {'cls': {'meth': {'SeqPnts': [{'Id': i, 'VC': 0} for i in range(10)]}}}}}, f)
+        with open(self.coverage_json_path + '.acv', 'w') as f:
+            json.dump([], f)
+        self.acv_dir = os.path.join(root, 'acvs')
+        os.makedirs(self.acv_dir)
+        self.covered = dict()
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def on_covered(self, seqpt_ids, step_num):
+        with self.lock:
+            for seqpt_id in seqpt_ids:
+                self.assertNotIn(seqpt_id, self.covered)
+                self.covered[seqpt_id] = step_num
+
+    def write_acv(self, name, seqpt_ids):
+        path = os.path.join(self.acv_dir, name)
+        with open(path, 'w') as f:
+            json.dump(seqpt_ids, f)
+        return path
+
+    def test_collects_all_batches(self):
+        pool = CoverageWorkerPool(self.coverage_json_path, self.tmpdir.name, self.altcover_cmd,
+                                  os.path.join(self.tmpdir.name, 'work'), self.on_covered,
+                                  num_workers=2, max_backlog=2)
+        for step_num in range(6):
+            pool.submit([self.write_acv('{}_a.acv'.format(step_num), [step_num]),
+                         self.write_acv('{}_b.acv'.format(step_num), [step_num, 0])], step_num)
+        pool.close()
+        self.assertEqual(set(self.covered.keys()), set(range(6)))
+        for seqpt_id, step_num in self.covered.items():
+            self.assertGreaterEqual(step_num, seqpt_id)
+        self.assertEqual(glob.glob(os.path.join(self.acv_dir, '*')), [])
+
+    def test_altcover_missing(self):
+        pool = CoverageWorkerPool(self.coverage_json_path, self.tmpdir.name, os.path.join(self.tmpdir.name, 'missing'),
+                                  os.path.join(self.tmpdir.name, 'work'), self.on_covered)
+        pool.submit([self.write_acv('a.acv', [0])], 0)
+        with self.assertRaises(CoverageWorkerException) as cm:
+            pool.close()
+        self.assertEqual(str(cm.exception), 'failed to process code coverage data: make sure altcover is in your PATH')
+
+
+class CoverageIndexTestCase(unittest.TestCase):
+    def write_json(self, path, cov):
+        with open(path, 'w') as f:
+            json.dump(cov, f)
+
+    def test_update(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'coverage.json')
+            seqpts = [{'VC': 0, 'SL': i, 'Id': 100 + i} for i in range(5)]
+            cov = {'mod': {'file': {'cls': {'a': {'SeqPnts': seqpts[:2]}, 'b': {'SeqPnts': seqpts[2:]}}}}}
+            self.write_json(path, cov)
+            index = CoverageIndex(path)
+            seqpts[1]['VC'] = 3
+            seqpts[4]['VC'] = 1
+            self.write_json(path, cov)
+            self.assertEqual(index.update(index.read_visit_counts(path)).tolist(), [101, 104])
+            seqpts[0]['VC'] = 2
+            # visit counts outside the SeqPnts arrays (e.g. of branch points) are ignored
+            cov['mod']['file']['cls']['b']['BranchPoints'] = [{'VC': 7, 'Id': 100}]
+            self.write_json(path, cov)
+            self.assertEqual(index.update(index.read_visit_counts(path)).tolist(), [100])
+            self.assertEqual(index.get_num_covered(), 3)
+            del cov['mod']['file']['cls']['b']['SeqPnts'][0]
+            self.write_json(path, cov)
+            with self.assertRaises(CoverageWorkerException):
+                index.read_visit_counts(path)
@@ -65,7 +65,14 @@ class StackWrapper(ObservationWrapper):
         return np.stack(channels)
 
 
-def make_env_cartpole_simple(game_config, game_config_path, workdir, port, pre_init_port, is_training):
+def make_spaces_cartpole_simple(env_config):
+    env = CartpoleSimpleWrapper(gym.make('CartPole-v1', render_mode=None))
+    spaces = env.observation_space, env.action_space
+    env.close()
+    return spaces
+
+
+def make_env_cartpole_simple(game_config, game_config_path, workdir, port, pre_init_port, is_training, port_allocator=None):
     def _init():
         return CartpoleSimpleWrapper(gym.make('CartPole-v1', render_mode=None))
     return _init
@@ -111,6 +118,7 @@ class DQNSimpleTestCase(unittest.TestCase):
 
     @patch('dqn_trainer.InfoProcessor')
     @patch('dqn_trainer.make_env', new=make_env_cartpole_simple)
+    @patch('dqn_trainer.make_spaces', new=make_spaces_cartpole_simple)
     @patch('dqn_trainer.DQNNet', new=DQNSimpleNet)
     def test_dqn_simple(self, mock_info_proc):
         game_config = DQNSimpleTestCase.game_config
@@ -0,0 +1,82 @@
+import os.path
+import shutil
+import unittest
+from unittest.mock import MagicMock, patch
+import torch
+from tensorboard.backend.event_processing import event_accumulator
+import dqn_actor_learner
+from info_db import init_info_db, get_shard_path, find_shards
+from test_dqn import DQNSimpleNet, make_env_cartpole_simple, make_spaces_cartpole_simple
+
+
+def make_info_processor(game_config, workdir, shard_id=None):
+    # only creates the shard the info processor of an actor would write to
+    init_info_db(get_shard_path(game_config['info_db_path'], shard_id), game_config['config_name'])
+    return MagicMock()
+
+
+class DQNActorLearnerTestCase(unittest.TestCase):
+    game_config = {
+        'config_name': 'cartpole_actor_learner_test',
+        'game_exe': '',
+        'trainer': 'dqn',
+        'env_config': {
+            'num_observation_features': 0,
+            'observation_includes_image': True,
+            'pre_init': False,
+            'time_limit': 300
+        },
+        'num_envs': 2,
+        'num_steps': 3000,
+        'tensorboard_log_path': 'test_results/tensorboard_logs/cartpole',
+        'tensorboard_log_name': 'cartpole_actor_learner',
+        'info_db_path': 'test_results/info/cartpole_actor_learner.db',
+        'trainer_config': {
+            'env_reward': True,
+            'num_actors': 2,
+            'actor_sync_freq': 10,
+            'learning_rate': 0.0001,
+            'discount_factor': 0.99,
+            'buffer_size': 2000,
+            'batch_size': 32,
+            'target_update_freq': 500,
+            'eps_initial': 1.0,
+            'eps_final': 0.05,
+            'eps_annealing_duration': 0.2,
+            'checkpoint_path': 'test_results/checkpoints/cartpole_actor_learner'
+        }
+    }
+
+    def setUp(self):
+        if os.path.exists('test_results/tensorboard_logs/cartpole/cartpole_actor_learner'):
+            shutil.rmtree('test_results/tensorboard_logs/cartpole/cartpole_actor_learner')
+        if os.path.exists('test_results/checkpoints/cartpole_actor_learner.pth'):
+            os.remove('test_results/checkpoints/cartpole_actor_learner.pth')
+        if os.path.exists('test_results/info'):
+            shutil.rmtree('test_results/info')
+
+    # the actors are forked rather than spawned, so that they see the patches
+    @patch('dqn_actor_learner.ACTOR_START_METHOD', new='fork')
+    @patch('dqn_actor_learner.InfoProcessor', new=make_info_processor)
+    @patch('dqn_actor_learner.make_env', new=make_env_cartpole_simple)
+    @patch('dqn_actor_learner.make_spaces', new=make_spaces_cartpole_simple)
+    @patch('dqn_actor_learner.DQNNet', new=DQNSimpleNet)
+    def test_actor_learner(self):
+        game_config = DQNActorLearnerTestCase.game_config
+        # shard of another run writing to the same database
+        os.makedirs('test_results/info')
+        other_shard_path = get_shard_path(game_config['info_db_path'], 'other_run')
+        init_info_db(other_shard_path, game_config['config_name'])
+        dqn_actor_learner.run_dqn_actor_learner(game_config, '', 0, 'test_results/workdir')
+        # only the shards of the run's own actors are merged
+        self.assertEqual(find_shards(game_config['info_db_path']), [other_shard_path])
+        self.assertTrue(os.path.exists(game_config['info_db_path']))
+
+        # the learner received the episodes of all actors and trained on them
+        log_dir = os.path.join(game_config['tensorboard_log_path'], game_config['tensorboard_log_name'])
+        ea = event_accumulator.EventAccumulator(log_dir)
+        ea.Reload()
+        self.assertGreater(len(ea.scalars.Items('episode/reward')), 50)
+        self.assertGreater(ea.scalars.Items('train/updates')[-1].value, 0)
+        data = torch.load('test_results/checkpoints/cartpole_actor_learner.pth')
+        self.assertGreaterEqual(data['step_num'], 1500)
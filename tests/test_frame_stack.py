@@ -0,0 +1,62 @@
+import pickle
+import unittest
+import numpy as np
+from frame_stack import FrameStack, FrameStackException
+
+
+class FrameStackTestCase(unittest.TestCase):
+    def make_frame(self, value):
+        return np.full((2, 3), value, dtype=np.uint8)
+
+    def stacked_values(self, stacked):
+        return [int(frame[0, 0]) for frame in np.asarray(stacked)]
+
+    def test_order_and_padding(self):
+        frame_stack = FrameStack(4, (2, 3))
+        with self.assertRaises(FrameStackException):
+            frame_stack.stacked()
+        frame_stack.push(self.make_frame(1))
+        frame_stack.push(self.make_frame(2))
+        # padded with the newest frame until the stack is full
+        self.assertEqual(self.stacked_values(frame_stack.stacked()), [1, 2, 2, 2])
+        for value in range(3, 7):
+            frame_stack.push(self.make_frame(value))
+        self.assertEqual(self.stacked_values(frame_stack.stacked()), [3, 4, 5, 6])
+        self.assertEqual(self.stacked_values(frame_stack.lazy()), [3, 4, 5, 6])
+        # a new episode starts over
+        frame_stack.clear()
+        np.copyto(frame_stack.next_slot(), self.make_frame(9))
+        frame_stack.commit()
+        self.assertEqual(self.stacked_values(frame_stack.stacked()), [9, 9, 9, 9])
+
+    def test_stale_lazy_frames(self):
+        frame_stack = FrameStack(2, (2, 3))
+        frame_stack.push(self.make_frame(1))
+        lazy = frame_stack.lazy()
+        self.assertEqual(lazy.shape, (2, 2, 3))
+        self.assertEqual(self.stacked_values(lazy), [1, 1])
+        self.assertEqual(self.stacked_values(pickle.loads(pickle.dumps(lazy))), [1, 1])
+        frame_stack.push(self.make_frame(2))
+        with self.assertRaises(FrameStackException):
+            np.asarray(lazy)
+        lazy = frame_stack.lazy()
+        frame_stack.clear()
+        with self.assertRaises(FrameStackException):
+            np.asarray(lazy)
+
+    def test_output_buffers(self):
+        frame_stack = FrameStack(2, (2, 3))
+        frame_stack.push(self.make_frame(1))
+        first = frame_stack.stacked()
+        frame_stack.push(self.make_frame(2))
+        second = frame_stack.stacked()
+        # the previous observation stays valid for one more step
+        self.assertIsNot(first, second)
+        self.assertEqual(self.stacked_values(first), [1, 1])
+        self.assertEqual(self.stacked_values(second), [1, 2])
+        frame_stack.push(self.make_frame(3))
+        self.assertIs(frame_stack.stacked(), first)
+        self.assertEqual(self.stacked_values(first), [2, 3])
+        out = np.zeros((2, 2, 3), dtype=np.uint8)
+        self.assertIs(frame_stack.stacked(out=out), out)
+        self.assertEqual(self.stacked_values(second), [1, 2])
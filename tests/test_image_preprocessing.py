@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+import skimage
+from image_preprocessing import ImagePreprocessor
+
+
+def reference_preprocess(img, resize_to):
+    return skimage.color.rgb2gray(skimage.transform.resize(img[:,:,:3], resize_to,
+                                                           anti_aliasing=False, preserve_range=True)).astype(np.uint8)
+
+
+class ImagePreprocessorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(1234)
+
+    def test_matches_skimage(self):
+        for in_shape in [(600, 800, 4), (84, 84, 3), (50, 40, 4), (37, 91, 3)]:
+            img = self.rng.integers(0, 256, in_shape, dtype=np.uint8)
+            preprocessor = ImagePreprocessor((84, 84))
+            diff = np.abs(preprocessor.process(img).astype(np.int64) - reference_preprocess(img, (84, 84)))
+            self.assertLessEqual(diff.max(), 1)
+            self.assertLess(np.mean(diff > 0), 0.01)
+
+    def test_batch(self):
+        imgs = self.rng.integers(0, 256, (3, 120, 160, 4), dtype=np.uint8)
+        preprocessor = ImagePreprocessor((42, 84))
+        out = np.zeros((3, 42, 84), dtype=np.uint8)
+        preprocessor.process_batch(imgs, out=out)
+        for i in range(len(imgs)):
+            np.testing.assert_array_equal(out[i], preprocessor.process(imgs[i]))
+
+    def test_flipped_view(self):
+        img = self.rng.integers(0, 256, (90, 120, 4), dtype=np.uint8)
+        preprocessor = ImagePreprocessor((84, 84))
+        np.testing.assert_array_equal(preprocessor.process(img[::-1]),
+                                      preprocessor.process(np.ascontiguousarray(img[::-1])))
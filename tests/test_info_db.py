@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from info_db import BufferedDBWriter, BufferedDBWriterException, init_info_db, get_shard_path, find_shards, merge_shard, \
+    new_shard_id
+from merge_info_db import merge_info_db
+
+
+class BufferedDBWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'info.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def query(self, sql):
+        db_conn = sqlite3.connect(self.db_path)
+        try:
+            return db_conn.execute(sql).fetchall()
+        finally:
+            db_conn.close()
+
+    def test_flush_and_close(self):
+        writer = BufferedDBWriter(self.db_path, init_statements=[
+            'create table if not exists states (state_hash int, step_num int)',
+            'create table if not exists codecov (seqpt_id int primary key, step_num int)'
+        ], flush_interval=60.0)
+        for step_num in range(100):
+            writer.insert('insert into states (state_hash, step_num) values (?, ?)', [(step_num % 7, step_num)] * 3)
+        writer.insert('insert or ignore into codecov (seqpt_id, step_num) values (?, ?)', [(1, 5), (2, 5)])
+        writer.flush()
+        self.assertEqual(self.query('select count(*) from states'), [(300,)])
+        writer.insert('insert or ignore into codecov (seqpt_id, step_num) values (?, ?)', [(1, 9), (3, 9)])
+        writer.close()
+        self.assertEqual(self.query('select seqpt_id, step_num from codecov order by seqpt_id'), [(1, 5), (2, 5), (3, 9)])
+        self.assertEqual(self.query('pragma journal_mode'), [('wal',)])
+
+    def test_error_reported(self):
+        writer = BufferedDBWriter(self.db_path, flush_interval=60.0)
+        writer.insert('insert into missing_table (x) values (?)', [(1,)])
+        with self.assertRaises(BufferedDBWriterException):
+            writer.flush()
+        writer.close()
+
+
+class InfoDBSummaryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'info.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def query(self, sql):
+        db_conn = sqlite3.connect(self.db_path)
+        try:
+            return db_conn.execute(sql).fetchall()
+        finally:
+            db_conn.close()
+
+    def insert_rows(self, db_conn):
+        db_conn.executemany('insert into states_c (state_hash, step_num) values (?, ?)',
+                            [(1, 0), (2, 5), (1, 12), (3, 15), (2, 25)])
+        db_conn.executemany('insert or ignore into codecov_c (seqpt_id, step_num) values (?, ?)',
+                            [(7, 3), (8, 21), (7, 22)])
+        db_conn.executemany('insert into actions_c (num_valid_actions, step_num) values (?, ?)',
+                            [(4, 1), (6, 2), (3, 11)])
+
+    def check_summary(self):
+        self.assertEqual(self.query('select state_hash, step_num from state_first_seen_c order by state_hash'),
+                         [(1, 0), (2, 5), (3, 15)])
+        self.assertEqual(self.query('select * from state_buckets_c order by bucket'), [(0, 2), (1, 1)])
+        self.assertEqual(self.query('select * from codecov_buckets_c order by bucket'), [(0, 1), (2, 1)])
+        self.assertEqual(self.query('select * from action_buckets_c order by bucket'), [(0, 2, 10), (1, 1, 3)])
+
+    def test_triggers(self):
+        self.assertEqual(init_info_db(self.db_path, 'c', 10), 10)
+        db_conn = sqlite3.connect(self.db_path)
+        with db_conn:
+            self.insert_rows(db_conn)
+        db_conn.close()
+        self.check_summary()
+
+    def test_backfill(self):
+        db_conn = sqlite3.connect(self.db_path)
+        with db_conn:
+            db_conn.execute('create table states_c (state_hash int, step_num int)')
+            db_conn.execute('create table codecov_c (seqpt_id int primary key, step_num int)')
+            db_conn.execute('create table actions_c (num_valid_actions int, step_num int)')
+            self.insert_rows(db_conn)
+        db_conn.close()
+        init_info_db(self.db_path, 'c', 10)
+        self.check_summary()
+        # the backfill only runs once, and the bucket size of the existing database is kept
+        self.assertEqual(init_info_db(self.db_path, 'c', 100), 10)
+        self.check_summary()
+
+
+class MergeShardTestCase(unittest.TestCase):
+    def write_shard(self, db_path, shard_id, states, codecov=()):
+        shard_path = get_shard_path(db_path, shard_id)
+        init_info_db(shard_path, 'c', 10)
+        db_conn = sqlite3.connect(shard_path)
+        with db_conn:
+            db_conn.executemany('insert into states_c (state_hash, step_num) values (?, ?)', states)
+            db_conn.executemany('insert into codecov_c (seqpt_id, step_num) values (?, ?)', codecov)
+        db_conn.close()
+        return shard_path
+
+    def test_merge(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, 'info.db')
+            shard_rows = {'a': ([(1, 30), (2, 31)], [(7, 30), (8, 31)]), 'b': ([(1, 5), (3, 6)], [(7, 5), (9, 40)])}
+            for shard_id, (states, codecov) in shard_rows.items():
+                self.write_shard(db_path, shard_id, states, codecov)
+            self.assertEqual(find_shards(db_path), [get_shard_path(db_path, 'a'), get_shard_path(db_path, 'b')])
+            init_info_db(db_path, 'c', 10)
+            db_conn = sqlite3.connect(db_path)
+            try:
+                for shard_path in find_shards(db_path):
+                    merge_shard(db_conn, 'c', shard_path)
+                self.assertEqual(db_conn.execute('select count(*) from states_c').fetchall(), [(4,)])
+                self.assertEqual(db_conn.execute('select * from state_first_seen_c order by state_hash').fetchall(),
+                                 [(1, 5), (2, 31), (3, 6)])
+                self.assertEqual(db_conn.execute('select * from state_buckets_c where new_states > 0 order by bucket').fetchall(),
+                                 [(0, 2), (3, 1)])
+                self.assertEqual(db_conn.execute('select * from codecov_c order by seqpt_id').fetchall(),
+                                 [(7, 5), (8, 31), (9, 40)])
+                self.assertEqual(db_conn.execute('select * from codecov_buckets_c where new_seqpts > 0 order by bucket').fetchall(),
+                                 [(0, 1), (3, 1), (4, 1)])
+            finally:
+                db_conn.close()
+
+    def test_merge_info_db(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, 'info.db')
+            game_config = {'config_name': 'c', 'info_db_path': db_path, 'info_db_bucket_size': 10}
+            self.assertNotEqual(new_shard_id(), new_shard_id())
+            self.write_shard(db_path, 'a', [(1, 10)])
+            merge_info_db(game_config)
+            self.assertEqual(find_shards(db_path), [])
+            # a shard with the name of one that was merged before is skipped, and kept rather than deleted
+            shard_path = self.write_shard(db_path, 'a', [(2, 20)])
+            self.write_shard(db_path, 'b', [(3, 30)])
+            merge_info_db(game_config)
+            self.assertEqual(find_shards(db_path), [shard_path])
+            db_conn = sqlite3.connect(db_path)
+            try:
+                self.assertEqual(db_conn.execute('select * from states_c order by state_hash').fetchall(),
+                                 [(1, 10), (3, 30)])
+            finally:
+                db_conn.close()
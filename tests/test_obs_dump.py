@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from obs_dump import ObservationDumpWriter, ObservationDumpReader
+
+
+class ObservationDumpTestCase(unittest.TestCase):
+    def make_observation(self, step_num):
+        return {
+            'obs': np.full((2, 4, 8, 8), step_num % 256, dtype=np.uint8),
+            'action_mask': np.full((2, 5), step_num % 2, dtype=np.float32)
+        }
+
+    def check_roundtrip(self, compress):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            writer = ObservationDumpWriter(dump_dir, sample_rate=1.0, chunk_size=3, compress=compress)
+            for step_num in range(0, 20, 2):
+                writer.append(step_num, self.make_observation(step_num))
+            writer.close()
+            reader = ObservationDumpReader(dump_dir)
+            np.testing.assert_array_equal(reader.get_step_nums(), np.arange(0, 20, 2))
+            dumped = list(reader)
+            self.assertEqual([step_num for step_num, _ in dumped], list(range(0, 20, 2)))
+            for step_num, observation in dumped:
+                expected = self.make_observation(step_num)
+                for key in expected:
+                    np.testing.assert_array_equal(observation[key], expected[key])
+            np.testing.assert_array_equal(reader.get(8, mmap=True)['obs'], self.make_observation(8)['obs'])
+
+    def test_roundtrip_compressed(self):
+        self.check_roundtrip(True)
+
+    def test_roundtrip_uncompressed(self):
+        self.check_roundtrip(False)
+
+    def test_deterministic_sampling(self):
+        dumped = []
+        for _ in range(2):
+            with tempfile.TemporaryDirectory() as dump_dir:
+                writer = ObservationDumpWriter(dump_dir, sample_rate=0.3, seed=42, chunk_size=4)
+                for step_num in range(100):
+                    writer.maybe_append(step_num, self.make_observation(step_num))
+                writer.close()
+                dumped.append(ObservationDumpReader(dump_dir).get_step_nums().tolist())
+        self.assertEqual(dumped[0], dumped[1])
+        self.assertGreater(len(dumped[0]), 10)
+        self.assertLess(len(dumped[0]), 60)
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import unittest
+from profiling import StageProfiler, StageTimings, LatencyHistogram, PROFILE_INFO_PREFIX
+
+
+class FakeSummaryWriter:
+    def __init__(self):
+        self.scalars = dict()
+        self.histograms = dict()
+
+    def add_scalar(self, tag, value, step):
+        self.scalars[tag] = value
+
+    def add_histogram_raw(self, tag, **kwargs):
+        self.histograms[tag] = kwargs
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def test_histogram_percentiles(self):
+        hist = LatencyHistogram()
+        for duration_ns in range(1000, 101000, 1000):
+            hist.add(duration_ns)
+        self.assertEqual(hist.get_mean(), 50500)
+        self.assertGreaterEqual(hist.get_percentile(50), 50000)
+        self.assertLess(hist.get_percentile(50), 50000*1.3)
+        self.assertEqual(hist.get_percentile(100), 100000)
+
+    def test_profiler(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            trace_path = os.path.join(tmpdir, 'trace.json')
+            profiler = StageProfiler(trace_path=trace_path)
+            timings = StageTimings()
+            with timings.stage('env/receive_state'):
+                pass
+            env_info = timings.add_to_info({'state_hash': 1})
+            self.assertIn(PROFILE_INFO_PREFIX + 'env/receive_state', env_info)
+            self.assertEqual(timings.add_to_info({}), {})
+            for _ in range(3):
+                with profiler.stage('train/update'):
+                    pass
+            start_ns, duration_ns = env_info[PROFILE_INFO_PREFIX + 'env/receive_state']
+            profiler.record_info({PROFILE_INFO_PREFIX + 'env/receive_state': [(start_ns, duration_ns), None],
+                                  '_' + PROFILE_INFO_PREFIX + 'env/receive_state': [True, False]})
+            writer = FakeSummaryWriter()
+            profiler.write_summary(writer, 10)
+            self.assertEqual(writer.histograms['profile/train/update/latency_ms']['num'], 3)
+            self.assertIn('profile/env/receive_state/p99_ms', writer.scalars)
+            self.assertEqual(profiler.get_histograms(), {})
+            profiler.close()
+            with open(trace_path) as f:
+                events = json.load(f)
+            self.assertEqual(len(events), 4)
+            self.assertEqual([event['tid'] for event in events if event['name'] == 'env/receive_state'], [1])
+
+    def test_disabled(self):
+        profiler = StageProfiler(enabled=False)
+        with profiler.stage('train/update'):
+            pass
+        profiler.record_info({PROFILE_INFO_PREFIX + 'env/reset': [(0, 1)], '_' + PROFILE_INFO_PREFIX + 'env/reset': [True]})
+        self.assertEqual(profiler.get_histograms(), {})
+        self.assertEqual(StageTimings(enabled=False).add_to_info({'a': 1}), {'a': 1})
@@ -0,0 +1,126 @@
+import tempfile
+import unittest
+import numpy as np
+import torch
+from cpprb import ReplayBuffer
+from frame_stack import FrameStack
+from replay import PrefetchSampler, FrameStackReplayBuffer, MmapReplayBuffer, MmapReplayBufferException
+
+
+class PrefetchSamplerTestCase(unittest.TestCase):
+    def test_sample(self):
+        rb = ReplayBuffer(100, env_dict={'obs': {'shape': (2, 3), 'dtype': np.uint8}, 'done': {'dtype': np.bool_}})
+        sampler = PrefetchSampler(rb, 8, torch.device('cpu'), num_prefetch=2)
+        try:
+            for i in range(4):
+                sampler.add(obs=np.full((4, 2, 3), i, dtype=np.uint8), done=np.array([False, True, False, True]))
+            self.assertEqual(sampler.get_stored_size(), 16)
+            buffers = set()
+            for _ in range(10):
+                batch = sampler.sample()
+                self.assertEqual(batch['obs'].dtype, torch.uint8)
+                self.assertEqual(tuple(batch['obs'].shape), (8, 2, 3))
+                self.assertTrue(bool((batch['obs'] < 4).all()))
+                self.assertEqual(batch['done'].dtype, torch.bool)
+                buffers.add(batch['obs'].data_ptr())
+            # batches are copied into the same preallocated buffers
+            self.assertLessEqual(len(buffers), 3)
+        finally:
+            sampler.close()
+
+    def test_close_before_filled(self):
+        rb = ReplayBuffer(100, env_dict={'obs': {'shape': (2,)}})
+        sampler = PrefetchSampler(rb, 8, torch.device('cpu'))
+        sampler.add(obs=np.zeros((2, 2)))
+        sampler.close()
+
+
+class FrameStackReplayBufferTestCase(unittest.TestCase):
+    def test_rebuilds_stacks(self):
+        num_envs, stack_len, size = 2, 4, 50
+        rng = np.random.default_rng(0)
+        rb = FrameStackReplayBuffer(size, (stack_len, 3, 5), 6)
+        stacks = [FrameStack(stack_len, (3, 5)) for _ in range(num_envs)]
+        for stack in stacks:
+            stack.push(rng.integers(0, 256, (3, 5), dtype=np.uint8))
+        expected = dict()
+        for step in range(100):
+            obs = np.stack([stack.stacked(out=np.zeros((stack_len, 3, 5), dtype=np.uint8)) for stack in stacks])
+            dones = rng.random(num_envs) < 0.1
+            for i, stack in enumerate(stacks):
+                if dones[i]:
+                    stack.clear()
+                stack.push(rng.integers(0, 256, (3, 5), dtype=np.uint8))
+            next_obs = np.stack([stack.stacked(out=np.zeros((stack_len, 3, 5), dtype=np.uint8)) for stack in stacks])
+            act = np.arange(num_envs) + step*num_envs
+            next_act_mask = rng.random((num_envs, 6)).astype(np.float32)
+            rb.add(obs=obs, act=act, rew=act.astype(np.float32), next_obs=next_obs, next_act_mask=next_act_mask,
+                   done=dones)
+            for i in range(num_envs):
+                expected[act[i]] = (obs[i], next_obs[i], next_act_mask[i], dones[i])
+        self.assertEqual(rb.get_stored_size(), size)
+        # a single new frame per transition, plus the older frames of the oldest stacks
+        self.assertLessEqual(rb.get_num_frames(), size + num_envs*stack_len)
+        sample = rb.sample(500)
+        for k in range(500):
+            act = int(sample['act'][k, 0])
+            self.assertGreaterEqual(act, 200 - size)
+            obs, next_obs, next_act_mask, done = expected[act]
+            np.testing.assert_array_equal(sample['obs'][k], obs)
+            np.testing.assert_array_equal(sample['next_obs'][k], next_obs)
+            np.testing.assert_array_equal(sample['next_act_mask'][k], next_act_mask)
+            self.assertEqual(sample['done'][k, 0], done)
+            self.assertEqual(sample['rew'][k, 0], act)
+
+    def test_frame_capacity(self):
+        num_envs, stack_len, size = 4, 4, 1000
+        rng = np.random.default_rng(0)
+        rb = FrameStackReplayBuffer(size, (stack_len, 3, 5), 6, num_envs=num_envs)
+        stacks = [FrameStack(stack_len, (3, 5)) for _ in range(num_envs)]
+        for stack in stacks:
+            stack.push(rng.integers(0, 256, (3, 5), dtype=np.uint8))
+        for step in range(3000):
+            obs = np.stack([stack.stacked(out=np.zeros((stack_len, 3, 5), dtype=np.uint8)) for stack in stacks])
+            dones = rng.random(num_envs) < 0.02
+            for i, stack in enumerate(stacks):
+                if dones[i]:
+                    stack.clear()
+                stack.push(rng.integers(0, 256, (3, 5), dtype=np.uint8))
+            next_obs = np.stack([stack.stacked(out=np.zeros((stack_len, 3, 5), dtype=np.uint8)) for stack in stacks])
+            rb.add(obs=obs, act=np.zeros(num_envs, dtype=np.int_), rew=np.zeros(num_envs), next_obs=next_obs,
+                   next_act_mask=np.ones((num_envs, 6)), done=dones)
+        # the frame store is not doubled once the buffer is full
+        self.assertLessEqual(rb.get_num_frames(), size + num_envs*(stack_len + 1))
+        self.assertLess(rb.get_frame_capacity(), 1.1*size)
+
+
+class MmapReplayBufferTestCase(unittest.TestCase):
+    ENV_DICT = {'obs': {'shape': (2, 3), 'dtype': np.uint8}, 'act': {'dtype': np.int_}, 'done': {'dtype': np.bool_}}
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rb = MmapReplayBuffer(10, self.ENV_DICT, tmp_dir)
+            for i in range(4):
+                rb.add(obs=np.full((3, 2, 3), i, dtype=np.uint8), act=np.arange(3) + 3*i, done=np.zeros(3),
+                       env_ids=np.arange(3))
+            self.assertEqual(rb.get_stored_size(), 10)
+            rb.flush()
+            # not counted on restart, but written over the oldest transitions 2 and 3
+            rb.add(obs=np.full((2, 2, 3), 9, dtype=np.uint8), act=[100, 101], done=[True, True])
+            del rb
+
+            rb = MmapReplayBuffer(10, self.ENV_DICT, tmp_dir)
+            self.assertEqual(rb.get_stored_size(), 10)
+            rb.add(obs=np.full((1, 2, 3), 5, dtype=np.uint8), act=[12], done=[True])
+            sample = rb.sample(200)
+            self.assertEqual(sample['obs'].shape, (200, 2, 3))
+            self.assertEqual(sample['act'].shape, (200, 1))
+            self.assertEqual(set(sample['act'][:, 0].tolist()), set(range(4, 13)) | {101})
+            for k in range(200):
+                act = sample['act'][k, 0]
+                self.assertTrue((sample['obs'][k] == {12: 5, 101: 9}.get(act, act//3)).all())
+                self.assertEqual(sample['done'][k, 0], act in (12, 101))
+            del rb, sample
+
+            with self.assertRaises(MmapReplayBufferException):
+                MmapReplayBuffer(20, self.ENV_DICT, tmp_dir)
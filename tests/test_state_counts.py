@@ -0,0 +1,37 @@
+import unittest
+from collections import Counter
+import numpy as np
+from state_counts import StateCountTable
+
+
+class StateCountTableTestCase(unittest.TestCase):
+    def test_matches_dict_counts(self):
+        num_envs = 4
+        rng = np.random.default_rng(0)
+        table = StateCountTable(num_envs, initial_capacity=16)
+        expected = [Counter() for _ in range(num_envs)]
+        for step in range(300):
+            # few distinct states, with repeats and negative hashes
+            state_hashes = rng.integers(-50, 50, num_envs) * 0x123456789
+            counts = table.increment(state_hashes)
+            for i in range(num_envs):
+                expected[i][state_hashes[i]] += 1
+                self.assertEqual(counts[i], expected[i][state_hashes[i]])
+            if step % 50 == 49:
+                table.clear([1, 3])
+                expected[1].clear()
+                expected[3].clear()
+        self.assertEqual(len(table), sum(len(env_counts) for env_counts in expected))
+
+        restored = StateCountTable()
+        restored.load_state_dict(table.state_dict())
+        self.assertEqual(len(restored), len(table))
+        np.testing.assert_array_equal(restored.increment(state_hashes),
+                                      [expected[i][state_hashes[i]] + 1 for i in range(num_envs)])
+
+    def test_shared_repeats(self):
+        table = StateCountTable()
+        np.testing.assert_array_equal(table.increment([7, 3, 7, 7]), [1, 1, 2, 3])
+        np.testing.assert_array_equal(table.increment(np.arange(5000)), [4 if i == 7 else 2 if i == 3 else 1
+                                                                         for i in range(5000)])
+        self.assertEqual(len(table), 5000)
@@ -0,0 +1,16 @@
+import json
+import unittest
+from trainer_common import RollingMean
+
+
+class RollingMeanTestCase(unittest.TestCase):
+    def test_state_dict(self):
+        rolling_mean = RollingMean(buf_size=3)
+        for value in [1.0, 2.0, 3.0, 7.0]:
+            rolling_mean.add_value(value)
+        # the simple trainer stores the state in a JSON checkpoint
+        restored = RollingMean()
+        restored.load_state_dict(json.loads(json.dumps(rolling_mean.state_dict())))
+        self.assertEqual(list(restored.buf), [2.0, 3.0, 7.0])
+        restored.add_value(9.0)
+        self.assertEqual(restored.get_mean(), 19.0/3)
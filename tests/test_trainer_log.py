@@ -0,0 +1,42 @@
+import logging
+import unittest
+import numpy as np
+from trainer_log import RateLimitFilter, StepStats
+
+
+class RateLimitFilterTestCase(unittest.TestCase):
+    def test_rate_limit(self):
+        rate_filter = RateLimitFilter(60.0)
+
+        def make_record(msg, level=logging.INFO, arg=1):
+            return logging.LogRecord('autogym.test', level, __file__, 1, msg, (arg,), None)
+
+        self.assertTrue(rate_filter.filter(make_record('a %d')))
+        self.assertFalse(rate_filter.filter(make_record('a %d')))
+        self.assertFalse(rate_filter.filter(make_record('a %d')))
+        # other messages and levels are limited separately, including messages of the same format
+        self.assertTrue(rate_filter.filter(make_record('b %d')))
+        self.assertTrue(rate_filter.filter(make_record('a %d', arg=2)))
+        self.assertTrue(rate_filter.filter(make_record('a %d', logging.DEBUG)))
+        # warnings are never dropped
+        self.assertTrue(rate_filter.filter(make_record('a %d', logging.WARNING)))
+        self.assertTrue(rate_filter.filter(make_record('a %d', logging.WARNING)))
+        rate_filter._interval = 0.0
+        record = make_record('a %d')
+        self.assertTrue(rate_filter.filter(record))
+        self.assertEqual(record.getMessage(), 'a 1 (2 similar messages suppressed)')
+
+
+class StepStatsTestCase(unittest.TestCase):
+    def test_summary(self):
+        logger = logging.getLogger('autogym.test_step_stats')
+        step_stats = StepStats(logger, 5, interval=3600.0)
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            step_stats.add(np.array([4, 2]), np.array([1, 3]), np.array([0.5, 0.0]))
+            step_stats.add(np.array([4, 4]), np.array([3, 3]), np.array([1.0, 0.5]))
+            step_stats.log_summary(10)
+            step_stats.log_summary(10, force=True)
+        summaries = [record.getMessage() for record in logs.records if record.levelno == logging.INFO]
+        self.assertEqual(len(summaries), 1)
+        self.assertIn('mean valid actions: 3.5, mean reward: 0.5000, top actions: 3: 3, 1: 1', summaries[0])
+        self.assertIn('Performing actions: [1 3]', logs.output[1])
@@ -0,0 +1,221 @@
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import numpy as np
+from unity_env import UnityEnv, UnityGameInstance
+from unity_io import FrameReader
+from unity_protocol import decode_message, encode_message
+
+
+class FakeGame(threading.Thread):
+    # Plays the game end of the connection: episodes of episode_len steps, with observation [step, number of soft
+    # resets, port] and a reward of 1 per step, sent action_delay seconds after the action. A soft reset either
+    # starts a new episode or, with fail_soft_reset, closes the connection; with fail_action, so does an action.
+
+    def __init__(self, sock, port, num_actions, episode_len, soft_reset, fail_soft_reset, fail_action, action_delay):
+        super().__init__(daemon=True)
+        self._sock = sock
+        self._port = port
+        self._num_actions = num_actions
+        self._episode_len = episode_len
+        self._soft_reset = soft_reset
+        self._fail_soft_reset = fail_soft_reset
+        self._fail_action = fail_action
+        self._action_delay = action_delay
+        self._step = 0
+        self._num_soft_resets = 0
+
+    def _send(self, msg):
+        self._sock.sendall(encode_message(msg))
+
+    def _observation(self):
+        return [float(self._step), float(self._num_soft_resets), float(self._port)]
+
+    def _send_init(self):
+        self._send({'ready': False})
+        self._send({'ready': True, 'observation': self._observation(), 'info': {'state_hash': self._step},
+                    'numActions': self._num_actions, 'invalidActions': [], 'softReset': self._soft_reset})
+
+    def _receive(self, reader):
+        while True:
+            frame = reader.next_frame()
+            if frame is not None:
+                return decode_message(frame, copy=True)
+            reader.fill(self._sock)
+
+    def run(self):
+        reader = FrameReader()
+        try:
+            self._send_init()
+            while True:
+                msg = self._receive(reader)
+                if 'reset' in msg:
+                    if self._fail_soft_reset:
+                        break
+                    self._step = 0
+                    self._num_soft_resets += 1
+                    self._send_init()
+                elif 'action' in msg:
+                    if self._fail_action:
+                        break
+                    time.sleep(self._action_delay)
+                    self._step += 1
+                    if self._step >= self._episode_len:
+                        self._send({'reward': 1.0, 'done': True})
+                    else:
+                        self._send({'reward': 1.0, 'done': False, 'observation': self._observation(),
+                                    'info': {'state_hash': self._step}, 'invalidActions': [msg['action']]})
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._sock.close()
+
+
+class FakeGameInstance(UnityGameInstance):
+    # Game instance connected to a FakeGame over a socket pair instead of a game process
+
+    def __init__(self, port, blocking, num_actions=4, episode_len=3, soft_reset=True, fail_soft_reset=False,
+                 fail_action=False, action_delay=0.0):
+        super().__init__('fake', '/nonexistent/game', '127.0.0.1', port, '', '/nonexistent', True, blocking=blocking)
+        self._game_args = (num_actions, episode_len, soft_reset, fail_soft_reset, fail_action, action_delay)
+        self._game = None
+        self.closed = False
+
+    def start(self):
+        self._socket, game_sock = socket.socketpair()
+        if self._blocking:
+            self._socket.settimeout(60)
+        else:
+            self._socket.setblocking(False)
+        self._game = FakeGame(game_sock, self._port, *self._game_args)
+        self._game.start()
+        # the socket pair is connected from the start
+        self._connected = True
+
+    def is_started(self):
+        return self._game is not None
+
+    def connect(self):
+        self._connected = True
+        return True
+
+    def close(self):
+        self.closed = True
+        if self._socket is not None:
+            self._socket.close()
+        if self._game is not None:
+            self._game.join(5.0)
+
+
+class FakeGameTestCase(unittest.TestCase):
+    # Runs UnityEnv (or envs built on it) against FakeGameInstances instead of game processes
+
+    num_observation_features = 3
+    num_actions = 4
+
+    def setUp(self):
+        self.instances = []
+        self.lock = threading.Lock()
+        self.instance_kwargs = dict()
+        test_case = self
+        def new_game_instance(env, port, blocking):
+            return test_case.new_fake_instance(port, blocking)
+        patcher = patch.object(UnityEnv, 'new_game_instance', new=new_game_instance)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_instance_kwargs(self, port):
+        return self.instance_kwargs
+
+    def new_fake_instance(self, port, blocking):
+        game_inst = FakeGameInstance(port, blocking, **self.make_instance_kwargs(port))
+        with self.lock:
+            self.instances.append(game_inst)
+        return game_inst
+
+    def make_env_config(self, **kwargs):
+        env_config = {
+            'observation_includes_image': False,
+            'num_observation_features': FakeGameTestCase.num_observation_features,
+            'num_actions': FakeGameTestCase.num_actions
+        }
+        env_config.update(kwargs)
+        return env_config
+
+    def make_env(self, port=12000, **kwargs):
+        return UnityEnv('env_{}'.format(port), '/nonexistent/game', self.make_env_config(**kwargs), 'config.json',
+                        '/nonexistent', port)
+
+
+class UnityEnvResetTestCase(FakeGameTestCase):
+    def run_episode(self, env):
+        observation, info = env.reset()
+        num_steps = 0
+        done = False
+        while not done:
+            self.assertEqual(observation['obs'][0], num_steps)
+            observation, reward, done, truncated, info = env.step(0)
+            num_steps += 1
+        return num_steps
+
+    def test_restart(self):
+        env = self.make_env()
+        try:
+            for _ in range(3):
+                self.assertEqual(self.run_episode(env), 3)
+            self.assertEqual(len(self.instances), 3)
+            self.assertTrue(all(game_inst.closed for game_inst in self.instances[:2]))
+        finally:
+            env.close()
+
+    def test_soft_reset(self):
+        env = self.make_env(reset_mode='soft')
+        try:
+            for i in range(3):
+                observation, _ = env.reset()
+                self.assertEqual(observation['obs'][1], i)
+                np.testing.assert_array_equal(observation['action_mask'], np.ones(FakeGameTestCase.num_actions))
+                observation, _, _, _, _ = env.step(2)
+                self.assertEqual(observation['action_mask'][2], 0.0)
+            self.assertEqual(len(self.instances), 1)
+            self.assertEqual(self.instances[0].get_soft_reset_count(), 2)
+        finally:
+            env.close()
+
+    def test_max_soft_resets(self):
+        env = self.make_env(reset_mode='soft', max_soft_resets=2)
+        try:
+            soft_reset_counts = []
+            for _ in range(5):
+                observation, _ = env.reset()
+                soft_reset_counts.append(int(observation['obs'][1]))
+            # the game is restarted once it has been soft reset max_soft_resets times
+            self.assertEqual(soft_reset_counts, [0, 1, 2, 0, 1])
+            self.assertEqual(len(self.instances), 2)
+            self.assertTrue(self.instances[0].closed)
+        finally:
+            env.close()
+
+    def test_soft_reset_not_supported(self):
+        self.instance_kwargs = {'soft_reset': False}
+        env = self.make_env(reset_mode='soft')
+        try:
+            for _ in range(2):
+                self.run_episode(env)
+            self.assertEqual(len(self.instances), 2)
+        finally:
+            env.close()
+
+    def test_soft_reset_failure(self):
+        self.instance_kwargs = {'fail_soft_reset': True}
+        env = self.make_env(reset_mode='soft')
+        try:
+            self.run_episode(env)
+            # the game closes the connection instead of resetting, so the env falls back to a new game instance
+            self.assertEqual(self.run_episode(env), 3)
+            self.assertEqual(len(self.instances), 2)
+            self.assertTrue(self.instances[0].closed)
+        finally:
+            env.close()
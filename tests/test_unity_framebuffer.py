@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from unity_framebuffer import FrameBufferReader, UnityFrameBufferException, FRAMEBUFFER_HEADER, FRAMEBUFFER_MAGIC, \
+    FRAMEBUFFER_FLAG_BOTTOM_UP
+
+
+def write_frame(path, seq, pixels, bottom_up=True, magic=FRAMEBUFFER_MAGIC):
+    # writes a frame the way FrameBufferWriter.cs does, with pixels given top row first
+    height, width, channels = pixels.shape
+    rows = pixels[::-1] if bottom_up else pixels
+    header = FRAMEBUFFER_HEADER.pack(magic, 1, seq, width, height, channels,
+                                     FRAMEBUFFER_FLAG_BOTTOM_UP if bottom_up else 0, 64)
+    data = header + bytes(64 - len(header)) + rows.tobytes()
+    # written in place, as the game enlarges the file it maps rather than replacing it
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.write(data)
+
+
+class FrameBufferReaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'frames.mmap')
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def random_frame(self, height, width):
+        return self.rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+
+    def test_read_frame(self):
+        pixels = self.random_frame(3, 5)
+        write_frame(self.path, 1, pixels)
+        reader = FrameBufferReader(self.path)
+        try:
+            # rows are stored bottom-up and returned top row first
+            np.testing.assert_array_equal(reader.read_frame(), pixels)
+            pixels = self.random_frame(3, 5)
+            write_frame(self.path, 2, pixels, bottom_up=False)
+            np.testing.assert_array_equal(reader.read_frame(), pixels)
+        finally:
+            reader.close()
+
+    def test_invalid_header(self):
+        write_frame(self.path, 1, self.random_frame(2, 2), magic=b'XXXX')
+        reader = FrameBufferReader(self.path)
+        try:
+            with self.assertRaises(UnityFrameBufferException):
+                reader.read_frame()
+        finally:
+            reader.close()
+
+    def test_stale_frame(self):
+        write_frame(self.path, 5, self.random_frame(2, 2))
+        reader = FrameBufferReader(self.path)
+        try:
+            reader.read_frame()
+            # the game has not written a new frame
+            with self.assertRaises(UnityFrameBufferException):
+                reader.read_frame()
+            write_frame(self.path, 4, self.random_frame(2, 2))
+            with self.assertRaises(UnityFrameBufferException):
+                reader.read_frame()
+            pixels = self.random_frame(2, 2)
+            write_frame(self.path, 6, pixels)
+            np.testing.assert_array_equal(reader.read_frame(), pixels)
+        finally:
+            reader.close()
+
+    def test_enlarged_file(self):
+        write_frame(self.path, 1, self.random_frame(2, 2))
+        reader = FrameBufferReader(self.path)
+        try:
+            reader.read_frame()
+            pixels = self.random_frame(8, 6)
+            write_frame(self.path, 2, pixels)
+            np.testing.assert_array_equal(reader.read_frame(), pixels)
+        finally:
+            reader.close()
+
+    def test_replaced_file(self):
+        write_frame(self.path, 7, self.random_frame(4, 4))
+        reader = FrameBufferReader(self.path)
+        try:
+            reader.read_frame()
+            # a new writer replaces the file and starts its sequence numbers over
+            new_path = self.path + '.new'
+            pixels = self.random_frame(4, 4)
+            write_frame(new_path, 1, pixels)
+            os.replace(new_path, self.path)
+            np.testing.assert_array_equal(reader.read_frame(), pixels)
+        finally:
+            reader.close()
@@ -0,0 +1,45 @@
+import socket
+import struct
+import unittest
+from unity_io import FrameReader
+
+
+def frame(payload):
+    return struct.pack('i', len(payload)) + payload
+
+
+class FrameReaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sender, self.receiver = socket.socketpair()
+        self.receiver.setblocking(False)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def test_no_data(self):
+        reader = FrameReader()
+        self.assertIsNone(reader.fill(self.receiver))
+        self.assertIsNone(reader.next_frame())
+
+    def test_split_frames(self):
+        reader = FrameReader(initial_size=8)
+        payloads = [b'a'*10, b'', b'b'*10000, b'c'*3]
+        data = b''.join(frame(p) for p in payloads)
+        received = []
+        for i in range(0, len(data), 7):
+            self.sender.sendall(data[i:i+7])
+            while reader.fill(self.receiver) is not None:
+                pass
+            while True:
+                payload = reader.next_frame()
+                if payload is None:
+                    break
+                received.append(bytes(payload))
+        self.assertEqual(received, payloads)
+
+    def test_eof(self):
+        reader = FrameReader()
+        self.sender.close()
+        with self.assertRaises(EOFError):
+            reader.fill(self.receiver)
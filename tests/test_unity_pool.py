@@ -0,0 +1,81 @@
+import threading
+import unittest
+from unity_pool import UnityGameInstancePool, UnityGameInstancePoolException
+
+
+class FakeGameInstance:
+    def __init__(self, port, polls_until_ready=3):
+        self._port = port
+        self._polls_until_ready = polls_until_ready
+        self.started = False
+        self.closed = False
+
+    def start(self):
+        self.started = True
+
+    def poll(self):
+        self._polls_until_ready -= 1
+        return self._polls_until_ready <= 0
+
+    def get_port(self):
+        return self._port
+
+    def close(self):
+        self.closed = True
+
+
+class UnityGameInstancePoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.instances = []
+        self.lock = threading.Lock()
+
+    def new_instance(self, port):
+        game_inst = FakeGameInstance(port)
+        with self.lock:
+            self.instances.append(game_inst)
+        return game_inst
+
+    def test_lease_and_release(self):
+        pool = UnityGameInstancePool(2, [100, 101, 102], self.new_instance, poll_interval=0.001)
+        try:
+            leased_ports = set()
+            for _ in range(10):
+                game_inst = pool.lease(timeout=5.0)
+                self.assertTrue(game_inst.started)
+                self.assertFalse(game_inst.closed)
+                leased_ports.add(game_inst.get_port())
+                pool.release(game_inst)
+            self.assertEqual(leased_ports, {100, 101, 102})
+            self.assertEqual(pool.get_stats()['leases'], 10)
+        finally:
+            pool.close()
+        with self.lock:
+            self.assertTrue(all(game_inst.closed for game_inst in self.instances))
+
+    def test_lease_timeout(self):
+        pool = UnityGameInstancePool(1, [100], self.new_instance, poll_interval=0.001)
+        try:
+            game_inst = pool.lease(timeout=5.0)
+            # the only port is leased, so no other instance can be started
+            with self.assertRaises(UnityGameInstancePoolException):
+                pool.lease(timeout=0.05)
+            pool.release(game_inst)
+            pool.lease(timeout=5.0)
+        finally:
+            pool.close()
+
+    def test_startup_timeout(self):
+        def new_instance(port):
+            # the first instance never gets initialized
+            game_inst = FakeGameInstance(port, polls_until_ready=10**9 if len(self.instances) == 0 else 3)
+            with self.lock:
+                self.instances.append(game_inst)
+            return game_inst
+        pool = UnityGameInstancePool(1, [100], new_instance, poll_interval=0.001, startup_timeout=0.05)
+        try:
+            game_inst = pool.lease(timeout=5.0)
+            self.assertIsNot(game_inst, self.instances[0])
+            self.assertTrue(self.instances[0].closed)
+            self.assertEqual(pool.get_stats()['failures'], 1)
+        finally:
+            pool.close()
@@ -0,0 +1,62 @@
+import multiprocessing
+import socket
+import unittest
+from unity_ports import PortAllocator, is_port_free
+
+
+class PortAllocatorTestCase(unittest.TestCase):
+    def test_reserve_range(self):
+        allocator_a = PortAllocator(min_port=20000, max_port=30000)
+        allocator_b = PortAllocator(min_port=20000, max_port=30000)
+        try:
+            start_a = allocator_a.reserve_range(4)
+            start_b = allocator_b.reserve_range(4)
+            self.assertTrue(start_b >= start_a + 4 or start_b + 4 <= start_a)
+            for port in range(start_a, start_a + 4):
+                self.assertFalse(is_port_free(port))
+            allocator_a.release_all()
+            self.assertTrue(is_port_free(start_a))
+        finally:
+            allocator_a.release_all()
+            allocator_b.release_all()
+
+    def test_skips_used_port(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        used_port = listener.getsockname()[1]
+        allocator = PortAllocator(min_port=used_port, max_port=used_port + 100)
+        try:
+            self.assertFalse(is_port_free(used_port))
+            self.assertGreater(allocator.reserve_range(2), used_port)
+        finally:
+            allocator.release_all()
+            listener.close()
+
+    def test_forked_reservations(self):
+        allocator = PortAllocator(min_port=20000, max_port=30000)
+        start_port = allocator.reserve_range(2)
+        ctx = multiprocessing.get_context('fork')
+        kept = ctx.Event()
+        done = ctx.Event()
+        def child():
+            if allocator.is_forked():
+                allocator.release_all_except([start_port])
+                kept.set()
+            done.wait(10.0)
+        proc = ctx.Process(target=child)
+        try:
+            proc.start()
+            self.assertTrue(kept.wait(10.0))
+            self.assertFalse(allocator.is_forked())
+            allocator.release_all()
+            # only the child holds the reservation of the first port now
+            self.assertFalse(is_port_free(start_port))
+            self.assertTrue(is_port_free(start_port + 1))
+            done.set()
+            proc.join(10.0)
+            self.assertTrue(is_port_free(start_port))
+        finally:
+            done.set()
+            proc.join()
+            allocator.release_all()
@@ -0,0 +1,49 @@
+import json
+import struct
+import unittest
+import numpy as np
+import unity_protocol
+
+
+def encode_binary_state(obs, action_mask, numeric_info, extra, reward, done):
+    extra_bytes = json.dumps(extra).encode('utf-8') if extra else b''
+    header = unity_protocol.BINARY_HEADER.pack(unity_protocol.BINARY_MAGIC,
+                                               unity_protocol.BINARY_FLAG_DONE if done else 0,
+                                               reward, len(obs), len(action_mask), len(numeric_info),
+                                               len(extra_bytes))
+    info_fields = np.array(list(numeric_info.items()), dtype=unity_protocol.INFO_DTYPE)
+    return header + np.asarray(obs, dtype='<f4').tobytes() + np.asarray(action_mask, dtype=np.uint8).tobytes() \
+        + info_fields.tobytes() + extra_bytes
+
+
+class UnityProtocolTestCase(unittest.TestCase):
+    def test_json_fallback(self):
+        msg = {'observation': [1.0, 2.0], 'info': {}, 'reward': 0.5, 'done': False, 'invalidActions': [1]}
+        self.assertEqual(unity_protocol.decode_message(json.dumps(msg).encode('utf-8')), msg)
+
+    def test_binary_state(self):
+        buf = encode_binary_state([0.25, -1.5, 3.0], [1, 0, 1, 1],
+                                  {'state_hash': -123456789012, 'time_valid_actions': 7},
+                                  {'observation': {'img': '/tmp/a.png'}, 'info': {'failures': 'a;;;;;b'}},
+                                  1.5, False)
+        msg = unity_protocol.decode_message(buf)
+        self.assertEqual(msg['reward'], 1.5)
+        self.assertFalse(msg['done'])
+        np.testing.assert_array_equal(msg['observation']['vec'], [0.25, -1.5, 3.0])
+        self.assertEqual(msg['observation']['img'], '/tmp/a.png')
+        np.testing.assert_array_equal(msg['actionMask'], [1, 0, 1, 1])
+        self.assertEqual(msg['info'], {'state_hash': -123456789012, 'time_valid_actions': 7, 'failures': 'a;;;;;b'})
+
+    def test_binary_done(self):
+        msg = unity_protocol.decode_message(encode_binary_state([], [], {}, None, -1.0, True))
+        self.assertEqual(msg, {'reward': -1.0, 'done': True})
+
+    def test_binary_truncated(self):
+        buf = encode_binary_state([1.0, 2.0], [1], {}, None, 0.0, False)
+        with self.assertRaises(unity_protocol.ProtocolException):
+            unity_protocol.decode_message(buf[:-1])
+
+    def test_length_prefix(self):
+        framed = unity_protocol.encode_message({'action': 3})
+        self.assertEqual(struct.unpack('i', framed[:4])[0], len(framed) - 4)
+        self.assertEqual(json.loads(framed[4:]), {'action': 3})
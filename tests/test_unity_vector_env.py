@@ -0,0 +1,123 @@
+import asyncio
+import numpy as np
+from test_unity_env import FakeGameTestCase
+from unity_pool import UnityGameInstancePool
+from unity_env import UnityGameInstanceException
+from unity_vector_env import UnityAsyncioVectorEnv
+
+
+class UnityAsyncioVectorEnvTestCase(FakeGameTestCase):
+    ports = [12000, 12001]
+    # episodes of the game on the first port end after 2 steps, those on the second port after 3
+    episode_lens = {12000: 2, 12001: 3}
+
+    def make_instance_kwargs(self, port):
+        kwargs = {'episode_len': UnityAsyncioVectorEnvTestCase.episode_lens.get(port, 3)}
+        kwargs.update(self.instance_kwargs)
+        if port in self.port_instance_kwargs:
+            kwargs.update(self.port_instance_kwargs[port])
+        return kwargs
+
+    def setUp(self):
+        super().setUp()
+        self.port_instance_kwargs = dict()
+
+    def make_vector_env(self, max_episode_steps=None, instance_pool=None, **kwargs):
+        env_fns = [lambda port=port: self.make_env(port, **kwargs) for port in UnityAsyncioVectorEnvTestCase.ports]
+        return UnityAsyncioVectorEnv(env_fns, max_episode_steps=max_episode_steps, instance_pool=instance_pool,
+                                     connect_interval=0.001)
+
+    def test_reset_step(self):
+        env = self.make_vector_env()
+        try:
+            observation, info = env.reset()
+            np.testing.assert_array_equal(observation['obs'][:, 0], [0, 0])
+            np.testing.assert_array_equal(observation['obs'][:, 2], UnityAsyncioVectorEnvTestCase.ports)
+            observation, reward, terminated, truncated, info = env.step(np.array([1, 2]))
+            np.testing.assert_array_equal(observation['obs'][:, 0], [1, 1])
+            np.testing.assert_array_equal(reward, [1.0, 1.0])
+            np.testing.assert_array_equal(terminated, [False, False])
+            np.testing.assert_array_equal(truncated, [False, False])
+            # the game makes the last action invalid
+            np.testing.assert_array_equal(observation['action_mask'], [[1, 0, 1, 1], [1, 1, 0, 1]])
+            np.testing.assert_array_equal(info['state_hash'], [1, 1])
+            self.assertNotIn('final_observation', info)
+        finally:
+            env.close()
+
+    def test_autoreset(self):
+        env = self.make_vector_env()
+        try:
+            env.reset()
+            env.step(np.array([0, 0]))
+            observation, reward, terminated, truncated, info = env.step(np.array([0, 0]))
+            np.testing.assert_array_equal(terminated, [True, False])
+            # the first env is reset to the first observation of a new game instance
+            np.testing.assert_array_equal(observation['obs'][:, 0], [0, 2])
+            self.assertEqual(len(self.instances), 3)
+            self.assertTrue(self.instances[0].closed)
+            np.testing.assert_array_equal(info['_final_observation'], [True, False])
+            np.testing.assert_array_equal(info['final_observation'][0]['obs'], np.zeros(3))
+            self.assertIsNone(info['final_observation'][1])
+            np.testing.assert_array_equal(info['_final_info'], [True, False])
+            # the state hash is only set for the env that was not reset, the reset env has that of its new episode
+            np.testing.assert_array_equal(info['_state_hash'], [True, True])
+            np.testing.assert_array_equal(info['state_hash'], [0, 2])
+            observation, reward, terminated, truncated, info = env.step(np.array([0, 0]))
+            np.testing.assert_array_equal(terminated, [False, True])
+            np.testing.assert_array_equal(observation['obs'][:, 0], [1, 0])
+            np.testing.assert_array_equal(info['_final_observation'], [False, True])
+        finally:
+            env.close()
+
+    def test_max_episode_steps(self):
+        env = self.make_vector_env(max_episode_steps=1)
+        try:
+            env.reset()
+            observation, reward, terminated, truncated, info = env.step(np.array([0, 0]))
+            np.testing.assert_array_equal(terminated, [False, False])
+            np.testing.assert_array_equal(truncated, [True, True])
+            np.testing.assert_array_equal(info['final_observation'][0]['obs'], [1, 0, 12000])
+            np.testing.assert_array_equal(observation['obs'][:, 0], [0, 0])
+        finally:
+            env.close()
+
+    def test_soft_reset(self):
+        env = self.make_vector_env(reset_mode='soft')
+        try:
+            env.reset()
+            for _ in range(6):
+                observation, _, _, _, _ = env.step(np.array([0, 0]))
+            # 3 episodes of the first env and 2 of the second, on the same game instances
+            np.testing.assert_array_equal(observation['obs'][:, 1], [3, 2])
+            self.assertEqual(len(self.instances), 2)
+        finally:
+            env.close()
+
+    def test_instance_pool(self):
+        pool = UnityGameInstancePool(2, list(range(12100, 12104)), lambda port: self.new_fake_instance(port, False),
+                                     poll_interval=0.001)
+        env = self.make_vector_env(instance_pool=pool)
+        try:
+            observation, info = env.reset()
+            np.testing.assert_array_equal(info['_time_pool_lease'], [True, True])
+            for _ in range(3):
+                observation, _, _, _, info = env.step(np.array([0, 0]))
+            # every episode is played on a leased instance, none is started by the envs themselves
+            self.assertTrue(all(12100 <= game_inst.get_port() < 12104 for game_inst in self.instances))
+            self.assertEqual(pool.get_stats()['leases'], 4)
+        finally:
+            env.close()
+
+    def test_step_failure(self):
+        # the game on the first port closes the connection, while the second one is still stepping
+        self.port_instance_kwargs = {12000: {'fail_action': True}, 12001: {'action_delay': 1.0}}
+        env = self.make_vector_env()
+        try:
+            env.reset()
+            with self.assertRaises(UnityGameInstanceException):
+                env.step(np.array([0, 0]))
+            # the step of the second env was cancelled rather than left pending on the loop
+            self.assertEqual(len(asyncio.all_tasks(env._loop)), 0)
+        finally:
+            env.close()
@@ -7,10 +7,23 @@ import shutil
 import subprocess
 import json
 import random
+import multiprocessing
 import numpy as np
 import unity_env
 import gymnasium as gym
 from gymnasium.wrappers import TimeLimit
+from gymnasium.vector import AsyncVectorEnv
+from tensorboard.backend.event_processing import event_accumulator
+from unity_vector_env import UnityAsyncioVectorEnv
+from unity_pool import UnityGameInstancePool, DEFAULT_STARTUP_TIMEOUT
+from unity_protocol import PROTOCOL_JSON
+from unity_io import TRANSPORT_TCP
+from info_db import BufferedDBWriter, init_info_db, get_shard_path, new_shard_id, DEFAULT_BUCKET_SIZE
+from coverage_worker import CoverageWorkerPool
+from obs_dump import ObservationDumpWriter
+from trainer_log import get_logger
+
+logger = get_logger('trainer')
 
 
 class RollingMean:
@@ -23,78 +36,85 @@ class RollingMean:
     def get_mean(self):
         return sum(self.buf)/len(self.buf)
 
+    def state_dict(self):
+        return {'buf_size': self.buf.maxlen, 'values': [float(value) for value in self.buf]}
+
+    def load_state_dict(self, state_dict):
+        self.buf = deque(maxlen=state_dict['buf_size'])
+        for value in state_dict['values']:
+            self.add_value(value)
+
+
+def load_episode_rewards(log_dir, rolling_mean):
+    # fills rolling_mean with the last episode rewards logged to TensorBoard, for checkpoints saved before the
+    # trainers stored their statistics in them (this reads all event files in log_dir, which can take minutes)
+    ea = event_accumulator.EventAccumulator(log_dir)
+    ea.Reload()
+    if 'episode/reward' in ea.scalars.Keys():
+        for evt in ea.scalars.Items('episode/reward')[-rolling_mean.buf.maxlen:]:
+            rolling_mean.add_value(evt.value)
+
 
 class InfoProcessor:
-    def __init__(self, game_config, workdir):
+    def __init__(self, game_config, workdir, shard_id=None):
         self._config_name = game_config['config_name']
         self._coverage_json_path = os.path.join(os.path.dirname(game_config['game_exe']), 'coverage.json')
         self._managed_dir = glob.glob(os.path.join(os.path.dirname(game_config['game_exe']), '*_Data', 'Managed'))[0]
         self._altcover_cmd = os.getenv('RLEXP_ALTCOVER_CMD') or 'altcover'
+        self._coverage_workers = None
+        self._num_coverage_workers = game_config['coverage_workers'] if 'coverage_workers' in game_config else 1
+        self._coverage_max_backlog = game_config['coverage_max_backlog'] if 'coverage_max_backlog' in game_config else 64
         info_db_dir = os.path.dirname(game_config['info_db_path'])
         if not os.path.exists(info_db_dir):
-            print('Creating directory: {}'.format(info_db_dir))
+            logger.info('Creating directory: %s', info_db_dir)
             os.makedirs(info_db_dir)
-        self._db_conn = sqlite3.connect(game_config['info_db_path'])
-        self._init_db()
+        # with 'info_db_sharded' (or a shard_id), every process writes to its own shard next to info_db_path, so that
+        # processes sharing info_db_path do not contend for its write lock; merge_info_db.py merges the shards
+        # afterwards
+        info_db_path = game_config['info_db_path']
+        if shard_id is None and 'info_db_sharded' in game_config and game_config['info_db_sharded']:
+            shard_id = new_shard_id()
+        if shard_id is not None:
+            info_db_path = get_shard_path(info_db_path, shard_id)
+        init_info_db(info_db_path, self._config_name,
+                     game_config['info_db_bucket_size'] if 'info_db_bucket_size' in game_config else DEFAULT_BUCKET_SIZE)
+        self._db_writer = BufferedDBWriter(info_db_path)
         self._info_workdir = os.path.join(workdir, 'InfoProcessing_{}'.format(os.getpid()))
         if os.path.exists(self._info_workdir):
             self._remove_workdir()
         self._obs_dump_dir = os.path.join(workdir, 'ObservationDumps_{}'.format(os.getpid()))
         os.makedirs(self._obs_dump_dir)
+        self._obs_dump = ObservationDumpWriter(
+            self._obs_dump_dir,
+            sample_rate=game_config['obs_dump_rate'] if 'obs_dump_rate' in game_config else 0.05,
+            seed=game_config['obs_dump_seed'] if 'obs_dump_seed' in game_config else None,
+            chunk_size=game_config['obs_dump_chunk_size'] if 'obs_dump_chunk_size' in game_config else 64,
+            compress=game_config['obs_dump_compress'] if 'obs_dump_compress' in game_config else True)
         os.makedirs(self._info_workdir)
 
-    def _init_db(self):
-        with self._db_conn:
-            curs = self._db_conn.cursor()
-            try:
-                curs.execute('create table if not exists states_{} (state_hash int, step_num int)'.format(self._config_name))
-                curs.execute('create table if not exists codecov_{} (seqpt_id int primary key, step_num int)'.format(self._config_name))
-                curs.execute('create table if not exists failures_{} (failure text, step_num int)'.format(self._config_name))
-                curs.execute('create table if not exists actions_{} (num_valid_actions int, step_num int)'.format(self._config_name))
-                curs.execute('create table if not exists time_va_{} (time_valid_actions int, step_num int)'.format(self._config_name))
-                curs.execute('create table if not exists time_pa_{} (time_perform_action int, step_num int)'.format(self._config_name))
-            finally:
-                curs.close()
+    def _get_coverage_workers(self):
+        if self._coverage_workers is None:
+            self._coverage_workers = CoverageWorkerPool(self._coverage_json_path, self._managed_dir, self._altcover_cmd,
+                                                        os.path.join(self._info_workdir, 'coverage'), self._add_covered,
+                                                        num_workers=self._num_coverage_workers,
+                                                        max_backlog=self._coverage_max_backlog)
+        return self._coverage_workers
+
+    def _add_covered(self, seqpt_ids, step_num):
+        self._db_writer.insert('insert or ignore into codecov_{} (seqpt_id, step_num) values (?, ?)'.format(self._config_name),
+                               [(seqpt_id, step_num) for seqpt_id in seqpt_ids])
 
     def process_info(self, info, step_num):
         # State coverage
         if 'state_hash' in info:
             state_hashes = info['state_hash'][info['_state_hash']]
-            with self._db_conn:
-                curs = self._db_conn.cursor()
-                try:
-                    for state_hash in state_hashes:
-                        curs.execute('insert into states_{} (state_hash, step_num) values (?, ?)'.format(self._config_name), (int(state_hash), step_num))
-                finally:
-                    curs.close()
-
-        # Code coverage
+            self._db_writer.insert('insert into states_{} (state_hash, step_num) values (?, ?)'.format(self._config_name),
+                                   [(int(state_hash), step_num) for state_hash in state_hashes])
+
+        # Code coverage (collected in the background, see CoverageWorkerPool)
         if 'codecov_acv' in info:
             codecov_acvs = info['codecov_acv'][info['_codecov_acv']]
-            for i in range(len(codecov_acvs)):
-                acv = codecov_acvs[i]
-                os.rename(acv, os.path.join(self._info_workdir, 'coverage.json.{}.acv'.format(i)))
-            shutil.copy(self._coverage_json_path + '.acv', os.path.join(self._info_workdir, 'coverage.json.acv'))
-            shutil.copy(self._coverage_json_path, os.path.join(self._info_workdir, 'coverage.json'))
-            try:
-                subprocess.run([self._altcover_cmd, 'runner', '--collect', '-r', self._managed_dir], cwd=self._info_workdir, check=True)
-            except (FileNotFoundError, subprocess.CalledProcessError) as e:
-                raise Exception('failed to process code coverage data: make sure altcover is in your PATH')
-            with open(os.path.join(self._info_workdir, 'coverage.json'), 'r') as f:
-                cov = json.load(f)
-            with self._db_conn:
-                curs = self._db_conn.cursor()
-                try:
-                    for modname, files in cov.items():
-                        for filename, classes in files.items():
-                            for classname, methods in classes.items():
-                                for mname, minfo in methods.items():
-                                    for seqpt in minfo['SeqPnts']:
-                                        if seqpt['VC'] > 0:
-                                            curs.execute('insert or ignore into codecov_{} (seqpt_id, step_num) values (?, ?)'
-                                                         .format(self._config_name), (seqpt['Id'], step_num))
-                finally:
-                    curs.close()
+            self._get_coverage_workers().submit(list(codecov_acvs), step_num)
 
         # Failures
         if 'failures' in info:
@@ -102,70 +122,90 @@ class InfoProcessor:
             for env_failures in info['failures'][info['_failures']]:
                 for fail in env_failures.split(';;;;;'):
                     failures.append(fail)
-            with self._db_conn:
-                curs = self._db_conn.cursor()
-                try:
-                    for fail in failures:
-                        curs.execute('insert into failures_{} (failure, step_num) values (?, ?)'.format(self._config_name), (fail, step_num))
-                finally:
-                    curs.close()
+            self._db_writer.insert('insert into failures_{} (failure, step_num) values (?, ?)'.format(self._config_name),
+                                   [(fail, step_num) for fail in failures])
 
         # Time measurement for determining valid actions
         if 'time_valid_actions' in info:
             time_valid_actions = info['time_valid_actions'][info['_time_valid_actions']]
-            with self._db_conn:
-                curs = self._db_conn.cursor()
-                try:
-                    for time_va in time_valid_actions:
-                        curs.execute('insert into time_va_{} (time_valid_actions, step_num) values (?, ?)'.format(self._config_name), (int(time_va), step_num))
-                finally:
-                    curs.close()
+            self._db_writer.insert('insert into time_va_{} (time_valid_actions, step_num) values (?, ?)'.format(self._config_name),
+                                   [(int(time_va), step_num) for time_va in time_valid_actions])
 
         # Time measurement for performing chosen action
         if 'time_perform_action' in info:
             time_perform_action = info['time_perform_action'][info['_time_perform_action']]
-            with self._db_conn:
-                curs = self._db_conn.cursor()
-                try:
-                    for time_pa in time_perform_action:
-                        curs.execute('insert into time_pa_{} (time_perform_action, step_num) values (?, ?)'.format(self._config_name), (int(time_pa), step_num))
-                finally:
-                    curs.close()
+            self._db_writer.insert('insert into time_pa_{} (time_perform_action, step_num) values (?, ?)'.format(self._config_name),
+                                   [(int(time_pa), step_num) for time_pa in time_perform_action])
+
+        # Time waited for a game instance from the warm pool on reset
+        if 'time_pool_lease' in info:
+            time_pool_lease = info['time_pool_lease'][info['_time_pool_lease']]
+            self._db_writer.insert('insert into time_lease_{} (time_pool_lease, step_num) values (?, ?)'.format(self._config_name),
+                                   [(int(time_lease), step_num) for time_lease in time_pool_lease])
 
     def process_observation(self, observation, step_num):
         act_mask = observation['action_mask']
-        with self._db_conn:
-            curs = self._db_conn.cursor()
-            try:
-                for env_act_mask in act_mask:
-                    env_num_valid_actions = int(np.sum(env_act_mask))
-                    curs.execute('insert into actions_{} (num_valid_actions, step_num) values (?, ?)'.format(self._config_name), (env_num_valid_actions, step_num))
-            finally:
-                curs.close()
+        num_valid_actions = np.sum(act_mask, axis=1).astype(np.int64)
+        self._db_writer.insert('insert into actions_{} (num_valid_actions, step_num) values (?, ?)'.format(self._config_name),
+                               [(int(env_num_valid_actions), step_num) for env_num_valid_actions in num_valid_actions])
 
-        if random.random() <= 0.05:
-            save_path = os.path.join(self._obs_dump_dir, 'obs_{}.npy'.format(step_num))
-            if os.path.exists(save_path):
-                os.remove(save_path)
-            np.save(save_path, observation)
+        self._obs_dump.maybe_append(step_num, observation)
 
     def _remove_workdir(self):
-        for f in glob.glob(os.path.join(self._info_workdir, '*.acv')) \
-               + glob.glob(os.path.join(self._info_workdir, '*.json')):
-            os.remove(f)
-        os.rmdir(self._info_workdir)
+        shutil.rmtree(self._info_workdir)
 
     def close(self):
-        if self._db_conn:
-            self._db_conn.close()
-            self._remove_workdir()
+        try:
+            self._obs_dump.close()
+            if self._coverage_workers is not None:
+                self._coverage_workers.close()
+        finally:
+            if self._db_writer:
+                self._db_writer.close()
+                self._remove_workdir()
 
-def make_env(game_config, game_config_path, workdir, port, pre_init_port, is_training):
+def get_env_port_count(game_config):
+    # ports reserved for every env: its own port plus either its pre_init port or the ports of its warm pool
+    return 1 + max(1, game_config['env_config'].get('warm_pool_size', 0))
+
+def get_port_count(game_config):
+    # ports reserved for a training run: the ports of num_envs envs, for each actor process if trainer_config
+    # 'num_actors' is set
+    trainer_config = game_config['trainer_config']
+    num_actors = trainer_config['num_actors'] if 'num_actors' in trainer_config else 0
+    return max(1, num_actors)*game_config['num_envs']*get_env_port_count(game_config)
+
+def make_instance_pool(game_config, game_config_path, workdir, identifier, size, ports, is_training,
+                       port_allocator=None):
+    env_config = game_config['env_config']
+    protocol = env_config['protocol'] if 'protocol' in env_config else PROTOCOL_JSON
+    transport = env_config['transport'] if 'transport' in env_config else TRANSPORT_TCP
+    def new_instance(port):
+        return unity_env.UnityGameInstance(identifier, game_config['game_exe'], '127.0.0.1', port, game_config_path,
+                                           workdir, is_training, blocking=False, protocol=protocol, transport=transport,
+                                           port_allocator=port_allocator)
+    startup_timeout = env_config['pool_startup_timeout'] if 'pool_startup_timeout' in env_config else \
+        DEFAULT_STARTUP_TIMEOUT
+    return UnityGameInstancePool(size, ports, new_instance, startup_timeout=startup_timeout)
+
+def make_env(game_config, game_config_path, workdir, port, pre_init_port, is_training, port_allocator=None):
+    # port_allocator (a PortAllocator) holds the reservations of the env's ports until its game instances are launched
     def _init():
+        if port_allocator is not None and port_allocator.is_forked():
+            # in a worker forked by the 'async' vector env, only the reservations of this env's ports are kept
+            port_allocator.release_all_except(range(port, port + get_env_port_count(game_config)))
         env_id = 'env_{}'.format(port)
         env_workdir = os.path.abspath(os.path.join(workdir, env_id))
         if not os.path.exists(env_workdir):
             os.makedirs(env_workdir)
+        # with env_config 'warm_pool_size', every env keeps its own pool of game instances on its reserved ports,
+        # except in the 'asyncio' vector env, where make_vector_env creates one pool shared by all envs
+        warm_pool_size = game_config['env_config'].get('warm_pool_size', 0)
+        instance_pool = None
+        if warm_pool_size > 0 and game_config['env_config'].get('vector_env', 'async') != 'asyncio':
+            instance_pool = make_instance_pool(game_config, game_config_path, env_workdir, env_id, warm_pool_size,
+                                               list(range(port, port + get_env_port_count(game_config))), is_training,
+                                               port_allocator)
         env = gym.make('USC-SQL/UnityEnv-v0',
                      identifier=env_id,
                      game_exe=game_config['game_exe'],
@@ -174,16 +214,51 @@ def make_env(game_config, game_config_path, workdir, port, pre_init_port, is_tra
                      game_config_path=game_config_path,
                      port=port,
                      pre_init_port=pre_init_port,
-                     training_mode=is_training)
+                     training_mode=is_training,
+                     instance_pool=instance_pool,
+                     port_allocator=port_allocator)
         env = TimeLimit(env, max_episode_steps=game_config['env_config']['time_limit'])
         return env
     return _init
 
+def make_vector_env(env_fns, game_config, game_config_path, workdir, start_port, is_training, port_allocator=None):
+    # env_config 'vector_env' selects how the game instances are driven: 'async' runs every env in its own worker
+    # process, 'asyncio' multiplexes all of them over one event loop in the calling process.
+    # With env_config 'shared_memory', workers write observations into preallocated shared buffers and the returned
+    # batch is a view of those buffers (no copy), which is overwritten by the next step()/reset() call.
+    vector_env = game_config['env_config'].get('vector_env', 'async')
+    shared_memory = game_config['env_config'].get('shared_memory', False)
+    if vector_env == 'async':
+        if port_allocator is not None and multiprocessing.get_start_method() != 'fork':
+            # workers that are not forked cannot inherit the reservations
+            port_allocator.release_all()
+        env = AsyncVectorEnv(env_fns, shared_memory=shared_memory, copy=not shared_memory, daemon=False)
+        if port_allocator is not None:
+            # the workers have started and hold the reservations of their own ports
+            port_allocator.release_all()
+        return env
+    elif vector_env == 'asyncio':
+        warm_pool_size = game_config['env_config'].get('warm_pool_size', 0)
+        instance_pool = None
+        if warm_pool_size > 0:
+            pool_workdir = os.path.abspath(os.path.join(workdir, 'pool'))
+            if not os.path.exists(pool_workdir):
+                os.makedirs(pool_workdir)
+            num_ports = len(env_fns)*get_env_port_count(game_config)
+            instance_pool = make_instance_pool(game_config, game_config_path, pool_workdir, 'pool',
+                                               len(env_fns)*warm_pool_size,
+                                               list(range(start_port, start_port + num_ports)), is_training,
+                                               port_allocator)
+        return UnityAsyncioVectorEnv(env_fns, max_episode_steps=game_config['env_config']['time_limit'],
+                                     copy=not shared_memory, instance_pool=instance_pool)
+    else:
+        raise Exception('unknown vector_env: {}'.format(vector_env))
+
 def get_num_actions(symex_db_path):
     try:
         db_conn = sqlite3.connect(symex_db_path)
     except:
-        print("Failed to open database " + symex_db_path)
+        logger.error('Failed to open database %s', symex_db_path)
         raise
     try:
         curs = db_conn.cursor()
@@ -194,7 +269,7 @@ def get_num_actions(symex_db_path):
             finally:
                 curs.close()
     except:
-        print('Error for {}'.format(symex_db_path))
+        logger.error('Error for %s', symex_db_path)
         raise
     finally:
         db_conn.close()
@@ -0,0 +1,110 @@
+import logging
+import sys
+import time
+import numpy as np
+
+LOGGER_NAME = 'autogym'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+DEFAULT_RATE_LIMIT = 1.0
+DEFAULT_SUMMARY_INTERVAL = 30.0
+
+
+def get_logger(name):
+    return logging.getLogger(LOGGER_NAME + '.' + name)
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through at most one record per interval seconds for every message (logged with the same level by the same
+    # logger); the next record that gets through reports how many were dropped in between. Records at max_level and
+    # above (warnings and errors by default) are never dropped.
+
+    def __init__(self, interval, max_level=logging.WARNING):
+        super().__init__()
+        self._interval = interval
+        self._max_level = max_level
+        # (logger name, level, message) -> [time last let through, number dropped since]
+        self._last = dict()
+
+    def filter(self, record):
+        if record.levelno >= self._max_level:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last[0] < self._interval:
+            last[1] += 1
+            return False
+        if last is not None and last[1] > 0:
+            record.msg = str(record.msg) + ' ({} similar messages suppressed)'.format(last[1])
+        self._last[key] = [now, 0]
+        return True
+
+
+def configure_logging(game_config, is_predict):
+    # Sets up the loggers of the trainers and environments. The level is set by 'log_level' in the configuration
+    # file; it defaults to INFO when training, which leaves out the per-step messages (logged at DEBUG), and to
+    # DEBUG when predicting. 'log_rate_limit' sets the minimum number of seconds between two records of the same
+    # message (by default 1 when training, and 0, which disables rate limiting, when predicting). Also called by the
+    # actor processes, which do not inherit the configuration.
+    level = game_config['log_level'] if 'log_level' in game_config else ('DEBUG' if is_predict else 'INFO')
+    rate_limit = game_config['log_rate_limit'] if 'log_rate_limit' in game_config else \
+        (0 if is_predict else DEFAULT_RATE_LIMIT)
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    if rate_limit > 0:
+        handler.addFilter(RateLimitFilter(rate_limit))
+    logger.addHandler(handler)
+
+
+class StepStats:
+    # Aggregates the valid action counts, actions and rewards of every vector env step, and logs them as a single
+    # summary (mean number of valid actions, mean reward, and the most frequent actions) at INFO every interval
+    # seconds. The individual steps are logged at DEBUG.
+
+    NUM_TOP_ACTIONS = 10
+
+    def __init__(self, logger, num_actions, interval=DEFAULT_SUMMARY_INTERVAL):
+        self._logger = logger
+        self._num_actions = num_actions
+        self._interval = interval
+        self._reset()
+        self._last_summary = time.monotonic()
+
+    def _reset(self):
+        self._num_steps = 0
+        self._valid_action_sum = 0
+        self._reward_sum = 0.0
+        self._action_counts = np.zeros(self._num_actions, dtype=np.int64)
+
+    def add(self, valid_action_counts, actions, rewards):
+        # valid_action_counts has the number of valid actions of every env before the step (the sums of the action
+        # masks of the observations the actions were selected for)
+        valid_action_counts = np.asarray(valid_action_counts)
+        actions = np.asarray(actions)
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug('Valid action counts: %s', valid_action_counts.astype(np.int64).tolist())
+            self._logger.debug('Performing actions: %s', actions)
+            self._logger.debug('Rewards: %s', rewards)
+        self._action_counts += np.bincount(actions, minlength=self._num_actions)
+        self._num_steps += len(actions)
+        self._valid_action_sum += int(valid_action_counts.sum())
+        self._reward_sum += float(np.sum(rewards))
+
+    def log_summary(self, step_num, force=False):
+        # logs the summary if interval seconds have passed since the last one (or if force)
+        now = time.monotonic()
+        if self._num_steps == 0 or (not force and now - self._last_summary < self._interval):
+            return
+        top_actions = np.argsort(-self._action_counts, kind='stable')[:StepStats.NUM_TOP_ACTIONS]
+        self._logger.info('Step %d: %d env steps in %.1fs, mean valid actions: %.1f, mean reward: %.4f, top actions: %s',
+                          step_num, self._num_steps, now - self._last_summary,
+                          self._valid_action_sum/self._num_steps, self._reward_sum/self._num_steps,
+                          ', '.join('{}: {}'.format(action, self._action_counts[action])
+                                    for action in top_actions if self._action_counts[action] > 0))
+        self._reset()
+        self._last_summary = now
@@ -1,12 +1,10 @@
 import gymnasium as gym
 from gymnasium import spaces
 from gymnasium.envs.registration import register
-from collections import deque
 import os.path
 import subprocess
 import socket
 import psutil
-import struct
 import json
 import uuid
 import numpy as np
@@ -14,29 +12,68 @@ import time
 import traceback
 import numpy as mp
 import skimage
+from unity_protocol import PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOLS, decode_message, encode_message
+from unity_io import FrameReader, TRANSPORT_TCP, TRANSPORT_UNIX, TRANSPORTS
+from unity_ports import is_port_free, wait_port_free
+from unity_pool import DEFAULT_LEASE_TIMEOUT
+from unity_framebuffer import IMAGE_TRANSPORT_PNG, IMAGE_TRANSPORT_MMAP, IMAGE_TRANSPORTS, FrameBufferReader
+from image_preprocessing import ImagePreprocessor
+from frame_stack import FrameStack
+from profiling import StageTimings
+from trainer_log import get_logger
+
+logger = get_logger('unity_env')
+
+RESET_MODE_RESTART = 'restart'
+RESET_MODE_SOFT = 'soft'
+RESET_MODES = {RESET_MODE_RESTART, RESET_MODE_SOFT}
+
+# sun_path size on Linux, including the terminating null byte
+UNIX_SOCKET_PATH_MAX = 108
 
 class UnityGameInstanceException(Exception):
     def __init__(self, message):
         super().__init__(message)
 
 class UnityGameInstance:
-    def __init__(self, identifier, game_exe, host_addr, port, game_config_path, work_dir_base, training_mode, blocking=True):
+    def __init__(self, identifier, game_exe, host_addr, port, game_config_path, work_dir_base, training_mode, blocking=True, protocol=PROTOCOL_JSON, transport=TRANSPORT_TCP, port_allocator=None):
+        if protocol not in PROTOCOLS:
+            raise UnityGameInstanceException('unrecognized protocol \'{}\''.format(protocol))
+        if transport not in TRANSPORTS:
+            raise UnityGameInstanceException('unrecognized transport \'{}\''.format(transport))
         self._identifier = identifier
         self._game_exe = game_exe
         self._host_addr = host_addr
         self._port = port
+        # if given, the PortAllocator holding the reservation of port, which is released when the game is launched
+        self._port_allocator = port_allocator
         self._game_config_path = game_config_path
         self._work_dir = os.path.join(work_dir_base, str(uuid.uuid4()))
+        self._transport = transport
+        if transport == TRANSPORT_UNIX:
+            self._socket_path = os.path.join(self._work_dir, 'rlenv.sock')
+            if len(os.fsencode(self._socket_path)) >= UNIX_SOCKET_PATH_MAX:
+                raise UnityGameInstanceException('unix socket path too long (use a shorter work directory): {}'
+                                                 .format(self._socket_path))
+        else:
+            self._socket_path = None
         self._training_mode = training_mode
         self._process = None
         self._socket = None
         self._blocking = blocking
-        self._recvbuf = b''
-        self._msglen = None
+        self._reader = FrameReader()
         self._connected = False
         self._init_msg = None
+        self._requested_protocol = protocol
+        self._protocol = PROTOCOL_JSON
+        self._soft_reset_supported = False
+        self._soft_reset_count = 0
 
     def _check_port_open(self, port):
+        if is_port_free(port, self._host_addr):
+            return True
+        # The port is taken, usually by a game process left behind by a previous run. Only in that case the
+        # system-wide connection table is scanned, to find and kill that process.
         attempts = 0
         max_attempts = 5
         while attempts < max_attempts:
@@ -44,64 +81,45 @@ class UnityGameInstance:
             if len(conn_using) == 0:
                 return True
             conn = conn_using[0]
+            if conn.pid is None:
+                break
             proc = psutil.Process(conn.pid)
             if proc.name() == os.path.basename(self._game_exe):
                 proc.kill()
-                time.sleep(5.0)
+                if wait_port_free(port, 5.0, self._host_addr):
+                    return True
             else:
                 break
             attempts += 1
         raise Exception('port already in use')
 
-    def _receive_bytes(self, n):
-        while len(self._recvbuf) < n:
-            remaining = n - len(self._recvbuf)
-            if self._blocking:
-                data = self._socket.recv(remaining)
-                self._recvbuf += data
-            else:
-                for _ in range(remaining):
-                    try:
-                        data = self._socket.recv(1)
-                        self._recvbuf += data
-                    except BlockingIOError:
-                        break
-                break
-        assert not len(self._recvbuf) > n
-        if len(self._recvbuf) == n:
-            data = self._recvbuf
-            self._recvbuf = b''
-            return data
-        else:
-            return None
-
     def _receive_message(self):
-        if self._msglen is None:
-            blen = self._receive_bytes(4)
-            if blen is not None:
-                self._msglen = struct.unpack('i', blen)[0]
-            else:
-                if self._blocking:
-                    raise UnityGameInstanceException('IO failure: failed to receive message length')
-                else:
-                    return None
-        if self._msglen is not None:
-            bmsg = self._receive_bytes(self._msglen)
-            if bmsg is not None:
-                self._msglen = None
-                return json.loads(bmsg.decode('utf-8'))
-            else:
-                if self._blocking:
-                    raise UnityGameInstanceException('IO failure: failed to receive message')
-                else:
+        while True:
+            frame = self._reader.next_frame()
+            if frame is not None:
+                return decode_message(frame, copy=True)
+            try:
+                if self._reader.fill(self._socket) is None:
                     return None
+            except EOFError:
+                raise UnityGameInstanceException('IO failure: connection closed by game instance')
+            except socket.timeout:
+                raise UnityGameInstanceException('IO failure: timed out waiting for message')
+
+    def receive_available(self):
+        assert not self._blocking
+        messages = []
+        while True:
+            msg = self._receive_message()
+            if msg is None:
+                return messages
+            if self.is_initialized():
+                messages.append(msg)
+            elif msg['ready']:
+                self._set_init_message(msg)
 
     def _send_message(self, msg):
-        s = json.dumps(msg)
-        bmsg = s.encode('utf-8')
-        blen = struct.pack('i', len(bmsg))
-        self._socket.sendall(blen)
-        self._socket.sendall(bmsg)
+        self._socket.sendall(encode_message(msg))
 
     def set_blocking(self, blocking):
         if self._blocking != blocking:
@@ -115,14 +133,19 @@ class UnityGameInstance:
         if self._socket is not None:
             self._socket.close()
             self._socket = None
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reader.reset()
+        family = socket.AF_UNIX if self._transport == TRANSPORT_UNIX else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
         if self._blocking:
             self._socket.settimeout(60)
         else:
             self._socket.setblocking(False)
 
     def start(self):
-        self._check_port_open(self._port)
+        if self._port_allocator is not None:
+            self._port_allocator.release(self._port)
+        if self._transport == TRANSPORT_TCP:
+            self._check_port_open(self._port)
         os.makedirs(self._work_dir)
         env = dict()
         env.update(os.environ)
@@ -133,13 +156,16 @@ class UnityGameInstance:
         env['RLENV_CONFIG'] = self._game_config_path
         env['RLENV_WORKDIR'] = self._work_dir
         env['RLENV_TRAINING_MODE'] = "true" if self._training_mode else "false"
+        env['RLENV_PROTOCOL'] = self._requested_protocol
+        if self._transport == TRANSPORT_UNIX:
+            env['RLENV_SOCKET'] = self._socket_path
         self._process = subprocess.Popen([self._game_exe], env=env, cwd=os.path.dirname(self._game_exe))
         self._init_socket()
 
     def connect(self):
         assert self.is_started()
         if self._connected:
-            print('Warning: called connect() on game instance that is already connected')
+            logger.warning('called connect() on game instance that is already connected')
             return True
         if self._blocking:
             attempts = 0
@@ -147,7 +173,7 @@ class UnityGameInstance:
             while attempts < max_attempts:
                 try:
                     try:
-                        self._socket.connect((self._host_addr, self._port))
+                        self._socket.connect(self._get_address())
                     except OSError as e:
                         if e.errno == 10056 or e.errno == 106: # already connected
                             pass
@@ -156,15 +182,16 @@ class UnityGameInstance:
                     attempts = 0
                     self._connected = True
                     return True
-                except (ConnectionRefusedError, TimeoutError):
+                except (ConnectionRefusedError, TimeoutError, FileNotFoundError):
                     attempts += 1
                     self._init_socket()
                     time.sleep(1.0)
             raise UnityGameInstanceException(
                 'failed to connect to game instance within {} attempts'.format(max_attempts))
         else:
-            res = self._socket.connect_ex((self._host_addr, self._port))
-            if res == 10056 or res == 106: # already connected (windows is 10056, linux is 106)
+            res = self._socket.connect_ex(self._get_address())
+            # already connected (windows is 10056, linux is 106); unix domain sockets connect immediately
+            if res == 10056 or res == 106 or (res == 0 and self._transport == TRANSPORT_UNIX):
                 self._connected = True
                 return True
             else:
@@ -173,38 +200,68 @@ class UnityGameInstance:
     def initialize(self):
         assert self.is_started() and self.is_connected()
         if self.is_initialized():
-            print('Warning: called initialize() on already initialized game instance')
+            logger.warning('called initialize() on already initialized game instance')
             return True
         else:
             if self._blocking:
                 while True:
                     msg = self._receive_message()
                     if msg['ready']:
-                        self._init_msg = msg
+                        self._set_init_message(msg)
                         return True
             else:
                 msg = self._receive_message()
                 if msg is None:
                     return False
                 if msg['ready']:
-                    self._init_msg = msg
+                    self._set_init_message(msg)
                     return True
                 else:
                     return False
 
+    def _set_init_message(self, msg):
+        self._init_msg = msg
+        self._protocol = msg['protocol'] if 'protocol' in msg else PROTOCOL_JSON
+        self._soft_reset_supported = 'softReset' in msg and msg['softReset']
+        if self._protocol != self._requested_protocol:
+            logger.warning('game instance does not support the %s protocol, using %s instead',
+                           self._requested_protocol, self._protocol)
+
+    def poll(self):
+        assert self.is_started() and not self._blocking
+        if not self.is_connected():
+            self.connect()
+        elif not self.is_initialized():
+            self.receive_available()
+        return self.is_initialized()
+
     def send_action(self, action):
         self._send_message({'action': int(action)})
 
     def send_wait(self):
         self._send_message({'wait': True})
 
+    def soft_reset(self):
+        # Asks the running game to return to its initial state; the new init message is then received through
+        # initialize() (or poll()/receive_available() when non-blocking)
+        assert self.is_initialized() and self._soft_reset_supported
+        self._init_msg = None
+        self._soft_reset_count += 1
+        self._send_message({'reset': True})
+
     def receive_state(self):
         assert self.is_connected() and self.is_initialized()
         return self._receive_message()
 
+    def _get_address(self):
+        return self._socket_path if self._transport == TRANSPORT_UNIX else (self._host_addr, self._port)
+
     def get_port(self):
         return self._port
 
+    def get_socket(self):
+        return self._socket
+
     def is_started(self):
         return self._process is not None
 
@@ -217,6 +274,15 @@ class UnityGameInstance:
     def get_init_message(self):
         return self._init_msg
 
+    def get_protocol(self):
+        return self._protocol
+
+    def supports_soft_reset(self):
+        return self._soft_reset_supported
+
+    def get_soft_reset_count(self):
+        return self._soft_reset_count
+
     def close(self):
         if self._socket is not None:
             self._socket.close()
@@ -226,11 +292,33 @@ class UnityGameInstance:
                 self._process.wait(timeout=60)
             except subprocess.TimeoutExpired:
                 raise Exception('failed to terminate game process')
+        if self._socket_path is not None and os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+
+def make_spaces(env_config):
+    # Observation and action spaces of UnityEnv, which only depend on env_config, so trainers can get them without
+    # creating an environment. UnityEnv checks them against the init message of the game.
+    if env_config['observation_includes_image']:
+        [w, h] = env_config['image_resize_to']
+        num_obs_channels = env_config['observation_stack'] if 'observation_stack' in env_config else 1
+        obs_space = spaces.Box(low=0, high=255, shape=(num_obs_channels, h, w), dtype=np.uint8)
+    else:
+        obs_space = spaces.Box(low=-np.inf, high=np.inf,
+                               shape=(env_config['num_observation_features'],), dtype=np.float32)
+        if 'observation_stack' in env_config:
+            raise Exception('observation_stack with vector observations is not supported')
+    action_space = spaces.Discrete(env_config['num_actions'])
+    observation_space = spaces.Dict({
+        'obs': obs_space,
+        'action_mask': spaces.Box(low=0, high=1, shape=(action_space.n,), dtype=np.float32)
+    })
+    return observation_space, action_space
+
 
 class UnityEnv(gym.Env):
     metadata = {'render_modes': ['human']}
 
-    def __init__(self, identifier, game_exe, env_config, game_config_path, work_dir, port, host_addr='127.0.0.1', pre_init_port=None, training_mode=False):
+    def __init__(self, identifier, game_exe, env_config, game_config_path, work_dir, port, host_addr='127.0.0.1', pre_init_port=None, training_mode=False, instance_pool=None, port_allocator=None):
         required_params = {'identifier', 'game_exe', 'game_config_path', 'work_dir', 'port'}
         for param in required_params:
             if not locals()[param]:
@@ -239,18 +327,12 @@ class UnityEnv(gym.Env):
         if self._is_image_obs:
             [w, h] = env_config['image_resize_to']
             self._resize_image_to = (h, w)
-            num_obs_channels = env_config['observation_stack'] if 'observation_stack' in env_config else 1
-            obs_space = spaces.Box(low=0, high=255, shape=(num_obs_channels, h, w), dtype=np.uint8)
-        else:
-            obs_space = spaces.Box(low=-np.inf, high=np.inf,
-                                   shape=(env_config['num_observation_features'],), dtype=np.float32)
-            if 'observation_stack' in env_config:
-                raise Exception('observation_stack with vector observations is not supported')
-        self.action_space = spaces.Discrete(env_config['num_actions'])
-        self.observation_space = spaces.Dict({
-            'obs': obs_space,
-            'action_mask': spaces.Box(low=0, high=1, shape=(self.action_space.n,), dtype=np.float32)
-        })
+            self._preprocessor = ImagePreprocessor(self._resize_image_to)
+            self._image_transport = env_config['image_transport'] if 'image_transport' in env_config else IMAGE_TRANSPORT_PNG
+            if self._image_transport not in IMAGE_TRANSPORTS:
+                raise Exception('unrecognized image transport \'{}\''.format(self._image_transport))
+            self._frame_reader = None
+        self.observation_space, self.action_space = make_spaces(env_config)
         self._identifier = identifier
         self._game_exe = game_exe
         self._host_addr = host_addr
@@ -258,43 +340,176 @@ class UnityEnv(gym.Env):
         self._game_config_path = game_config_path
         self._work_dir = work_dir
         self._training_mode = training_mode
+        self._port_allocator = port_allocator
+        self._protocol = env_config['protocol'] if 'protocol' in env_config else PROTOCOL_JSON
+        self._transport = env_config['transport'] if 'transport' in env_config else TRANSPORT_TCP
+        # 'soft' resets reuse the running game process for up to max_soft_resets episodes (unlimited if not set),
+        # falling back to a full restart when the game does not support it or the reset fails
+        self._reset_mode = env_config['reset_mode'] if 'reset_mode' in env_config else RESET_MODE_RESTART
+        if self._reset_mode not in RESET_MODES:
+            raise Exception('unrecognized reset mode \'{}\''.format(self._reset_mode))
+        self._max_soft_resets = env_config['max_soft_resets'] if 'max_soft_resets' in env_config else None
         self._game_inst = None
         self._pre_init = pre_init_port is not None
         if self._pre_init:
             self._pre_init_port = pre_init_port
             self._pre_init_inst = None
+        # game instances are leased from instance_pool (a UnityGameInstancePool owned by this env) if given; reset
+        # raises if none becomes ready within pool_lease_timeout seconds
+        self._instance_pool = instance_pool
+        self._pool_lease_timeout = env_config['pool_lease_timeout'] if 'pool_lease_timeout' in env_config else \
+            DEFAULT_LEASE_TIMEOUT
+        if self._pre_init and self._instance_pool is not None:
+            raise Exception('pre_init and instance_pool cannot be used together')
         self._action_mask = np.array([1.0] + [0.0]*(self.action_space.n-1), dtype=np.float32)
-        self._obs_buffer = deque(maxlen=env_config['observation_stack'] if 'observation_stack' in env_config else 1)
+        if self._is_image_obs:
+            self._frame_stack = FrameStack(self.observation_space['obs'].shape[0], self._resize_image_to, dtype=np.uint8)
+            self._lazy_frames = 'observation_stack_lazy' in env_config and env_config['observation_stack_lazy']
+        self._done_obs = np.zeros(self.observation_space['obs'].shape, self.observation_space['obs'].dtype)
+        self._done_obs.flags.writeable = False
+        # with env_config 'profile', the time spent in every stage of step()/reset() is returned in the info dict
+        self._timings = StageTimings(enabled=env_config['profile'] if 'profile' in env_config else False)
+
+    def _update_action_mask(self, msg):
+        if 'actionMask' in msg:
+            np.copyto(self._action_mask, msg['actionMask'], casting='unsafe')
+        else:
+            self._action_mask.fill(1.0)
+            invalid_actions = msg['invalidActions']
+            if len(invalid_actions) > 0:
+                self._action_mask[np.array(invalid_actions, dtype=np.int64)] = 0.0
+
+    def _read_image(self, img_path):
+        if self._image_transport == IMAGE_TRANSPORT_MMAP:
+            if self._frame_reader is None or self._frame_reader.get_path() != img_path:
+                self._close_frame_reader()
+                self._frame_reader = FrameBufferReader(img_path)
+            return self._frame_reader.read_frame()
+        else:
+            return skimage.io.imread(img_path)
 
-    def _update_action_mask(self, invalid_actions):
-        invalid_action_set = set(invalid_actions)
-        for action in range(0, self.action_space.n):
-            self._action_mask[action] = 0.0 if action in invalid_action_set else 1.0
+    def _close_frame_reader(self):
+        if self._is_image_obs and self._frame_reader is not None:
+            self._frame_reader.close()
+            self._frame_reader = None
 
     def _read_observation(self, observation):
         if self._is_image_obs:
             img_path = observation['img']
-            img_data = skimage.io.imread(img_path)
-            img_data = skimage.color.rgb2gray(
-                skimage.transform.resize(img_data[:,:,:3], self._resize_image_to,
-                                                anti_aliasing=False, preserve_range=True)).astype(np.uint8)
-            self._obs_buffer.append(img_data)
-            layers = list(self._obs_buffer)
-            while len(layers) < self._obs_buffer.maxlen:
-                layers.append(layers[-1])
-            img_data = np.stack(layers)
-            os.remove(img_path)
-            return img_data
+            self._preprocessor.process(self._read_image(img_path), out=self._frame_stack.next_slot())
+            self._frame_stack.commit()
+            if self._image_transport == IMAGE_TRANSPORT_PNG:
+                os.remove(img_path)
+            if self._lazy_frames:
+                return self._frame_stack.lazy()
+            else:
+                return self._frame_stack.stacked()
         else:
             return np.array(observation, dtype=np.float32)
 
     def _read_info(self, info):
         return info
 
+    # The methods below let a vector env drive the game instances of this env itself (see UnityAsyncioVectorEnv):
+    # it starts, leases or soft resets the instances, attaches them to the env and lets the env turn their
+    # messages into observations.
+
+    def get_game_instance(self):
+        return self._game_inst
+
+    def get_port(self):
+        return self._game_port
+
+    def uses_pre_init(self):
+        return self._pre_init
+
+    def get_pool_lease_timeout(self):
+        return self._pool_lease_timeout
+
+    def get_timings(self):
+        return self._timings
+
+    def new_game_instance(self, port, blocking):
+        return UnityGameInstance(self._identifier, self._game_exe, self._host_addr, port, self._game_config_path,
+                                 self._work_dir, self._training_mode, blocking=blocking, protocol=self._protocol,
+                                 transport=self._transport, port_allocator=self._port_allocator)
+
+    def detach_game_instance(self):
+        self._close_frame_reader()
+        game_inst = self._game_inst
+        self._game_inst = None
+        return game_inst
+
+    def attach_game_instance(self, game_inst):
+        self._game_inst = game_inst
+
+    def process_init_message(self):
+        msg = self._game_inst.get_init_message()
+        if msg['numActions'] != self.action_space.n:
+            raise Exception('action space size in configuration ({}) does not match game client ({})'.format(self.action_space.n, msg['numActions']))
+        self._update_action_mask(msg)
+        with self._timings.stage('env/read_observation'):
+            obs = self._read_observation(msg['observation'])
+        if obs.shape != self.observation_space['obs'].shape:
+            raise Exception('observation shape in configuration ({}) does not match game client ({})'.format(self.observation_space['obs'].shape, obs.shape))
+        info = self._read_info(msg['info'])
+        observation = {'obs': obs, 'action_mask': self._action_mask}
+        return observation, info
+
+    def process_state_message(self, msg):
+        reward = msg['reward']
+        done = msg['done']
+        if not done:
+            with self._timings.stage('env/read_observation'):
+                obs = self._read_observation(msg['observation'])
+            info = self._read_info(msg['info'])
+            self._update_action_mask(msg)
+        else:
+            obs = self._done_obs
+            info = dict()
+        observation = {'obs': obs, 'action_mask': self._action_mask}
+        return observation, reward, done, False, info
+
+    def can_soft_reset(self, game_inst):
+        return self._reset_mode == RESET_MODE_SOFT and game_inst is not None and game_inst.supports_soft_reset() and \
+            (self._max_soft_resets is None or game_inst.get_soft_reset_count() < self._max_soft_resets)
+
+    def _soft_reset(self, game_inst):
+        try:
+            game_inst.soft_reset()
+            game_inst.initialize()
+        except (UnityGameInstanceException, OSError) as e:
+            logger.warning('soft reset failed, restarting game instance: %s', e)
+            return False
+        self.attach_game_instance(game_inst)
+        return True
+
+    def _reset_from_pool(self, prev_inst):
+        if prev_inst is not None:
+            self._instance_pool.release(prev_inst)
+        lease_start = time.perf_counter()
+        game_inst = self._instance_pool.lease(timeout=self._pool_lease_timeout)
+        lease_time = time.perf_counter() - lease_start
+        game_inst.set_blocking(True)
+        self.attach_game_instance(game_inst)
+        observation, info = self.process_init_message()
+        info = dict(info)
+        info['time_pool_lease'] = int(lease_time*1000)
+        return observation, info
+
     def reset(self, seed=None, options=None):
-        if self._game_inst is not None:
-            self._game_inst.close()
-            self._game_inst = None
+        with self._timings.stage('env/reset'):
+            observation, info = self._reset()
+        return observation, self._timings.add_to_info(info)
+
+    def _reset(self):
+        prev_inst = self.detach_game_instance()
+        if self.can_soft_reset(prev_inst) and self._soft_reset(prev_inst):
+            return self.process_init_message()
+        if self._instance_pool is not None:
+            return self._reset_from_pool(prev_inst)
+        if prev_inst is not None:
+            prev_inst.close()
         if self._pre_init and self._pre_init_inst is not None:
             prev_port = self._game_port
             self._game_port = self._pre_init_port
@@ -303,9 +518,9 @@ class UnityEnv(gym.Env):
             self._pre_init_inst = None
             self._game_inst.set_blocking(True)
         else:
-            self._game_inst = UnityGameInstance(self._identifier, self._game_exe, self._host_addr, self._game_port, self._game_config_path, self._work_dir, self._training_mode, blocking=True)
+            self._game_inst = self.new_game_instance(self._game_port, blocking=True)
         if self._pre_init:
-            self._pre_init_inst = UnityGameInstance(self._identifier, self._game_exe, self._host_addr, self._pre_init_port, self._game_config_path, self._work_dir, self._training_mode, blocking=False)
+            self._pre_init_inst = self.new_game_instance(self._pre_init_port, blocking=False)
             self._pre_init_inst.start()
         if not self._game_inst.is_started():
             self._game_inst.start()
@@ -314,40 +529,29 @@ class UnityEnv(gym.Env):
             self._game_inst.connect()
         if not self._game_inst.is_initialized():
             self._game_inst.initialize()
-        if self._pre_init and self._pre_init_inst.connect(): # try connecting/initializing once to background copy
-            self._pre_init_inst.initialize()
-        msg = self._game_inst.get_init_message()
-        if msg['numActions'] != self.action_space.n:
-            raise Exception('action space size in configuration ({}) does not match game client ({})'.format(self.action_space.n, msg['numActions']))
-        self._update_action_mask(msg['invalidActions'])
-        obs = self._read_observation(msg['observation'])
-        info = self._read_info(msg['info'])
-        observation = {'obs': obs, 'action_mask': self._action_mask}
-        return observation, info
+        if self._pre_init: # try connecting/initializing once to background copy
+            self._pre_init_inst.poll()
+        return self.process_init_message()
 
     def step(self, action):
         if self._pre_init:
-            if not self._pre_init_inst.is_connected():
-                self._pre_init_inst.connect()
-            elif not self._pre_init_inst.is_initialized():
-                self._pre_init_inst.initialize()
-            else:
-                self._pre_init_inst.send_wait()
-        self._game_inst.send_action(action)
-        msg = self._game_inst.receive_state()
-        reward = msg['reward']
-        done = msg['done']
-        if not done:
-            obs = self._read_observation(msg['observation'])
-            info = self._read_info(msg['info'])
-            self._update_action_mask(msg['invalidActions'])
-        else:
-            obs = np.zeros(self.observation_space['obs'].shape, self.observation_space['obs'].dtype)
-            info = dict()
-        observation = {'obs': obs, 'action_mask': self._action_mask}
-        return observation, reward, done, False, info
+            with self._timings.stage('env/pre_init_poll'):
+                if self._pre_init_inst.poll():
+                    self._pre_init_inst.send_wait()
+        with self._timings.stage('env/send_action'):
+            self._game_inst.send_action(action)
+        with self._timings.stage('env/receive_state'):
+            msg = self._game_inst.receive_state()
+        observation, reward, terminated, truncated, info = self.process_state_message(msg)
+        return observation, reward, terminated, truncated, self._timings.add_to_info(info)
 
     def close(self):
+        self._close_frame_reader()
+        if self._instance_pool is not None:
+            if self._game_inst is not None:
+                self._instance_pool.release(self._game_inst)
+                self._game_inst = None
+            self._instance_pool.close()
         if self._game_inst is not None:
             self._game_inst.close()
             self._game_inst = None
@@ -0,0 +1,82 @@
+import mmap
+import os
+import struct
+import numpy as np
+
+IMAGE_TRANSPORT_PNG = 'png'
+IMAGE_TRANSPORT_MMAP = 'mmap'
+IMAGE_TRANSPORTS = {IMAGE_TRANSPORT_PNG, IMAGE_TRANSPORT_MMAP}
+
+# Layout written by FrameBufferWriter.cs (little-endian, 64 byte header followed by the pixel data):
+#   magic (4s), version (u4), sequence number (u8), width (u4), height (u4), channels (u4),
+#   flags (u4, bit 0 = rows stored bottom-up), data offset (u4)
+FRAMEBUFFER_MAGIC = b'AGFB'
+FRAMEBUFFER_HEADER = struct.Struct('<4sIQIIIII')
+FRAMEBUFFER_FLAG_BOTTOM_UP = 0x1
+
+
+class UnityFrameBufferException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class FrameBufferReader:
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._mmap = None
+        self._last_seq = None
+        self._map()
+
+    def _map(self):
+        self.close()
+        self._file = open(self._path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_path(self):
+        return self._path
+
+    def _is_replaced(self):
+        # whether the path now refers to another file than the one that is mapped
+        try:
+            return os.stat(self._path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _read_header(self):
+        magic, _, seq, width, height, channels, flags, offset = FRAMEBUFFER_HEADER.unpack_from(self._mmap, 0)
+        if magic != FRAMEBUFFER_MAGIC:
+            raise UnityFrameBufferException('invalid frame buffer header in {}'.format(self._path))
+        return seq, width, height, channels, flags, offset
+
+    def read_frame(self):
+        # Returns a (height, width, channels) uint8 view of the latest frame, top row first. The view aliases the
+        # mapping, so it is only valid until the game writes its next frame (i.e. until the next action is sent).
+        # Sequence numbers only increase, so a frame that is not newer than the last one read is rejected (unless
+        # the file was replaced, by a writer with sequence numbers of its own).
+        seq, width, height, channels, flags, offset = self._read_header()
+        if self._last_seq is not None and seq <= self._last_seq and self._is_replaced():
+            # the replaced file is only visible in a new mapping
+            self._map()
+            self._last_seq = None
+            seq, width, height, channels, flags, offset = self._read_header()
+        if self._last_seq is not None and seq <= self._last_seq:
+            raise UnityFrameBufferException('no new frame written to {} (sequence number {}, last read {})'
+                                            .format(self._path, seq, self._last_seq))
+        size = width*height*channels
+        if offset + size > len(self._mmap):
+            # the game enlarged the file for a bigger frame
+            self._map()
+        self._last_seq = seq
+        frame = np.frombuffer(self._mmap, dtype=np.uint8, count=size, offset=offset).reshape((height, width, channels))
+        if flags & FRAMEBUFFER_FLAG_BOTTOM_UP:
+            frame = frame[::-1]
+        return frame
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,75 @@
+import struct
+
+FRAME_LENGTH = struct.Struct('i')
+
+TRANSPORT_TCP = 'tcp'
+TRANSPORT_UNIX = 'unix'
+TRANSPORTS = {TRANSPORT_TCP, TRANSPORT_UNIX}
+
+
+class FrameReader:
+    # Buffered reader of the length-prefixed messages of a game socket, which reads whatever is available and
+    # splits it into frames without a recv per message. With non-blocking sockets, it is drained through
+    # UnityGameInstance.receive_available(); the loop that multiplexes the sockets of many game instances is the
+    # event loop of UnityAsyncioVectorEnv (unity_vector_env.py).
+
+    def __init__(self, initial_size=64*1024):
+        self._buf = bytearray(initial_size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+
+    def _reserve(self, n):
+        if len(self._buf) - self._end >= n:
+            return
+        pending = self._end - self._start
+        if self._start > 0:
+            self._view[:pending] = self._view[self._start:self._end]
+            self._start = 0
+            self._end = pending
+        if len(self._buf) - self._end < n:
+            size = len(self._buf)
+            while size - self._end < n:
+                size *= 2
+            buf = bytearray(size)
+            buf[:self._end] = self._view[:self._end]
+            self._buf = buf
+            self._view = memoryview(buf)
+
+    def fill(self, sock):
+        # Reads whatever the socket has available into the buffer. Returns the number of bytes read,
+        # or None if the socket is non-blocking and has no data. Raises EOFError if the peer closed.
+        pending = self._end - self._start
+        needed = 4096
+        if pending >= FRAME_LENGTH.size:
+            needed = max(needed, FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(self._buf, self._start)[0] - pending)
+        self._reserve(needed)
+        try:
+            n = sock.recv_into(self._view[self._end:])
+        except BlockingIOError:
+            return None
+        if n == 0:
+            raise EOFError('connection closed by peer')
+        self._end += n
+        return n
+
+    def next_frame(self):
+        # Returns a memoryview of the next complete frame payload, or None. The view is only valid until
+        # the next call to fill() or reset().
+        pending = self._end - self._start
+        if pending < FRAME_LENGTH.size:
+            return None
+        msglen = FRAME_LENGTH.unpack_from(self._buf, self._start)[0]
+        if msglen < 0:
+            raise ValueError('invalid frame length {}'.format(msglen))
+        if pending < FRAME_LENGTH.size + msglen:
+            return None
+        frame_start = self._start + FRAME_LENGTH.size
+        self._start = frame_start + msglen
+        if self._start == self._end:
+            self._start = self._end = 0
+        return self._view[frame_start:frame_start + msglen]
+
+    def reset(self):
+        self._start = self._end = 0
+
@@ -0,0 +1,171 @@
+import threading
+import time
+import traceback
+from collections import deque
+from trainer_log import get_logger
+
+logger = get_logger('unity_pool')
+
+DEFAULT_STARTUP_TIMEOUT = 120.0
+DEFAULT_LEASE_TIMEOUT = 300.0
+
+
+class UnityGameInstancePoolException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class UnityGameInstancePool:
+    # Keeps up to size game instances started, connected and initialized in the background, so that an
+    # environment reset only has to lease one instead of launching a game. Every instance occupies one of the
+    # given ports until it has been released and closed, so ports should hold size ports plus one for every
+    # instance that is leased at the same time. An instance that fails to start, or is not initialized within
+    # startup_timeout seconds, is closed and counted as a failure, and a new one is started in its place.
+    # instance_factory(port) must return a new non-blocking UnityGameInstance.
+
+    def __init__(self, size, ports, instance_factory, poll_interval=0.05, startup_timeout=DEFAULT_STARTUP_TIMEOUT):
+        if size < 1:
+            raise UnityGameInstancePoolException('pool size must be at least 1')
+        if len(ports) < size:
+            raise UnityGameInstancePoolException('pool of size {} needs at least {} ports, got {}'
+                                                 .format(size, size, len(ports)))
+        self._size = size
+        self._instance_factory = instance_factory
+        self._poll_interval = poll_interval
+        self._startup_timeout = startup_timeout
+        self._free_ports = deque(ports)
+        # (instance, startup deadline) of the instances that are not initialized yet
+        self._starting = []
+        self._ready = deque()
+        self._releasing = deque()
+        self._leases = 0
+        self._lease_wait_total = 0.0
+        self._lease_wait_max = 0.0
+        self._failures = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='UnityGameInstancePool', daemon=True)
+        self._thread.start()
+
+    def _close_instance(self, game_inst):
+        try:
+            game_inst.close()
+        except Exception:
+            traceback.print_exc()
+        with self._cond:
+            self._free_ports.append(game_inst.get_port())
+
+    def _fail_instance(self, game_inst):
+        with self._cond:
+            self._failures += 1
+        self._close_instance(game_inst)
+
+    def _refill(self):
+        # start new instances on free ports until the pool is full
+        while True:
+            with self._cond:
+                if self._closed or len(self._free_ports) == 0 or \
+                        len(self._starting) + len(self._ready) >= self._size:
+                    return
+                port = self._free_ports.popleft()
+            game_inst = self._instance_factory(port)
+            try:
+                game_inst.start()
+            except Exception:
+                traceback.print_exc()
+                self._fail_instance(game_inst)
+                return
+            self._starting.append((game_inst, time.monotonic() + self._startup_timeout))
+
+    def _poll_starting(self):
+        still_starting = []
+        for game_inst, deadline in self._starting:
+            try:
+                initialized = game_inst.poll()
+            except Exception:
+                traceback.print_exc()
+                self._fail_instance(game_inst)
+                continue
+            if initialized:
+                with self._cond:
+                    self._ready.append(game_inst)
+                    self._cond.notify_all()
+            elif time.monotonic() >= deadline:
+                logger.warning('game instance on port %d was not initialized within %s seconds, restarting it',
+                               game_inst.get_port(), self._startup_timeout)
+                self._fail_instance(game_inst)
+            else:
+                still_starting.append((game_inst, deadline))
+        self._starting = still_starting
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    break
+                releasing = list(self._releasing)
+                self._releasing.clear()
+            for game_inst in releasing:
+                self._close_instance(game_inst)
+            self._refill()
+            self._poll_starting()
+            with self._cond:
+                if not self._closed and len(self._releasing) == 0:
+                    self._cond.wait(self._poll_interval)
+        for game_inst, _ in self._starting:
+            self._close_instance(game_inst)
+        self._starting = []
+
+    def lease(self, timeout=None):
+        # Returns an initialized, non-blocking game instance, waiting for one to become ready if necessary.
+        # The caller owns the instance until it hands it back through release().
+        wait_start = time.perf_counter()
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._closed or len(self._ready) > 0, timeout):
+                raise UnityGameInstancePoolException('no game instance became ready within {} seconds '
+                                                     '({} failed to start)'.format(timeout, self._failures))
+            if self._closed:
+                raise UnityGameInstancePoolException('game instance pool is closed')
+            game_inst = self._ready.popleft()
+            wait = time.perf_counter() - wait_start
+            self._leases += 1
+            self._lease_wait_total += wait
+            self._lease_wait_max = max(self._lease_wait_max, wait)
+            self._cond.notify_all()
+        return game_inst
+
+    def release(self, game_inst):
+        # Hands a leased instance back to the pool, which closes it in the background and reuses its port
+        with self._cond:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._releasing.append(game_inst)
+                self._cond.notify_all()
+        if closed:
+            self._close_instance(game_inst)
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'leases': self._leases,
+                'lease_wait_mean': self._lease_wait_total/self._leases if self._leases > 0 else 0.0,
+                'lease_wait_max': self._lease_wait_max,
+                'ready': len(self._ready),
+                'failures': self._failures
+            }
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            ready = list(self._ready)
+            self._ready.clear()
+            releasing = list(self._releasing)
+            self._releasing.clear()
+            self._cond.notify_all()
+        self._thread.join()
+        for game_inst in ready + releasing:
+            self._close_instance(game_inst)
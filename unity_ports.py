@@ -0,0 +1,94 @@
+import os
+import socket
+import time
+
+
+def is_port_free(port, host='127.0.0.1'):
+    # A port is free if a listener could be bound to it. SO_REUSEADDR makes ports that only have connections in
+    # TIME_WAIT count as free, as the game's listener can bind to those as well.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def wait_port_free(port, timeout, host='127.0.0.1', interval=0.05):
+    deadline = time.monotonic() + timeout
+    while not is_port_free(port, host):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+class PortAllocator:
+    # Finds and reserves ranges of TCP ports by binding them, instead of scanning the system-wide connection table.
+    # Reserved ports stay bound by this allocator until they are released, right before game instances are launched
+    # on them. Processes forked while ports are reserved inherit the bound sockets, and an allocator passed to a
+    # spawned process brings them along, so a port is only free once every process holding it has released it: child
+    # processes keep the ports they launch games on (see release_all_except) and the parent releases its copies once
+    # they have started.
+
+    def __init__(self, host='127.0.0.1', min_port=12000, max_port=60000):
+        self._host = host
+        self._min_port = min_port
+        self._max_port = max_port
+        self._reserved = dict()
+        # process that made or kept the reservations
+        self._pid = os.getpid()
+
+    def is_forked(self):
+        # whether this is a copy of the allocator in another process that has not called release_all_except yet
+        return os.getpid() != self._pid
+
+    def _bind(self, port):
+        # bound without SO_REUSEADDR, so that nobody else can bind the port while it is reserved
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind((self._host, port))
+        except OSError:
+            sock.close()
+            return None
+        return sock
+
+    def reserve_range(self, num_ports):
+        # Reserves num_ports consecutive ports and returns the first one
+        start_port = self._min_port
+        while start_port + num_ports <= self._max_port:
+            held = []
+            for port in range(start_port, start_port + num_ports):
+                sock = self._bind(port) if port not in self._reserved else None
+                if sock is None:
+                    for held_sock in held:
+                        held_sock.close()
+                    held = None
+                    start_port = port + 1
+                    break
+                held.append(sock)
+            if held is not None:
+                for port, sock in zip(range(start_port, start_port + num_ports), held):
+                    self._reserved[port] = sock
+                return start_port
+        raise Exception('failed to find sufficient open port range')
+
+    def release(self, port):
+        sock = self._reserved.pop(port, None)
+        if sock is not None:
+            sock.close()
+
+    def release_all_except(self, ports):
+        # keeps the reservations of ports only, which then belong to the calling process
+        self._pid = os.getpid()
+        ports = set(ports)
+        for port in list(self._reserved.keys()):
+            if port not in ports:
+                self.release(port)
+
+    def release_all(self):
+        for port in list(self._reserved.keys()):
+            self.release(port)
@@ -0,0 +1,74 @@
+import struct
+import json
+import numpy as np
+
+PROTOCOL_JSON = 'json'
+PROTOCOL_BINARY = 'binary'
+PROTOCOLS = {PROTOCOL_JSON, PROTOCOL_BINARY}
+
+# Binary state messages (sent by the game once the binary protocol has been negotiated in the
+# init message) have the following little-endian layout after the 4-byte length prefix:
+#   header: magic (4s), flags (u1, bit 0 = done), 3 pad bytes, reward (f4),
+#           num_obs (u4), num_actions (u4), num_info (u4), extra_len (u4)
+#   observation vector: num_obs * f4
+#   action mask: num_actions * u1 (1 = valid, 0 = invalid)
+#   numeric info fields: num_info * (key: 32 bytes NUL-padded UTF-8, value: i8)
+#   extra: extra_len bytes of UTF-8 JSON holding the non-numeric parts of the observation/info
+BINARY_MAGIC = b'AGB1'
+BINARY_HEADER = struct.Struct('<4sB3xfIIII')
+BINARY_FLAG_DONE = 0x1
+INFO_KEY_LENGTH = 32
+INFO_DTYPE = np.dtype([('key', 'S{}'.format(INFO_KEY_LENGTH)), ('value', '<i8')])
+
+
+class ProtocolException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+def is_binary_message(buf):
+    return len(buf) >= BINARY_HEADER.size and bytes(buf[:len(BINARY_MAGIC)]) == BINARY_MAGIC
+
+
+def decode_message(buf, copy=False):
+    # Arrays in the decoded message are views of buf unless copy is set, which is needed when buf is reused.
+    if not is_binary_message(buf):
+        return json.loads(bytes(buf).decode('utf-8'))
+    _, flags, reward, num_obs, num_actions, num_info, extra_len = BINARY_HEADER.unpack_from(buf, 0)
+    expected_len = BINARY_HEADER.size + 4*num_obs + num_actions + INFO_DTYPE.itemsize*num_info + extra_len
+    if len(buf) != expected_len:
+        raise ProtocolException('malformed binary message: expected {} bytes, got {}'.format(expected_len, len(buf)))
+    msg = {'reward': float(reward), 'done': bool(flags & BINARY_FLAG_DONE)}
+    if msg['done']:
+        return msg
+    offset = BINARY_HEADER.size
+    obs = np.frombuffer(buf, dtype='<f4', count=num_obs, offset=offset)
+    offset += obs.nbytes
+    action_mask = np.frombuffer(buf, dtype=np.uint8, count=num_actions, offset=offset)
+    offset += action_mask.nbytes
+    info_fields = np.frombuffer(buf, dtype=INFO_DTYPE, count=num_info, offset=offset)
+    offset += info_fields.nbytes
+    info = {key.decode('utf-8'): int(value) for key, value in zip(info_fields['key'], info_fields['value'])}
+    if extra_len > 0:
+        extra = json.loads(bytes(buf[offset:offset + extra_len]).decode('utf-8'))
+    else:
+        extra = {}
+    if copy:
+        obs = obs.copy()
+        action_mask = action_mask.copy()
+    if 'info' in extra:
+        info.update(extra['info'])
+    if 'observation' in extra:
+        observation = dict(extra['observation'])
+        observation['vec'] = obs
+    else:
+        observation = obs
+    msg['observation'] = observation
+    msg['info'] = info
+    msg['actionMask'] = action_mask
+    return msg
+
+
+def encode_message(msg):
+    bmsg = json.dumps(msg).encode('utf-8')
+    return struct.pack('i', len(bmsg)) + bmsg
@@ -0,0 +1,204 @@
+import asyncio
+import time
+from copy import deepcopy
+import numpy as np
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import concatenate, create_empty_array
+from unity_env import UnityEnv, UnityGameInstanceException
+from unity_protocol import encode_message
+from trainer_log import get_logger
+
+logger = get_logger('unity_vector_env')
+
+
+class UnityAsyncioVectorEnv(VectorEnv):
+    # Vectorized UnityEnv that drives every game connection from a single asyncio event loop in the calling
+    # process, instead of one worker process per game. Batch semantics and autoreset behaviour match
+    # gymnasium's SyncVectorEnv/AsyncVectorEnv; since the envs are used directly (not through their wrappers),
+    # the episode time limit is applied here through max_episode_steps. With copy=False, the returned observations
+    # are the batch buffer itself and are overwritten by the next step()/reset() call. If instance_pool is given,
+    # all envs lease their game instances from that shared UnityGameInstancePool, which is closed with this env.
+
+    def __init__(self, env_fns, max_episode_steps=None, copy=True, instance_pool=None, connect_interval=0.1):
+        self.envs = [env_fn() for env_fn in env_fns]
+        self._unity_envs = [env.unwrapped for env in self.envs]
+        for env in self._unity_envs:
+            if not isinstance(env, UnityEnv):
+                raise Exception('UnityAsyncioVectorEnv only supports UnityEnv environments')
+            if env.uses_pre_init():
+                raise Exception('pre_init is not supported by UnityAsyncioVectorEnv')
+        super().__init__(num_envs=len(self.envs),
+                         observation_space=self.envs[0].observation_space,
+                         action_space=self.envs[0].action_space)
+        self._max_episode_steps = max_episode_steps
+        self._copy = copy
+        self._instance_pool = instance_pool
+        self._connect_interval = connect_interval
+        self._loop = asyncio.new_event_loop()
+        self._pending_messages = [[] for _ in range(self.num_envs)]
+        self._elapsed_steps = np.zeros((self.num_envs,), dtype=np.int64)
+        self.observations = create_empty_array(self.single_observation_space, n=self.num_envs, fn=np.zeros)
+        self._rewards = np.zeros((self.num_envs,), dtype=np.float64)
+        self._terminateds = np.zeros((self.num_envs,), dtype=np.bool_)
+        self._truncateds = np.zeros((self.num_envs,), dtype=np.bool_)
+        self._actions = None
+
+    async def _wait_readable(self, sock):
+        fut = self._loop.create_future()
+        def on_readable():
+            if not fut.done():
+                fut.set_result(None)
+        self._loop.add_reader(sock.fileno(), on_readable)
+        try:
+            await fut
+        finally:
+            self._loop.remove_reader(sock.fileno())
+
+    async def _receive_message(self, index, game_inst):
+        pending = self._pending_messages[index]
+        while len(pending) == 0:
+            await self._wait_readable(game_inst.get_socket())
+            pending.extend(game_inst.receive_available())
+        return pending.pop(0)
+
+    async def _lease_game_instance(self, index):
+        env = self._unity_envs[index]
+        prev_inst = env.detach_game_instance()
+        if prev_inst is not None:
+            self._instance_pool.release(prev_inst)
+        self._pending_messages[index].clear()
+        lease_start = time.perf_counter()
+        game_inst = await self._loop.run_in_executor(None, self._instance_pool.lease, env.get_pool_lease_timeout())
+        env.attach_game_instance(game_inst)
+        return time.perf_counter() - lease_start
+
+    async def _start_game_instance(self, index):
+        env = self._unity_envs[index]
+        prev_inst = env.detach_game_instance()
+        if prev_inst is not None:
+            await self._loop.run_in_executor(None, prev_inst.close)
+        self._pending_messages[index].clear()
+        game_inst = env.new_game_instance(env.get_port(), blocking=False)
+        await self._loop.run_in_executor(None, game_inst.start)
+        while not game_inst.connect():
+            await asyncio.sleep(self._connect_interval)
+        await self._wait_initialized(index, game_inst)
+        env.attach_game_instance(game_inst)
+
+    async def _wait_initialized(self, index, game_inst):
+        while not game_inst.is_initialized():
+            await self._wait_readable(game_inst.get_socket())
+            self._pending_messages[index].extend(game_inst.receive_available())
+
+    async def _soft_reset(self, index):
+        env = self._unity_envs[index]
+        game_inst = env.get_game_instance()
+        self._pending_messages[index].clear()
+        try:
+            game_inst.soft_reset()
+            await self._wait_initialized(index, game_inst)
+        except (UnityGameInstanceException, OSError) as e:
+            logger.warning('soft reset failed, restarting game instance: %s', e)
+            return False
+        return True
+
+    async def _reset_env(self, index):
+        env = self._unity_envs[index]
+        with env.get_timings().stage('env/reset'):
+            observation, info = await self._reset_game(index)
+        return observation, env.get_timings().add_to_info(info)
+
+    async def _reset_game(self, index):
+        env = self._unity_envs[index]
+        if env.can_soft_reset(env.get_game_instance()) and await self._soft_reset(index):
+            self._elapsed_steps[index] = 0
+            return env.process_init_message()
+        if self._instance_pool is not None:
+            lease_time = await self._lease_game_instance(index)
+        else:
+            await self._start_game_instance(index)
+        self._elapsed_steps[index] = 0
+        observation, info = env.process_init_message()
+        if self._instance_pool is not None:
+            info = dict(info)
+            info['time_pool_lease'] = int(lease_time*1000)
+        return observation, info
+
+    async def _step_env(self, index, action):
+        env = self._unity_envs[index]
+        game_inst = env.get_game_instance()
+        with env.get_timings().stage('env/send_action'):
+            await self._loop.sock_sendall(game_inst.get_socket(), encode_message({'action': int(action)}))
+        with env.get_timings().stage('env/receive_state'):
+            msg = await self._receive_message(index, game_inst)
+        observation, reward, terminated, truncated, info = env.process_state_message(msg)
+        info = env.get_timings().add_to_info(info)
+        self._elapsed_steps[index] += 1
+        if self._max_episode_steps is not None and self._elapsed_steps[index] >= self._max_episode_steps:
+            truncated = True
+        if terminated or truncated:
+            final_observation = {key: np.array(value) for key, value in observation.items()}
+            final_info = info
+            observation, info = await self._reset_env(index)
+            info = dict(info)
+            info['final_observation'] = final_observation
+            info['final_info'] = final_info
+        return observation, reward, terminated, truncated, info
+
+    async def _gather(self, coros):
+        # runs the coroutines of all envs concurrently; if one of them fails, the others are cancelled and awaited
+        # before the first error is raised, so that no task is left pending on the loop
+        tasks = [self._loop.create_task(coro) for coro in coros]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        return [task.result() for task in tasks]
+
+    def _run(self, coros):
+        try:
+            return self._loop.run_until_complete(self._gather(coros))
+        except (OSError, EOFError) as e:
+            raise UnityGameInstanceException('IO failure in vector environment: {}'.format(e))
+
+    def reset_wait(self, seed=None, options=None):
+        results = self._run([self._reset_env(i) for i in range(self.num_envs)])
+        infos = {}
+        observations = []
+        for i, (observation, info) in enumerate(results):
+            observations.append(observation)
+            infos = self._add_info(infos, info, i)
+        self.observations = concatenate(self.single_observation_space, observations, self.observations)
+        return deepcopy(self.observations) if self._copy else self.observations, infos
+
+    def step_async(self, actions):
+        self._actions = actions
+
+    def step_wait(self):
+        results = self._run([self._step_env(i, action) for i, action in enumerate(self._actions)])
+        infos = {}
+        observations = []
+        for i, (observation, reward, terminated, truncated, info) in enumerate(results):
+            observations.append(observation)
+            self._rewards[i] = reward
+            self._terminateds[i] = terminated
+            self._truncateds[i] = truncated
+            infos = self._add_info(infos, info, i)
+        self.observations = concatenate(self.single_observation_space, observations, self.observations)
+        observations = deepcopy(self.observations) if self._copy else self.observations
+        return observations, np.copy(self._rewards), np.copy(self._terminateds), np.copy(self._truncateds), infos
+
+    def close_extras(self, **kwargs):
+        for env in self._unity_envs:
+            game_inst = env.detach_game_instance() if self._instance_pool is not None else None
+            if game_inst is not None:
+                self._instance_pool.release(game_inst)
+        for env in self.envs:
+            env.close()
+        if self._instance_pool is not None:
+            self._instance_pool.close()
+        self._loop.close()